@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pico de memória da decodificação do corpo da requisição (data URL base64 -> array RGB)
+Compara o caminho antigo dos servidores (split + b64decode + BytesIO + convert + np.array)
+com src/backend/image_io.py. Cada medida roda num processo novo: o texto base64 é montado
+antes da medição e o pico de RSS é zerado (Linux) logo antes de decodificar.
+
+Uso:
+    python benchmarks/bench_decode.py [--sizes 12,24,48] [--formats png,jpeg] [--preview 512]
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "src", "backend"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "src", "main", "modules", "upscayl", "scripts"))
+sys.path.insert(0, BENCH_DIR)
+
+MB = 1024 * 1024
+
+
+def legacy_decode(base64_str, max_side=None):
+    """Caminho anterior de sam_server.decode_base64_image (a prévia reduzia depois de decodificar)"""
+    import io
+    import numpy as np
+    from PIL import Image
+    if "base64," in base64_str:
+        base64_str = base64_str.split("base64,")[1]
+    image_bytes = base64.b64decode(base64_str)
+    image = Image.open(io.BytesIO(image_bytes))
+    array = np.array(image.convert("RGB"))
+    if max_side:
+        preview = Image.fromarray(array)
+        preview.thumbnail((max_side, max_side), Image.BILINEAR)
+        array = np.array(preview)
+    return array
+
+
+def copy_free_decode(base64_str, max_side=None):
+    from PIL import Image
+    from image_io import decode_rgb_array, ensure_rgb, image_array, open_image, decode_base64_payload
+    if not max_side:
+        return decode_rgb_array(base64_str)
+    image = ensure_rgb(open_image(decode_base64_payload(base64_str), max_side))
+    image.thumbnail((max_side, max_side), Image.BILINEAR)
+    return image_array(image)
+
+
+METHODS = {"legacy": legacy_decode, "copy-free": copy_free_decode}
+
+
+def child(method, path, max_side):
+    """Executado no processo filho: mede só a decodificação"""
+    import numpy as np  # noqa: F401 (importado antes da medição)
+    from PIL import Image  # noqa: F401
+    import image_io  # noqa: F401
+    from memory_profile import current_rss, peak_rss, reset_peak_rss
+
+    mime = "image/jpeg" if path.lower().endswith((".jpg", ".jpeg")) else "image/png"
+    with open(path, "rb") as f:
+        data_url = f"data:{mime};base64," + base64.b64encode(f.read()).decode("ascii")
+
+    baseline = current_rss()
+    reset_peak_rss()
+    start = time.perf_counter()
+    array = METHODS[method](data_url, max_side)
+    elapsed = time.perf_counter() - start
+    peak = peak_rss()
+    print(json.dumps({
+        "method": method,
+        "ms": round(elapsed * 1000, 1),
+        "extra_peak_mb": round((peak - baseline) / MB, 1),
+        "payload_mb": round(len(data_url) / MB, 1),
+        "shape": list(array.shape),
+        "checksum": int(array[::97, ::89].astype("int64").sum()),
+    }))
+
+
+def prepare(images_dir, mp, fmt):
+    from PIL import Image
+    from synthetic import ensure_image
+    png_path = ensure_image(images_dir, mp)
+    if fmt == "png":
+        return png_path
+    jpeg_path = os.path.splitext(png_path)[0] + ".jpg"
+    if not os.path.exists(jpeg_path):
+        Image.open(png_path).save(jpeg_path, "JPEG", quality=92)
+    return jpeg_path
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["_child"]:
+        child(argv[1], argv[2], int(argv[3]) or None)
+        return
+
+    parser = argparse.ArgumentParser(description="Pico de memória da decodificação base64 -> RGB")
+    parser.add_argument("--sizes", default="12,24,48")
+    parser.add_argument("--formats", default="png,jpeg")
+    parser.add_argument("--preview", type=int, default=0, help="lado máximo (simula a prévia/modelo que reduz)")
+    parser.add_argument("--images-dir", default=os.path.join(ROOT_DIR, "bench_results", "images"))
+    args = parser.parse_args(argv)
+
+    print(f"{'imagem':<22}{'base64 MB':>10}{'método':>11}{'ms':>9}{'pico extra MB':>15}")
+    for mp in [float(v) for v in args.sizes.split(",") if v.strip()]:
+        for fmt in args.formats.split(","):
+            path = prepare(args.images_dir, mp, fmt)
+            checksums = set()
+            rows = {}
+            for method in METHODS:
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "_child", method, path, str(args.preview)],
+                    capture_output=True, text=True, check=True
+                ).stdout
+                rows[method] = json.loads(output.strip().splitlines()[-1])
+                checksums.add(rows[method]["checksum"])
+            for method, row in rows.items():
+                print(f"{os.path.basename(path):<22}{row['payload_mb']:>10}{method:>11}{row['ms']:>9}"
+                      f"{row['extra_peak_mb']:>15}")
+            before, after = rows["legacy"]["extra_peak_mb"], rows["copy-free"]["extra_peak_mb"]
+            same = "pixels idênticos" if len(checksums) == 1 else "pixels diferem (draft JPEG)"
+            print(f"{'':<22}redução do pico: {before - after:.1f} MB ({(1 - after / before) * 100:.0f}%), {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tempo e tamanho da gravação do resultado RGBA em cada perfil de saída (image_encode.py)
+A imagem é o primeiro plano sintético (arte DTF com transparência) de benchmarks/synthetic.py.
+"pil-optimize" é a gravação antiga dos scripts (PNG optimize=True). Cada arquivo gravado é
+relido e comparado pixel a pixel com a origem.
+
+Uso:
+    python benchmarks/bench_encode.py [--sizes 4,12,48] [--profiles fast-png,balanced-png,png] [--repeat 1]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "src", "main", "modules", "upscayl", "scripts"))
+sys.path.insert(0, BENCH_DIR)
+
+from image_encode import PROFILES, output_path_for, save_image  # noqa: E402
+from synthetic import render_foreground, size_for_megapixels  # noqa: E402
+
+MB = 1024 * 1024
+BASELINE = "pil-optimize"
+
+
+def encode(image, name, directory):
+    """Grava e devolve (ms, caminho, perfil usado)"""
+    if name == BASELINE:
+        path = os.path.join(directory, "baseline.png")
+        start = time.perf_counter()
+        image.save(path, "PNG", optimize=True)
+        return (time.perf_counter() - start) * 1000, path, name
+    path = output_path_for(os.path.join(directory, f"{name}.png"), name)
+    start = time.perf_counter()
+    used = save_image(image, path, name)
+    return (time.perf_counter() - start) * 1000, path, used
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tempo/tamanho da gravação por perfil de saída")
+    parser.add_argument("--sizes", default="4,12,48", help="megapixels, separados por vírgula")
+    parser.add_argument("--profiles", default=",".join([BASELINE, *PROFILES]))
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args(argv)
+    names = [n.strip() for n in args.profiles.split(",") if n.strip()]
+    unknown = [n for n in names if n != BASELINE and n not in PROFILES]
+    if unknown:
+        parser.error(f"perfis desconhecidos: {', '.join(unknown)}")
+
+    print(f"{'imagem':<16}{'perfil':<16}{'ms':>10}{'MB':>9}{'razão':>8}{'vs antigo':>11}  pixels")
+    with tempfile.TemporaryDirectory(prefix="bench_encode_") as directory:
+        for mp in [float(v) for v in args.sizes.split(",") if v.strip()]:
+            width, height = size_for_megapixels(mp)
+            image = render_foreground(width, height, args.seed)
+            source = np.asarray(image)
+            raw_mb = source.nbytes / MB
+            baseline_ms = None
+            for name in names:
+                times = []
+                for _ in range(max(1, args.repeat)):
+                    ms, path, used = encode(image, name, directory)
+                    times.append(ms)
+                ms = min(times)
+                if name == BASELINE:
+                    baseline_ms = ms
+                size_mb = os.path.getsize(path) / MB
+                with Image.open(path) as reread:
+                    same = np.array_equal(np.asarray(reread.convert("RGBA")), source)
+                speedup = f"{baseline_ms / ms:.1f}x" if baseline_ms and name != BASELINE else "-"
+                label = name if used == name else f"{name}->{used}"
+                print(f"{f'{width}x{height}':<16}{label:<16}{ms:>10.0f}{size_mb:>9.1f}"
+                      f"{raw_mb / size_mb:>8.1f}{speedup:>11}  {'idênticos' if same else 'DIFEREM'}")
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
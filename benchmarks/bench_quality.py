@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Harness de qualidade x latência dos removedores de fundo
+Renderiza as imagens sintéticas com alpha de referência conhecido (synthetic.py), roda cada
+motor/modo pelo mesmo caminho do bench_removers.py e mede, contra a referência:
+    iou         IoU das máscaras binarizadas (alpha >= 128)
+    boundary_f  F-score de borda: contornos que coincidem dentro de uma tolerância em pixels
+    sad         soma das diferenças absolutas de alpha (em milhares, alpha normalizado 0..1)
+junto com a latência (wall_s, cpu_s, peak_rss_mb). Uma otimização que ganha tempo às custas
+da borda aparece no `compare` como trade-off, não passa despercebida.
+
+Roda sem rede: motores sem pesos em disco são ignorados e os motores stub (sem modelo)
+sempre rodam, então o harness produz números em qualquer máquina.
+
+Uso:
+    python benchmarks/bench_quality.py run [--engines ...] [--sizes 1,4] [--repeat 1] [--out bench_results]
+    python benchmarks/bench_quality.py compare antes.json depois.json [--fail-on-regression]
+    python benchmarks/bench_quality.py score <saida.png> <referencia.alpha.png>
+"""
+
+import os
+import sys
+import csv
+import json
+import argparse
+import platform
+from datetime import datetime, timezone
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic import DEFAULT_SEED, ensure_image, size_for_megapixels
+from bench_removers import (DEFAULT_OUT_DIR, ENGINES, ROOT_DIR, aggregate, engine_available, git_commit,
+                            run_one)
+
+QUALITY_METRICS = ("iou", "boundary_f", "sad")
+LATENCY_METRICS = ("wall_s", "cpu_s", "peak_rss_mb")
+DEFAULT_SIZES = "1,4"
+# Tolerância da borda: fração da diagonal (≈4 px em 1 MP, ≈28 px em 48 MP)
+BOUNDARY_TOLERANCE = 0.002
+
+# Limites do compare: abaixo disso é ruído de arredondamento/interpolação
+MAX_IOU_DROP = 0.002
+MAX_BOUNDARY_DROP = 0.005
+MAX_SAD_INCREASE = 0.02  # relativo
+
+
+def load_alpha(path, size=None):
+    """Canal alpha uint8 de um PNG (RGBA, LA ou L); redimensionado para `size` se diferente"""
+    image = Image.open(path)
+    if image.mode in ("RGBA", "LA", "PA"):
+        alpha = image.getchannel("A")
+    elif image.mode == "L":
+        alpha = image
+    else:
+        # Saída sem transparência: nada foi removido
+        alpha = Image.new("L", image.size, 255)
+    if size is not None and alpha.size != size:
+        alpha = alpha.resize(size, Image.BILINEAR)
+    return np.asarray(alpha)
+
+
+def binary_iou(pred, truth, threshold=128):
+    pred_fg = pred >= threshold
+    truth_fg = truth >= threshold
+    union = np.count_nonzero(pred_fg | truth_fg)
+    if union == 0:
+        return 1.0
+    return np.count_nonzero(pred_fg & truth_fg) / union
+
+
+def _boundary(mask):
+    """Pixels do primeiro plano com algum vizinho (4-conectado) de fundo"""
+    interior = mask.copy()
+    interior[1:, :] &= mask[:-1, :]
+    interior[:-1, :] &= mask[1:, :]
+    interior[:, 1:] &= mask[:, :-1]
+    interior[:, :-1] &= mask[:, 1:]
+    return mask & ~interior
+
+
+def _dilate(mask, radius):
+    try:
+        import cv2
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * radius + 1, 2 * radius + 1))
+        return cv2.dilate(mask.view(np.uint8), kernel).astype(bool)
+    except ImportError:
+        # Sem OpenCV: quadrado separável (um pouco mais tolerante que o disco)
+        out = mask.copy()
+        for axis in (0, 1):
+            grown = out.copy()
+            for shift in range(1, radius + 1):
+                if axis == 0:
+                    grown[shift:, :] |= out[:-shift, :]
+                    grown[:-shift, :] |= out[shift:, :]
+                else:
+                    grown[:, shift:] |= out[:, :-shift]
+                    grown[:, :-shift] |= out[:, shift:]
+            out = grown
+        return out
+
+
+def boundary_fscore(pred, truth, threshold=128, tolerance=BOUNDARY_TOLERANCE):
+    """F-score de contorno (estilo DAVIS): precisão e revocação com tolerância de `tolerance` x diagonal"""
+    radius = max(1, int(round(tolerance * float(np.hypot(*truth.shape)))))
+    pred_edge = _boundary(pred >= threshold)
+    truth_edge = _boundary(truth >= threshold)
+    pred_count = np.count_nonzero(pred_edge)
+    truth_count = np.count_nonzero(truth_edge)
+    if pred_count == 0 and truth_count == 0:
+        return 1.0
+    if pred_count == 0 or truth_count == 0:
+        return 0.0
+    precision = np.count_nonzero(pred_edge & _dilate(truth_edge, radius)) / pred_count
+    recall = np.count_nonzero(truth_edge & _dilate(pred_edge, radius)) / truth_count
+    if precision + recall == 0:
+        return 0.0
+    return 2 * precision * recall / (precision + recall)
+
+
+def sad(pred, truth):
+    """Soma das diferenças absolutas em milhares (convenção dos benchmarks de matting)"""
+    total = 0
+    # Por blocos de linhas para não criar um int32 do tamanho da folha inteira
+    for start in range(0, truth.shape[0], 1024):
+        a = pred[start:start + 1024].astype(np.int16)
+        b = truth[start:start + 1024].astype(np.int16)
+        total += int(np.abs(a - b).sum(dtype=np.int64))
+    return total / 255.0 / 1000.0
+
+
+def score(output_path, truth_path):
+    truth = load_alpha(truth_path)
+    pred = load_alpha(output_path, size=(truth.shape[1], truth.shape[0]))
+    return {
+        "iou": round(binary_iou(pred, truth), 5),
+        "boundary_f": round(boundary_fscore(pred, truth), 5),
+        "sad": round(sad(pred, truth), 3),
+    }
+
+
+def write_report(report, out_dir):
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    name = f"quality_{report['meta']['commit'] or 'nocommit'}_{stamp}"
+    json_path = os.path.join(out_dir, name + ".json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    csv_path = os.path.join(out_dir, name + ".csv")
+    fields = ["engine", "megapixels", *QUALITY_METRICS, *LATENCY_METRICS, "status"]
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(report["summary"])
+        for skipped in report["skipped"]:
+            writer.writerow({"engine": skipped["engine"], "status": "skipped"})
+    return json_path, csv_path
+
+
+def _fmt(value, digits=3):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def cmd_run(args):
+    engines = [e.strip() for e in args.engines.split(",")] if args.engines else list(ENGINES)
+    unknown = [e for e in engines if e not in ENGINES]
+    if unknown:
+        print(f"ERROR:Motores desconhecidos: {', '.join(unknown)} (disponíveis: {', '.join(ENGINES)})",
+              file=sys.stderr)
+        sys.exit(2)
+
+    work_dir = os.path.join(args.out, "quality_runs")
+    os.makedirs(work_dir, exist_ok=True)
+    sizes = [float(v) for v in args.sizes.split(",") if v.strip()]
+
+    results, skipped = [], []
+    for engine in engines:
+        reason = engine_available(engine, args.python, args.cwd, offline=not args.online)
+        if reason:
+            print(f"[Quality] {engine}: ignorado ({reason})", file=sys.stderr)
+            skipped.append({"engine": engine, "reason": reason})
+            continue
+        for mp in sizes:
+            image_path, truth_path = ensure_image(args.images_dir, mp, args.seed, with_truth=True)
+            for index in range(args.repeat):
+                result = run_one(engine, mp, image_path, work_dir, index, args.python, args.timeout,
+                                 args.cwd, offline=not args.online)
+                if result["status"] == "ok":
+                    result.update(score(result["output"], truth_path))
+                print(f"[Quality] {engine} {mp:g} MP: {result['status']} {result['wall_s']:.1f}s "
+                      f"IoU {_fmt(result.get('iou'))} F {_fmt(result.get('boundary_f'))} "
+                      f"SAD {_fmt(result.get('sad'), 1)}", file=sys.stderr)
+                results.append(result)
+
+    # Latência: mediana das repetições; qualidade: saída é determinística, vale a primeira execução ok
+    summary = aggregate(results)
+    for row in summary:
+        first_ok = next((r for r in results if r["engine"] == row["engine"]
+                         and r["megapixels"] == row["megapixels"] and r["status"] == "ok"), None)
+        for metric in QUALITY_METRICS:
+            row[metric] = first_ok.get(metric) if first_ok else None
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "sizes": {f"{mp:g}": size_for_megapixels(mp) for mp in sizes},
+            "boundary_tolerance": BOUNDARY_TOLERANCE,
+            "engines": {name: ENGINES[name][2] for name in engines},
+        },
+        "summary": summary,
+        "results": results,
+        "skipped": skipped,
+    }
+    json_path, csv_path = write_report(report, args.out)
+
+    print(f"{'motor':<16}{'MP':>5}{'IoU':>8}{'borda F':>9}{'SAD k':>9}{'wall s':>9}{'pico MB':>9}")
+    for row in summary:
+        print(f"{row['engine']:<16}{row['megapixels']:>5g}{_fmt(row['iou']):>8}{_fmt(row['boundary_f']):>9}"
+              f"{_fmt(row['sad'], 1):>9}{_fmt(row['wall_s'], 1):>9}{_fmt(row['peak_rss_mb'], 0):>9}")
+    print(f"Relatório: {json_path}")
+    print(f"CSV: {csv_path}")
+
+
+def classify(before, after):
+    """'ganho', 'trade-off' (mais rápido, pior), 'regressão' (pior sem ganho) ou 'igual'"""
+    worse = []
+    if before["iou"] is not None and after["iou"] is not None and before["iou"] - after["iou"] > MAX_IOU_DROP:
+        worse.append("iou")
+    if (before["boundary_f"] is not None and after["boundary_f"] is not None
+            and before["boundary_f"] - after["boundary_f"] > MAX_BOUNDARY_DROP):
+        worse.append("boundary_f")
+    if before["sad"] and after["sad"] is not None and (after["sad"] - before["sad"]) / before["sad"] > MAX_SAD_INCREASE:
+        worse.append("sad")
+    faster = bool(before["wall_s"] and after["wall_s"] and after["wall_s"] < before["wall_s"] * 0.95)
+    if worse:
+        return ("trade-off" if faster else "regressão"), worse
+    return ("ganho" if faster else "igual"), worse
+
+
+def cmd_compare(args):
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    old = {(row["engine"], row["megapixels"]): row for row in before["summary"]}
+    print(f"antes: {before['meta'].get('commit')}  depois: {after['meta'].get('commit')}")
+    print(f"{'motor':<16}{'MP':>5}{'wall':>9}{'ΔIoU':>9}{'Δborda F':>10}{'ΔSAD k':>9}  veredito")
+    failed = False
+    for row in after["summary"]:
+        reference = old.get((row["engine"], row["megapixels"]))
+        if reference is None or row.get("iou") is None or reference.get("iou") is None:
+            continue
+        verdict, worse = classify(reference, row)
+        failed = failed or verdict in ("trade-off", "regressão")
+        speed = f"{row['wall_s'] / reference['wall_s']:.2f}x" if reference["wall_s"] and row["wall_s"] else "-"
+        print(f"{row['engine']:<16}{row['megapixels']:>5g}{speed:>9}"
+              f"{row['iou'] - reference['iou']:>+9.4f}{row['boundary_f'] - reference['boundary_f']:>+10.4f}"
+              f"{row['sad'] - reference['sad']:>+9.2f}  {verdict}{' (' + ', '.join(worse) + ')' if worse else ''}")
+    if failed and args.fail_on_regression:
+        sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Qualidade x latência dos removedores de fundo")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="roda os motores e mede qualidade contra o alpha de referência")
+    run.add_argument("--engines", help=f"lista separada por vírgula ({', '.join(ENGINES)})")
+    run.add_argument("--sizes", default=DEFAULT_SIZES, help="megapixels")
+    run.add_argument("--repeat", type=int, default=1)
+    run.add_argument("--timeout", type=float, default=1800)
+    run.add_argument("--python", default=sys.executable)
+    run.add_argument("--cwd", default=ROOT_DIR, help="diretório de trabalho dos motores (onde ficam os pesos)")
+    run.add_argument("--online", action="store_true", help="permite que os motores baixem pesos ausentes")
+    run.add_argument("--out", default=DEFAULT_OUT_DIR)
+    run.add_argument("--images-dir", default=None)
+    run.add_argument("--seed", type=int, default=DEFAULT_SEED)
+
+    compare = sub.add_parser("compare", help="compara dois relatórios e aponta trade-offs")
+    compare.add_argument("before")
+    compare.add_argument("after")
+    compare.add_argument("--fail-on-regression", action="store_true",
+                         help="sai com código 1 se alguma qualidade piorou além da tolerância")
+
+    single = sub.add_parser("score", help="mede uma saída contra um alpha de referência")
+    single.add_argument("output")
+    single.add_argument("truth")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        args.images_dir = args.images_dir or os.path.join(args.out, "images")
+        cmd_run(args)
+    elif args.command == "compare":
+        cmd_compare(args)
+    else:
+        print(json.dumps(score(args.output, args.truth)))
+
+
+if __name__ == "__main__":
+    main()
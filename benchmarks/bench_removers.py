@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark dos motores de remoção de fundo com imagens sintéticas tipo DTF
+Cada execução roda o motor pelo seu ponto de entrada real (script de linha de comando ou
+módulo do servidor) num processo separado e mede:
+    wall_s        tempo de parede do processo (inclui imports e carregamento do modelo)
+    cpu_s         tempo de CPU (usuário + sistema) do processo filho
+    peak_rss_mb   pico de memória residente do processo filho
+    output_bytes  tamanho do PNG gerado
+    stages        ms por etapa (eventos de cli_events, quando o motor os emite)
+
+O relatório (JSON + CSV) leva o commit do git e pode ser comparado entre commits.
+
+Uso:
+    python benchmarks/bench_removers.py run [--engines rembg-isnet,sam-auto] [--sizes 1,4,12]
+                                             [--repeat 3] [--timeout 1800] [--offline] [--out bench_results]
+    python benchmarks/bench_removers.py images [--sizes 1,4,12,24,48]
+    python benchmarks/bench_removers.py compare antes.json depois.json
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import threading
+from datetime import datetime, timezone
+from importlib.util import find_spec
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+SCRIPTS_DIR = os.path.join(ROOT_DIR, "src", "main", "modules", "upscayl", "scripts")
+BACKEND_DIR = os.path.join(ROOT_DIR, "src", "backend")
+
+sys.path.insert(0, BENCH_DIR)
+from synthetic import DEFAULT_SEED, DEFAULT_SIZES_MP, ensure_image, size_for_megapixels
+
+DEFAULT_OUT_DIR = os.path.join(ROOT_DIR, "bench_results")
+METRICS = ("wall_s", "cpu_s", "peak_rss_mb", "output_bytes")
+
+
+def _script(name, *args):
+    return lambda input_path, output_path: [os.path.join(SCRIPTS_DIR, name), input_path, output_path, *args]
+
+
+def _birefnet(input_path, output_path):
+    return [os.path.abspath(__file__), "_birefnet", input_path, output_path]
+
+
+def _stub(*args):
+    return lambda input_path, output_path: [os.path.join(BENCH_DIR, "stub_remover.py"), input_path, output_path, *args]
+
+
+# nome -> (comando, módulo Python exigido, descrição)
+ENGINES = {
+    "rembg-isnet": (_script("background_remover.py"), "rembg", "rembg isnet-general-use"),
+    "rembg-u2net": (_script("background_remover_highprecision.py"), "rembg", "rembg u2net + alpha matting"),
+    "inspyrenet-base": (_script("background_remover_inspyrenet.py", "base"), "transparent_background",
+                        "InSPyReNet SwinB"),
+    "inspyrenet-fast": (_script("background_remover_inspyrenet.py", "fast"), "transparent_background",
+                        "InSPyReNet Res2Net50"),
+    "sam-auto": (_script("background_remover_sam.py", "false", "30", "center"), "segment_anything",
+                 "SAM automático (ponto central)"),
+    "birefnet": (_birefnet, "transformers", "BiRefNet 1024 (tester_server.process_image)"),
+    # Sem modelo: rodam offline em qualquer máquina (referência e teste do próprio benchmark)
+    "stub-key": (_stub("1.0"), "numpy", "stub: chave de cor, resolução cheia"),
+    "stub-key-fast": (_stub("0.25"), "numpy", "stub: chave de cor a 1/4 da resolução"),
+}
+
+
+def _home(*parts):
+    return os.path.join(os.path.expanduser("~"), *parts)
+
+
+def _rembg_weights(model):
+    return lambda cwd: os.path.join(os.environ.get("U2NET_HOME") or _home(".u2net"), f"{model}.onnx")
+
+
+def _hf_weights(repo_id):
+    def path(cwd):
+        hub = os.environ.get("HF_HUB_CACHE") or os.path.join(
+            os.environ.get("HF_HOME") or _home(".cache", "huggingface"), "hub")
+        return os.path.join(hub, "models--" + repo_id.replace("/", "--"))
+    return path
+
+
+# motor -> caminho dos pesos (função do diretório de trabalho); sem entrada = não precisa de pesos
+WEIGHTS = {
+    "rembg-isnet": _rembg_weights("isnet-general-use"),
+    "rembg-u2net": _rembg_weights("u2net"),
+    "inspyrenet-base": lambda cwd: _home(".transparent-background", "ckpt_base.pth"),
+    "inspyrenet-fast": lambda cwd: _home(".transparent-background", "ckpt_fast.pth"),
+    "sam-auto": lambda cwd: os.path.join(cwd, "sam_vit_b_01ec64.pth"),
+    "birefnet": _hf_weights("ZhengPeng7/BiRefNet"),
+}
+
+
+def engine_available(name, python=None, cwd=ROOT_DIR, offline=False):
+    """
+    Motivo de indisponibilidade (str) ou None se o motor pode rodar
+    offline=True também exige os pesos já em disco (sem rede os scripts não conseguem baixá-los)
+    """
+    module = ENGINES[name][1]
+    if python is None or os.path.abspath(python) == os.path.abspath(sys.executable):
+        if find_spec(module) is None:
+            return f"módulo '{module}' não instalado"
+    else:
+        check = subprocess.run([python, "-c", f"import importlib.util as u; raise SystemExit(u.find_spec('{module}') is None)"],
+                               capture_output=True)
+        if check.returncode != 0:
+            return f"módulo '{module}' não instalado em {python}"
+    if offline and name in WEIGHTS:
+        weights = WEIGHTS[name](cwd)
+        if not os.path.exists(weights):
+            return f"pesos ausentes ({weights})"
+    return None
+
+
+def offline_env():
+    """Variáveis que impedem downloads (Hugging Face / transformers) durante as medições"""
+    return {"HF_HUB_OFFLINE": "1", "TRANSFORMERS_OFFLINE": "1"}
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                                capture_output=True, text=True, timeout=10).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT_DIR,
+                               capture_output=True, text=True, timeout=30).stdout.strip()
+        return f"{commit}-dirty" if commit and dirty else commit or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _read_summary(events_file):
+    """Último evento 'summary' gravado pelo script (cli_events), ou None"""
+    summary = None
+    try:
+        with open(events_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if event.get("event") == "summary":
+                    summary = event
+    except OSError:
+        pass
+    return summary
+
+
+def _tail(path, lines=5):
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            return "".join(f.readlines()[-lines:]).strip()
+    except OSError:
+        return ""
+
+
+def measure(cmd, env, cwd, log_prefix, timeout):
+    """
+    Executa o comando e devolve (returncode, wall_s, cpu_s, peak_rss_bytes, timed_out)
+    Unix: os.wait4 dá CPU e pico de RSS exatos do filho. Windows: amostragem com psutil.
+    """
+    stdout = open(log_prefix + ".out", "w", encoding="utf-8")
+    stderr = open(log_prefix + ".err", "w", encoding="utf-8")
+    start = time.perf_counter()
+    timed_out = threading.Event()
+    try:
+        proc = subprocess.Popen(cmd, env=env, cwd=cwd, stdout=stdout, stderr=stderr)
+
+        def kill():
+            timed_out.set()
+            proc.kill()
+
+        timer = threading.Timer(timeout, kill) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            if hasattr(os, "wait4"):
+                _, status, usage = os.wait4(proc.pid, 0)
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                wall = time.perf_counter() - start
+                cpu = usage.ru_utime + usage.ru_stime
+                # Linux reporta em KB, macOS em bytes
+                peak = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+                return proc.returncode, wall, cpu, peak, timed_out.is_set()
+
+            peak, cpu = None, None
+            handle = psutil.Process(proc.pid) if psutil is not None else None
+            while proc.poll() is None:
+                if handle is not None:
+                    try:
+                        info = handle.memory_info()
+                        peak = max(peak or 0, getattr(info, "peak_wset", None) or info.rss)
+                        times = handle.cpu_times()
+                        cpu = times.user + times.system
+                    except psutil.Error:
+                        pass
+                time.sleep(0.05)
+            return proc.returncode, time.perf_counter() - start, cpu, peak, timed_out.is_set()
+        finally:
+            if timer:
+                timer.cancel()
+    finally:
+        stdout.close()
+        stderr.close()
+
+
+def run_one(engine, mp, image_path, work_dir, run_index, python, timeout, cwd=ROOT_DIR, offline=False):
+    command, _, _ = ENGINES[engine]
+    tag = f"{engine}_{mp:g}mp_r{run_index}"
+    output_path = os.path.join(work_dir, tag + ".png")
+    events_file = os.path.join(work_dir, tag + ".events.jsonl")
+    for path in (output_path, events_file):
+        if os.path.exists(path):
+            os.remove(path)
+
+    env = dict(os.environ)
+    # Mede o processamento de verdade: sem cache de resultado nem de embeddings do SAM
+    env.update({
+        "IMPRIME_RESULT_CACHE": "0",
+        "IMPRIME_SAM_CACHE": "0",
+        "IMPRIME_EVENTS_FILE": events_file,
+        "PYTHONIOENCODING": "utf-8",
+    })
+    if offline:
+        env.update(offline_env())
+    returncode, wall, cpu, peak, timed_out = measure(
+        [python, *command(image_path, output_path)], env, cwd,
+        os.path.join(work_dir, tag), timeout
+    )
+
+    ok = returncode == 0 and os.path.exists(output_path)
+    summary = _read_summary(events_file) or {}
+    result = {
+        "engine": engine,
+        "megapixels": mp,
+        "run": run_index,
+        "status": "ok" if ok else ("timeout" if timed_out else "error"),
+        "wall_s": round(wall, 3),
+        "cpu_s": round(cpu, 3) if cpu is not None else None,
+        "peak_rss_mb": round(peak / (1024 * 1024), 1) if peak else None,
+        "input_bytes": os.path.getsize(image_path),
+        "output_bytes": os.path.getsize(output_path) if ok else None,
+        "output": output_path if ok else None,
+        "stages": {name: stage.get("ms") for name, stage in (summary.get("stages") or {}).items()},
+    }
+    if not ok:
+        result["error"] = summary.get("error") or _tail(os.path.join(work_dir, tag + ".err"))
+    return result
+
+
+def aggregate(results):
+    """Mediana por (motor, MP) das execuções bem-sucedidas"""
+    groups = {}
+    for result in results:
+        groups.setdefault((result["engine"], result["megapixels"]), []).append(result)
+    rows = []
+    for (engine, mp), runs in sorted(groups.items()):
+        ok_runs = [run for run in runs if run["status"] == "ok"]
+        row = {"engine": engine, "megapixels": mp, "runs": len(runs), "ok": len(ok_runs)}
+        for metric in METRICS:
+            values = [run[metric] for run in ok_runs if run.get(metric) is not None]
+            row[metric] = round(statistics.median(values), 3) if values else None
+        if not ok_runs:
+            row["status"] = runs[-1]["status"]
+        rows.append(row)
+    return rows
+
+
+def write_report(report, out_dir):
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    name = f"bench_{report['meta']['commit'] or 'nocommit'}_{stamp}"
+    json_path = os.path.join(out_dir, name + ".json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    csv_path = os.path.join(out_dir, name + ".csv")
+    fields = ["engine", "megapixels", "runs", "ok", *METRICS, "status"]
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(report["summary"])
+        for skipped in report["skipped"]:
+            writer.writerow({"engine": skipped["engine"], "status": "skipped"})
+    return json_path, csv_path
+
+
+def print_table(rows):
+    print(f"{'motor':<16}{'MP':>5}{'wall s':>10}{'cpu s':>10}{'pico MB':>10}{'saída KB':>11}")
+    for row in rows:
+        def fmt(value, scale=1.0):
+            return "-" if value is None else f"{value / scale:.1f}"
+        print(f"{row['engine']:<16}{row['megapixels']:>5g}{fmt(row['wall_s']):>10}{fmt(row['cpu_s']):>10}"
+              f"{fmt(row['peak_rss_mb']):>10}{fmt(row['output_bytes'], 1024):>11}")
+
+
+def _parse_sizes(value):
+    return [float(v) for v in value.split(",") if v.strip()]
+
+
+def cmd_images(args):
+    for mp in _parse_sizes(args.sizes):
+        path = ensure_image(args.images_dir, mp, args.seed, with_truth=True)[0]
+        print(path)
+
+
+def cmd_run(args):
+    engines = [e.strip() for e in args.engines.split(",")] if args.engines else list(ENGINES)
+    unknown = [e for e in engines if e not in ENGINES]
+    if unknown:
+        print(f"ERROR:Motores desconhecidos: {', '.join(unknown)} (disponíveis: {', '.join(ENGINES)})",
+              file=sys.stderr)
+        sys.exit(2)
+
+    work_dir = os.path.join(args.out, "runs")
+    os.makedirs(work_dir, exist_ok=True)
+    images_dir = args.images_dir
+    sizes = _parse_sizes(args.sizes)
+
+    results, skipped = [], []
+    for engine in engines:
+        reason = engine_available(engine, args.python, args.cwd, args.offline)
+        if reason:
+            print(f"[Bench] {engine}: ignorado ({reason})", file=sys.stderr)
+            skipped.append({"engine": engine, "reason": reason})
+            continue
+        for mp in sizes:
+            image_path = ensure_image(images_dir, mp, args.seed)
+            # Execução de aquecimento opcional: cache do SO / download de pesos fora da medição
+            for index in range(-args.warmup, args.repeat):
+                result = run_one(engine, mp, image_path, work_dir, index, args.python, args.timeout,
+                                  args.cwd, args.offline)
+                label = "aquecimento" if index < 0 else f"execução {index + 1}/{args.repeat}"
+                print(f"[Bench] {engine} {mp:g} MP {label}: {result['status']} "
+                      f"{result['wall_s']:.1f}s, pico {result['peak_rss_mb']} MB", file=sys.stderr)
+                if index >= 0:
+                    results.append(result)
+
+    width_height = {f"{mp:g}": size_for_megapixels(mp) for mp in sizes}
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "sizes": width_height,
+            "engines": {name: ENGINES[name][2] for name in engines},
+        },
+        "summary": aggregate(results),
+        "results": results,
+        "skipped": skipped,
+    }
+    json_path, csv_path = write_report(report, args.out)
+    print_table(report["summary"])
+    print(f"Relatório: {json_path}")
+    print(f"CSV: {csv_path}")
+
+
+def cmd_compare(args):
+    """Razão depois/antes das medianas, por motor e tamanho (>1 = pior)"""
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    old = {(row["engine"], row["megapixels"]): row for row in before["summary"]}
+    print(f"antes: {before['meta'].get('commit')}  depois: {after['meta'].get('commit')}")
+    print(f"{'motor':<16}{'MP':>5}" + "".join(f"{metric:>14}" for metric in METRICS))
+    for row in after["summary"]:
+        reference = old.get((row["engine"], row["megapixels"]))
+        if reference is None:
+            continue
+        cells = []
+        for metric in METRICS:
+            a, b = reference.get(metric), row.get(metric)
+            cells.append(f"{b / a:>13.2f}x" if a and b is not None else f"{'-':>14}")
+        print(f"{row['engine']:<16}{row['megapixels']:>5g}" + "".join(cells))
+
+
+def birefnet_entry(input_path, output_path):
+    """Ponto de entrada do BiRefNet fora do servidor: mesmo process_image() do tester_server"""
+    sys.path.insert(0, BACKEND_DIR)
+    from PIL import Image
+    import tester_server
+
+    image = Image.open(input_path).convert("RGB")
+    mask = tester_server.process_image(image)
+    result = image.convert("RGBA")
+    result.putalpha(mask)
+    result.save(output_path, "PNG")
+    print(f"SUCCESS:{output_path}", flush=True)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["_birefnet"] and len(argv) == 3:
+        birefnet_entry(argv[1], argv[2])
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark dos removedores de fundo")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="executa os motores e grava o relatório JSON/CSV")
+    run.add_argument("--engines", help=f"lista separada por vírgula ({', '.join(ENGINES)})")
+    run.add_argument("--sizes", default=",".join(f"{mp:g}" for mp in DEFAULT_SIZES_MP), help="megapixels")
+    run.add_argument("--repeat", type=int, default=1)
+    run.add_argument("--warmup", type=int, default=0, help="execuções descartadas antes das medidas")
+    run.add_argument("--timeout", type=float, default=1800, help="segundos por execução (0 = sem limite)")
+    run.add_argument("--python", default=sys.executable, help="interpretador usado pelos motores")
+    run.add_argument("--cwd", default=ROOT_DIR, help="diretório de trabalho dos motores (onde ficam os pesos)")
+    run.add_argument("--offline", action="store_true", help="sem downloads: ignora motores sem pesos em disco")
+    run.add_argument("--out", default=DEFAULT_OUT_DIR)
+    run.add_argument("--images-dir", default=None)
+    run.add_argument("--seed", type=int, default=DEFAULT_SEED)
+
+    images = sub.add_parser("images", help="só gera as imagens sintéticas")
+    images.add_argument("--sizes", default=",".join(f"{mp:g}" for mp in DEFAULT_SIZES_MP))
+    images.add_argument("--images-dir", default=os.path.join(DEFAULT_OUT_DIR, "images"))
+    images.add_argument("--seed", type=int, default=DEFAULT_SEED)
+
+    compare = sub.add_parser("compare", help="compara dois relatórios JSON")
+    compare.add_argument("before")
+    compare.add_argument("after")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        args.images_dir = args.images_dir or os.path.join(args.out, "images")
+        cmd_run(args)
+    elif args.command == "images":
+        cmd_images(args)
+    else:
+        cmd_compare(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Upscaling em blocos (tile_scheduler.py) x imagem inteira, com o upscayl-bin "stub"
+A referência é uma chamada do stub na imagem inteira (o que o upscayl-handler.ts faz hoje);
+depois o tile_scheduler com 1, 2, ... processos. Compara tempo, pico de RSS do processo
+principal (o binário de imagem inteira, ou o orquestrador) e a diferença para a referência
+nos pixels visíveis (mostra as emendas: rode com --overlap 0 para vê-las).
+Com --transparent a entrada é RGBA (alpha de referência da imagem sintética): os blocos
+totalmente transparentes são pulados.
+
+Uso:
+    python benchmarks/bench_tiles.py [--mp 12] [--scale 2] [--jobs 1,2,4] [--tile 1024] [--overlap 32]
+                                     [--transparent] [--delay-ms 0] [--bin benchmarks/stub_upscayl.py]
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+SCRIPTS_DIR = os.path.join(ROOT_DIR, "src", "main", "modules", "upscayl", "scripts")
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic import ensure_image
+from bench_removers import measure
+
+STUB = os.path.join(BENCH_DIR, "stub_upscayl.py")
+
+
+def difference(reference_path, output_path):
+    """(máxima, média) da diferença absoluta nos pixels visíveis"""
+    reference = np.asarray(Image.open(reference_path))
+    output = np.asarray(Image.open(output_path))
+    visible = reference[:, :, 3] > 0 if reference.shape[2] == 4 else np.ones(reference.shape[:2], dtype=bool)
+    diff = np.abs(reference.astype(np.int16) - output.astype(np.int16))[visible]
+    return int(diff.max()) if diff.size else 0, float(diff.mean()) if diff.size else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upscaling em blocos x imagem inteira (upscayl-bin stub)")
+    parser.add_argument("--mp", type=float, default=12)
+    parser.add_argument("--scale", type=int, default=2)
+    parser.add_argument("--jobs", default="1,2,4")
+    parser.add_argument("--tile", type=int, default=1024)
+    parser.add_argument("--overlap", type=int, default=32)
+    parser.add_argument("--transparent", action="store_true")
+    parser.add_argument("--delay-ms", type=float, default=0, help="inferência simulada por MP de entrada")
+    parser.add_argument("--bin", default=STUB)
+    parser.add_argument("--work-dir", default=None)
+    args = parser.parse_args(argv)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="bench_tiles_")
+    image_path, alpha_path = ensure_image(os.path.join(work_dir, "images"), args.mp, with_truth=True)
+    if args.transparent:
+        rgba = Image.open(image_path).convert("RGBA")
+        rgba.putalpha(Image.open(alpha_path))
+        image_path = os.path.join(work_dir, "input_rgba.png")
+        rgba.save(image_path, "PNG", compress_level=1)
+        del rgba
+    env = dict(os.environ, IMPRIME_STUB_DELAY_MS=str(args.delay_ms))
+    python = [sys.executable] if args.bin.endswith(".py") else []
+    log = os.path.join(work_dir, "log")
+
+    reference = os.path.join(work_dir, "whole.png")
+    runs = [("inteira", "-", python + [args.bin, "-i", image_path, "-o", reference, "-s", str(args.scale)], reference)]
+    for jobs in [int(value) for value in args.jobs.split(",") if value.strip()]:
+        output = os.path.join(work_dir, f"tiles_{jobs}.png")
+        runs.append(("blocos", str(jobs), [sys.executable, os.path.join(SCRIPTS_DIR, "tile_scheduler.py"),
+                                           image_path, output, "-n", "stub", "-s", str(args.scale), "--bin", args.bin,
+                                           "--tile", str(args.tile), "--overlap", str(args.overlap),
+                                           "--jobs", str(jobs)], output))
+
+    # Todas as medições antes das comparações: o fork herda o RSS deste processo, e as imagens
+    # decodificadas em difference() inflariam o pico dos filhos seguintes
+    measured = [(mode, jobs, output, measure(cmd, env, ROOT_DIR, log, None)) for mode, jobs, cmd, output in runs]
+    print(f"{'modo':<10}{'jobs':>5}{'tempo s':>10}{'pico MB':>10}{'dif. máx':>10}{'dif. média':>12}")
+    for mode, jobs, output, (code, wall, _, peak, _) in measured:
+        if code != 0:
+            print(f"{mode:<10}{jobs:>5}  falhou (código {code}), ver {log}.err")
+            continue
+        high, mean = difference(reference, output) if output != reference else (0, 0.0)
+        peak_mb = f"{peak / 1024 / 1024:.0f}" if peak else "?"
+        print(f"{mode:<10}{jobs:>5}{wall:>10.2f}{peak_mb:>10}{high:>10}{mean:>12.4f}")
+    print(f"Arquivos em {work_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Latência de requisições pequenas: Unix domain socket x TCP em loopback
+O servidor é a pilha real dos servidores de inferência (server_core.create_app: CORS, métricas,
+Server-Timing) num processo separado, uma vez em 127.0.0.1 e outra num socket Unix, com as
+rotas do sam_server montadas mas sem carregar modelos. Requisições:
+    ping    GET /bench/ping (resposta JSON mínima: só transporte + framework)
+    probe   POST /api/probe com um PNG pequeno em base64 (rota real, só lê o cabeçalho)
+Cada uma com conexão reaproveitada (keep-alive, como o axios) e com conexão nova por requisição.
+
+Uso:
+    python benchmarks/bench_transport.py [--requests 2000] [--warmup 200] [--only ping,probe]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import argparse
+import tempfile
+import subprocess
+import http.client
+
+from PIL import Image
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+BACKEND_DIR = os.path.join(ROOT_DIR, "src", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+
+def serve(transport, address):
+    """Processo filho: servidor na pilha real, sem modelos"""
+    os.environ.setdefault("MODEL_WARMUP", "0")
+    from server_core import create_app, serve as run
+    import sam_server
+
+    app = create_app(title="bench-transport", version="1")
+
+    @app.get("/bench/ping")
+    async def ping():
+        return {"ok": True}
+
+    app.include_router(sam_server.router)
+    argv = ["--uds", address] if transport == "uds" else ["--host", "127.0.0.1", "--port", address]
+    run(app, "bench", 0, argv=argv, log_level="warning", access_log=False)
+
+
+def connection(transport, address):
+    if transport == "uds":
+        from server_core import UnixHTTPConnection
+        return UnixHTTPConnection(address, timeout=10)
+    return http.client.HTTPConnection("127.0.0.1", int(address), timeout=10)
+
+
+def wait_ready(transport, address, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"servidor {transport} encerrou com código {process.returncode}")
+        try:
+            conn = connection(transport, address)
+            conn.request("GET", "/bench/ping")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit(f"servidor {transport} não respondeu em {timeout}s")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return str(s.getsockname()[1])
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_requests(transport, address, request, count, keep_alive):
+    """Latências em µs de `count` requisições (method, path, body, headers)"""
+    method, path, body, headers = request
+    timings = []
+    conn = connection(transport, address) if keep_alive else None
+    for _ in range(count):
+        start = time.perf_counter()
+        if not keep_alive:
+            conn = connection(transport, address)
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        if response.status != 200:
+            raise SystemExit(f"{transport} {path}: HTTP {response.status}")
+        if not keep_alive:
+            conn.close()
+        timings.append((time.perf_counter() - start) * 1e6)
+    if keep_alive:
+        conn.close()
+    return timings
+
+
+def small_png_request():
+    buffer = io.BytesIO()
+    Image.new("RGBA", (64, 64), (200, 30, 30, 255)).save(buffer, "PNG")
+    body = json.dumps({"image_base64": base64.b64encode(buffer.getvalue()).decode("ascii")})
+    return "POST", "/api/probe", body, {"Content-Type": "application/json"}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latência UDS x TCP loopback em requisições pequenas")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--only", default="ping,probe")
+    parser.add_argument("--serve", nargs=2, metavar=("TRANSPORTE", "ENDERECO"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.serve:
+        serve(*args.serve)
+        return
+
+    requests = {"ping": ("GET", "/bench/ping", None, {}), "probe": small_png_request()}
+    names = [n.strip() for n in args.only.split(",") if n.strip() in requests]
+    transports = ["tcp"] + (["uds"] if hasattr(socket, "AF_UNIX") else [])
+    if len(transports) == 1:
+        print("Unix domain socket indisponível nesta plataforma: só TCP")
+
+    with tempfile.TemporaryDirectory(prefix="bench_transport_") as directory:
+        servers = {}
+        try:
+            for transport in transports:
+                address = os.path.join(directory, "bench.sock") if transport == "uds" else free_port()
+                process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", transport, address],
+                                           stdout=subprocess.DEVNULL)
+                servers[transport] = (address, process)
+                wait_ready(transport, address, process)
+
+            print(f"{'requisição':<12}{'conexão':<12}{'transporte':<12}{'média µs':>10}{'p50':>9}{'p95':>9}"
+                  f"{'p99':>9}{'req/s':>9}")
+            for name in names:
+                for keep_alive in (True, False):
+                    means = {}
+                    for transport in transports:
+                        address = servers[transport][0]
+                        run_requests(transport, address, requests[name], args.warmup, keep_alive)
+                        timings = run_requests(transport, address, requests[name], args.requests, keep_alive)
+                        mean = sum(timings) / len(timings)
+                        means[transport] = mean
+                        print(f"{name:<12}{'keep-alive' if keep_alive else 'nova':<12}{transport:<12}{mean:>10.0f}"
+                              f"{percentile(timings, 0.5):>9.0f}{percentile(timings, 0.95):>9.0f}"
+                              f"{percentile(timings, 0.99):>9.0f}{1e6 / mean:>9.0f}")
+                    if "uds" in means:
+                        print(f"{'':<36}UDS x TCP: {100 * (means['uds'] / means['tcp'] - 1):+.1f}% na latência média")
+        finally:
+            for _, process in servers.values():
+                process.terminate()
+                process.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
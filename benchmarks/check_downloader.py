@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Verificação do model_downloader.py contra um servidor HTTP local com suporte a Range
+Sem rede: o servidor serve bytes aleatórios e corta pela metade as respostas dos blocos a
+partir de um offset, simulando um download interrompido. Cenários:
+- retomada: a 1ª passada falha no meio, o .part.json guarda os blocos prontos, a 2ª passada
+  baixa só o que falta e o destino confere com o original
+- hash errado: DownloadError, nada no destino, .part e estado removidos
+- sem digest: DownloadError, nada no destino, .part mantido; IMPRIME_ALLOW_UNVERIFIED=1 finaliza
+- sem Range: o servidor ignora o cabeçalho e o arquivo vem num bloco só
+O destino só aparece depois da verificação (rename atômico): checado em cada cenário.
+
+Uso:
+    python benchmarks/check_downloader.py [--mb 20] [--chunk-mb 2]
+"""
+
+import os
+import sys
+import argparse
+import hashlib
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+SCRIPTS_DIR = os.path.join(ROOT_DIR, "src", "main", "modules", "upscayl", "scripts")
+sys.path.insert(0, SCRIPTS_DIR)
+
+import model_downloader
+
+
+class RangeServer:
+    """Servidor local: payload fixo, Range opcional e corte das respostas que começam em `cut_from` ou depois"""
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.ranged = True
+        self.cut_from = None
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                header = self.headers.get("Range")
+                server.requests.append(header)
+                start, end = 0, len(server.payload) - 1
+                if header and server.ranged:
+                    first, last = header.split("=", 1)[1].split("-")
+                    start, end = int(first), min(int(last), end)
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(server.payload)}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(end - start + 1))
+                self.end_headers()
+                body = server.payload[start:end + 1]
+                if server.cut_from is not None and start >= server.cut_from and len(body) > 1:
+                    body = body[:len(body) // 2]
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/model.bin"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def check(label, condition):
+    print(f"  {'ok ' if condition else 'FALHOU'} {label}")
+    return bool(condition)
+
+
+def expect_error(call):
+    try:
+        call()
+    except model_downloader.DownloadError as e:
+        return str(e)
+    return None
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Retomada, hash errado e rename atômico do model_downloader")
+    parser.add_argument("--mb", type=float, default=20)
+    parser.add_argument("--chunk-mb", type=float, default=2)
+    args = parser.parse_args(argv)
+
+    model_downloader.CHUNK_SIZE = int(args.chunk_mb * 1024 * 1024)
+    payload = os.urandom(int(args.mb * 1024 * 1024))
+    digest = hashlib.sha256(payload).hexdigest()
+    work_dir = tempfile.mkdtemp(prefix="check_downloader_")
+    server = RangeServer(payload)
+    os.environ.pop(model_downloader.ALLOW_UNVERIFIED_ENV, None)
+    results = []
+
+    try:
+        print("retomada")
+        dest = os.path.join(work_dir, "resume", "model.bin")
+        chunks = -(-len(payload) // model_downloader.CHUNK_SIZE)
+        kept = chunks // 2
+        server.cut_from = kept * model_downloader.CHUNK_SIZE
+        error = expect_error(lambda: model_downloader.download(server.url, dest, digest, max_workers=2))
+        results.append(check("1ª passada interrompida levanta DownloadError", error))
+        results.append(check("destino ausente depois da falha", not os.path.exists(dest)))
+        results.append(check(".part e .part.json mantidos",
+                             os.path.exists(dest + ".part") and os.path.exists(dest + ".part.json")))
+        server.cut_from = None
+        del server.requests[:]
+        model_downloader.download(server.url, dest, digest, max_workers=2)
+        ranges = [header for header in server.requests if header != "bytes=0-0"]
+        starts = [int(header.split("=", 1)[1].split("-")[0]) for header in ranges]
+        results.append(check(f"2ª passada pediu {len(ranges)} de {chunks} blocos", len(ranges) == chunks - kept))
+        results.append(check("blocos prontos não foram pedidos de novo",
+                             all(start >= kept * model_downloader.CHUNK_SIZE for start in starts)))
+        results.append(check("destino igual ao original", read(dest) == payload))
+        results.append(check(".part e .part.json removidos",
+                             not os.path.exists(dest + ".part") and not os.path.exists(dest + ".part.json")))
+
+        print("hash errado")
+        dest = os.path.join(work_dir, "bad", "model.bin")
+        error = expect_error(lambda: model_downloader.download(server.url, dest, "0" * 64))
+        results.append(check("DownloadError de SHA-256", error and "SHA-256" in error))
+        results.append(check("destino ausente", not os.path.exists(dest)))
+        results.append(check(".part e .part.json removidos",
+                             not os.path.exists(dest + ".part") and not os.path.exists(dest + ".part.json")))
+
+        print("sem digest")
+        dest = os.path.join(work_dir, "unpinned", "unlisted.bin")
+        error = expect_error(lambda: model_downloader.download(server.url, dest))
+        results.append(check("DownloadError de digest não fixado", error and "não fixado" in error))
+        results.append(check("destino ausente, .part mantido",
+                             not os.path.exists(dest) and os.path.exists(dest + ".part")))
+        del server.requests[:]
+        model_downloader.download(server.url, dest, digest)
+        results.append(check("com o digest, finaliza sem baixar de novo",
+                             read(dest) == payload and server.requests == ["bytes=0-0"]))
+        dest = os.path.join(work_dir, "unpinned", "allowed.bin")
+        os.environ[model_downloader.ALLOW_UNVERIFIED_ENV] = "1"
+        try:
+            model_downloader.download(server.url, dest)
+        finally:
+            os.environ.pop(model_downloader.ALLOW_UNVERIFIED_ENV, None)
+        results.append(check(f"{model_downloader.ALLOW_UNVERIFIED_ENV}=1 finaliza", read(dest) == payload))
+
+        print("sem Range")
+        server.ranged = False
+        dest = os.path.join(work_dir, "plain", "model.bin")
+        model_downloader.download(server.url, dest, digest)
+        results.append(check("arquivo inteiro num bloco só", read(dest) == payload))
+    finally:
+        server.close()
+
+    print(f"{sum(results)}/{len(results)} verificações ok; arquivos em {work_dir}")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
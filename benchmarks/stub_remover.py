@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Removedor "stub" sem modelo: chave pela distância de cor até o fundo estimado nas bordas
+Não substitui nenhum motor de verdade; existe para o benchmark e o harness de qualidade
+rodarem sem rede e sem pesos (CI, máquina nova) com o mesmo protocolo dos scripts:
+PROGRESS:/EVENT: em stderr, SUCCESS:<caminho> em stdout.
+
+Uso:
+    python benchmarks/stub_remover.py <input_path> <output_path> [escala]
+    escala < 1 calcula a máscara em resolução reduzida (mais rápido, bordas piores)
+"""
+
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "src", "main", "modules", "upscayl", "scripts"))
+from cli_events import events, progress, file_size, image_nbytes
+
+# Distância RGB abaixo de LOW = fundo, acima de HIGH = arte; rampa linear no meio
+LOW, HIGH = 12.0, 48.0
+
+
+def key_alpha(rgb):
+    """Alpha uint8 HxW a partir da distância até a cor mediana da borda"""
+    border = np.concatenate([rgb[0], rgb[-1], rgb[:, 0], rgb[:, -1]]).astype(np.float32)
+    background = np.median(border, axis=0)
+    alpha = np.empty(rgb.shape[:2], dtype=np.uint8)
+    # Por blocos de linhas: a distância em float32 da folha inteira dobraria o pico de memória
+    for start in range(0, rgb.shape[0], 512):
+        block = rgb[start:start + 512].astype(np.float32) - background
+        distance = np.sqrt((block * block).sum(axis=2))
+        alpha[start:start + 512] = (np.clip((distance - LOW) / (HIGH - LOW), 0, 1) * 255).astype(np.uint8)
+    return alpha
+
+
+def remove_background_stub(input_path, output_path, scale=1.0):
+    progress('load', 10, "Carregando imagem...", nbytes=file_size(input_path))
+    image = Image.open(input_path).convert('RGB')
+
+    progress('inference', 40, "Calculando máscara (stub)...", nbytes=image_nbytes(image))
+    work = image
+    if scale < 1.0:
+        work = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.BILINEAR)
+    mask = Image.fromarray(key_alpha(np.asarray(work)), 'L')
+    if mask.size != image.size:
+        mask = mask.resize(image.size, Image.BILINEAR)
+
+    progress('save', 90, "Salvando resultado...")
+    result = image.convert('RGBA')
+    result.putalpha(mask)
+    result.save(output_path, 'PNG')
+    return output_path
+
+
+if __name__ == '__main__':
+    events.configure('stub_remover', sys.argv)
+    if len(sys.argv) < 3:
+        print("ERROR:Uso: python stub_remover.py <input_path> <output_path> [escala]", file=sys.stderr)
+        sys.exit(1)
+    input_path, output_path = sys.argv[1], sys.argv[2]
+    scale = float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
+    try:
+        remove_background_stub(input_path, output_path, scale)
+        events.finish('ok', output=output_path, input_path=input_path)
+        print(f"SUCCESS:{output_path}", flush=True)
+    except Exception as e:
+        events.finish('error', error=str(e), input_path=input_path)
+        print(f"ERROR:{e}", file=sys.stderr, flush=True)
+        sys.exit(1)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+upscayl-bin "stub": mesma linha de comando, mas só redimensiona (bicúbico) pela escala pedida
+Para testar e medir o tile_scheduler.py sem GPU, sem Vulkan e sem modelos. Aceita e ignora os
+argumentos que não usa (-n, -m, -f, -g, -j, -t, ...). IMPRIME_STUB_DELAY_MS simula o tempo de
+inferência por megapixel de entrada.
+
+Uso:
+    python benchmarks/stub_upscayl.py -i entrada.png -o saida.png [-s 4] [-n modelo] [-m pasta] [-f png]
+"""
+
+import os
+import sys
+import time
+
+from PIL import Image
+
+
+def parse(argv):
+    options = {}
+    index = 0
+    while index < len(argv):
+        if argv[index].startswith("-") and index + 1 < len(argv):
+            options[argv[index]] = argv[index + 1]
+            index += 2
+        else:
+            index += 1
+    return options
+
+
+def main(argv):
+    options = parse(argv[1:])
+    if "-i" not in options or "-o" not in options:
+        print("Uso: stub_upscayl.py -i entrada -o saida [-s escala]", file=sys.stderr)
+        return 1
+    scale = int(options.get("-s", 4))
+    with Image.open(options["-i"]) as image:
+        image.load()
+        delay = float(os.environ.get("IMPRIME_STUB_DELAY_MS") or 0)
+        if delay:
+            time.sleep(delay * image.width * image.height / 1e6 / 1000)
+        result = image.resize((image.width * scale, image.height * scale), Image.Resampling.BICUBIC)
+    result.save(options["-o"], "PNG", compress_level=1)
+    print(f"{options['-i']} -> {options['-o']} done", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Imagens sintéticas "tipo DTF" determinísticas, com alpha de referência (ground truth)
+Mesma semente + mesmo tamanho = mesmos pixels, em qualquer máquina. O layout é definido
+em coordenadas normalizadas, então 1 MP e 48 MP têm o mesmo conteúdo em escalas diferentes.
+
+Elementos: texto, logos com gradiente, traços finos tipo cabelo, áreas semitransparentes
+(sombra/brilho desfocado) sobre um fundo claro com gradiente suave e ruído.
+
+Uso:
+    python benchmarks/synthetic.py <pasta_saida> [megapixels ...]
+"""
+
+import os
+import sys
+import math
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+DEFAULT_SEED = 1234
+DEFAULT_SIZES_MP = (1, 4, 12, 24, 48)
+ASPECT = 3 / 2  # folhas DTF costumam ser paisagem
+
+
+def size_for_megapixels(megapixels, aspect=ASPECT):
+    """(largura, altura) com ~megapixels milhões de pixels na proporção dada"""
+    height = int(round(math.sqrt(megapixels * 1_000_000 / aspect)))
+    return int(round(height * aspect)), height
+
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1: sem fonte escalável embutida
+        for name in ("DejaVuSans-Bold.ttf", "arialbd.ttf", "Arial Bold.ttf"):
+            try:
+                return ImageFont.truetype(name, size)
+            except OSError:
+                pass
+        return ImageFont.load_default()
+
+
+def _gradient_fill(size, color_a, color_b, angle):
+    """Gradiente linear RGB (numpy) do tamanho do recorte"""
+    width, height = size
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+    t = xs * math.cos(angle) + ys * math.sin(angle)
+    t -= t.min()
+    t /= max(float(t.max()), 1.0)
+    a = np.array(color_a, dtype=np.float32)
+    b = np.array(color_b, dtype=np.float32)
+    return (a + (b - a) * t[..., None]).astype(np.uint8)
+
+
+def _star(cx, cy, r_outer, r_inner, points=5):
+    coords = []
+    for i in range(points * 2):
+        r = r_outer if i % 2 == 0 else r_inner
+        theta = -math.pi / 2 + i * math.pi / points
+        coords.append((cx + r * math.cos(theta), cy + r * math.sin(theta)))
+    return coords
+
+
+def render_foreground(width, height, seed=DEFAULT_SEED):
+    """Arte RGBA (o que deveria sobrar depois da remoção de fundo)"""
+    rng = np.random.default_rng(seed)
+    unit = min(width, height)
+    fg = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(fg)
+
+    def px(x, y):
+        return x * width, y * height
+
+    # Sombra/brilho semitransparente (desfocado) atrás do logo principal
+    glow = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    ImageDraw.Draw(glow).ellipse([*px(0.18, 0.20), *px(0.52, 0.78)], fill=(255, 200, 40, 140))
+    glow = glow.filter(ImageFilter.GaussianBlur(radius=max(1, unit * 0.02)))
+    fg = Image.alpha_composite(fg, glow)
+    draw = ImageDraw.Draw(fg)
+
+    # Logo principal: círculo com gradiente + estrela sólida por cima
+    x0, y0 = px(0.22, 0.25)
+    x1, y1 = px(0.48, 0.73)
+    box = (int(x0), int(y0), int(x1), int(y1))
+    shape = Image.new("L", (box[2] - box[0], box[3] - box[1]), 0)
+    ImageDraw.Draw(shape).ellipse([0, 0, shape.width - 1, shape.height - 1], fill=255)
+    fill = Image.fromarray(_gradient_fill(shape.size, (220, 30, 60), (40, 20, 160), 0.8), "RGB")
+    fg.paste(fill.convert("RGBA"), box[:2], shape)
+    draw = ImageDraw.Draw(fg)
+    cx, cy = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+    draw.polygon(_star(cx, cy, unit * 0.10, unit * 0.04), fill=(255, 255, 255, 255))
+
+    # Logo secundário: retângulo arredondado com gradiente e "furo" (contra-forma)
+    x0, y0 = px(0.60, 0.12)
+    x1, y1 = px(0.88, 0.42)
+    box = (int(x0), int(y0), int(x1), int(y1))
+    shape = Image.new("L", (box[2] - box[0], box[3] - box[1]), 0)
+    shape_draw = ImageDraw.Draw(shape)
+    radius = int(unit * 0.03)
+    shape_draw.rounded_rectangle([0, 0, shape.width - 1, shape.height - 1], radius=radius, fill=255)
+    hole = int(min(shape.size) * 0.25)
+    shape_draw.ellipse([shape.width // 2 - hole, shape.height // 2 - hole,
+                        shape.width // 2 + hole, shape.height // 2 + hole], fill=0)
+    fill = Image.fromarray(_gradient_fill(shape.size, (20, 160, 90), (10, 60, 40), 2.0), "RGB")
+    fg.paste(fill.convert("RGBA"), box[:2], shape)
+    draw = ImageDraw.Draw(fg)
+
+    # Texto grande e texto pequeno (bordas finas e contra-formas)
+    draw.text(px(0.56, 0.52), "IMPRIME DTF", font=_font(max(8, int(unit * 0.09))), fill=(15, 15, 15, 255))
+    draw.text(px(0.56, 0.66), "Qualidade premium - 300 dpi", font=_font(max(6, int(unit * 0.035))),
+              fill=(30, 30, 120, 255))
+
+    # Faixa semitransparente (tipo "vidro") sem desfoque
+    draw.rectangle([*px(0.56, 0.80), *px(0.92, 0.88)], fill=(0, 120, 255, 96))
+
+    # Traços tipo cabelo: passeios aleatórios finos saindo de uma "cabeça"
+    stroke = max(1, int(round(unit * 0.0012)))
+    head_x, head_y = 0.12, 0.86
+    for _ in range(220):
+        x, y = head_x + rng.normal(0, 0.015), head_y + rng.normal(0, 0.015)
+        angle = rng.uniform(-math.pi, 0)
+        points = [px(x, y)]
+        for _ in range(24):
+            angle += rng.normal(0, 0.18)
+            x += math.cos(angle) * 0.006
+            y += math.sin(angle) * 0.006
+            points.append(px(x, y))
+        shade = int(rng.integers(40, 90))
+        draw.line(points, fill=(shade + 30, shade, shade // 2, 255), width=stroke)
+
+    return fg
+
+
+def render_background(width, height, seed=DEFAULT_SEED):
+    """Fundo claro com gradiente suave e ruído leve (papel/scan), sem nada de arte"""
+    rng = np.random.default_rng(seed + 1)
+    gradient = _gradient_fill((width, 1), (246, 244, 238), (226, 230, 236), 0.0)
+    background = np.repeat(gradient, height, axis=0)
+    # Ruído por linhas de blocos para não alocar float do tamanho da imagem inteira
+    block = 1024
+    for start in range(0, height, block):
+        stop = min(height, start + block)
+        noise = rng.integers(-4, 5, size=(stop - start, width, 1), dtype=np.int16)
+        rows = background[start:stop].astype(np.int16) + noise
+        background[start:stop] = np.clip(rows, 0, 255).astype(np.uint8)
+    return Image.fromarray(background, "RGB")
+
+
+def render(width, height, seed=DEFAULT_SEED):
+    """
+    Returns:
+        (imagem RGB composta, alpha de referência uint8 HxW)
+    """
+    fg = render_foreground(width, height, seed)
+    composite = Image.alpha_composite(render_background(width, height, seed).convert("RGBA"), fg)
+    alpha = np.asarray(fg.getchannel("A")).copy()
+    return composite.convert("RGB"), alpha
+
+
+def ensure_image(directory, megapixels, seed=DEFAULT_SEED, with_truth=False):
+    """
+    Gera (uma vez) dtf_<MP>mp_s<seed>.png e, se pedido, o alpha de referência *.alpha.png
+    Returns:
+        caminho da imagem (e do alpha, se with_truth)
+    """
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, f"dtf_{megapixels:g}mp_s{seed}")
+    image_path, alpha_path = stem + ".png", stem + ".alpha.png"
+    if not os.path.exists(image_path) or (with_truth and not os.path.exists(alpha_path)):
+        width, height = size_for_megapixels(megapixels)
+        image, alpha = render(width, height, seed)
+        # compress_level baixo: gerar 48 MP não deve dominar o tempo do benchmark
+        image.save(image_path + ".tmp", "PNG", compress_level=1)
+        os.replace(image_path + ".tmp", image_path)
+        Image.fromarray(alpha, "L").save(alpha_path + ".tmp", "PNG", compress_level=1)
+        os.replace(alpha_path + ".tmp", alpha_path)
+    return (image_path, alpha_path) if with_truth else image_path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python benchmarks/synthetic.py <pasta_saida> [megapixels ...]", file=sys.stderr)
+        sys.exit(1)
+    sizes = [float(v) for v in sys.argv[2:]] or DEFAULT_SIZES_MP
+    for mp in sizes:
+        print(ensure_image(sys.argv[1], mp, with_truth=True)[0])
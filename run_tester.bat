@@ -1,7 +1,7 @@
 @echo off
-echo Iniciando Servidor TESTER (InSPyReNet High Quality)...
-echo Porta: 8001
+echo Iniciando Servidor de Inferencia (SAM + rembg + BiRefNet)...
+echo Porta: 8000 (BiRefNet em /remove e /api/remove?engine=birefnet)
 echo --
 cd /d "%~dp0"
-python src/backend/tester_server.py
+python src/backend/inference_server.py
 pause
@@ -44,4 +44,75 @@ copyFile(
   path.join(__dirname, '../dist/background_remover_sam.py')
 );
 
+// Helpers compartilhados pelos removedores
+copyFile(
+  path.join(__dirname, '../src/main/modules/upscayl/scripts/sam_checkpoint.py'),
+  path.join(__dirname, '../dist/sam_checkpoint.py')
+);
+
+copyFile(
+  path.join(__dirname, '../src/main/modules/upscayl/scripts/model_downloader.py'),
+  path.join(__dirname, '../dist/model_downloader.py')
+);
+
+copyFile(
+  path.join(__dirname, '../src/main/modules/upscayl/scripts/sam_embedding_cache.py'),
+  path.join(__dirname, '../dist/sam_embedding_cache.py')
+);
+
+copyFile(
+  path.join(__dirname, '../src/main/modules/upscayl/scripts/sam_roi.py'),
+  path.join(__dirname, '../dist/sam_roi.py')
+);
+
+copyFile(
+  path.join(__dirname, '../src/main/modules/upscayl/scripts/remover_cli.py'),
+  path.join(__dirname, '../dist/remover_cli.py')
+);
+
+copyFile(
+  path.join(__dirname, '../src/main/modules/upscayl/scripts/result_cache.py'),
+  path.join(__dirname, '../dist/result_cache.py')
+);
+
+copyFile(
+  path.join(__dirname, '../src/main/modules/upscayl/scripts/cli_events.py'),
+  path.join(__dirname, '../dist/cli_events.py')
+);
+
+copyFile(
+  path.join(__dirname, '../src/main/modules/upscayl/scripts/memory_profile.py'),
+  path.join(__dirname, '../dist/memory_profile.py')
+);
+
+copyFile(
+  path.join(__dirname, '../src/main/modules/upscayl/scripts/image_encode.py'),
+  path.join(__dirname, '../dist/image_encode.py')
+);
+
+copyFile(
+  path.join(__dirname, '../src/main/modules/upscayl/scripts/stripe_pipeline.py'),
+  path.join(__dirname, '../dist/stripe_pipeline.py')
+);
+
+copyFile(
+  path.join(__dirname, '../src/main/modules/upscayl/scripts/image_probe.py'),
+  path.join(__dirname, '../dist/image_probe.py')
+);
+
+copyFile(
+  path.join(__dirname, '../src/main/modules/upscayl/scripts/engine_router.py'),
+  path.join(__dirname, '../dist/engine_router.py')
+);
+
+copyFile(
+  path.join(__dirname, '../src/main/modules/upscayl/scripts/thread_budget.py'),
+  path.join(__dirname, '../dist/thread_budget.py')
+);
+
+copyFile(
+  path.join(__dirname, '../src/main/modules/upscayl/scripts/tile_scheduler.py'),
+  path.join(__dirname, '../dist/tile_scheduler.py')
+);
+
 console.log('✅ Concluído!');
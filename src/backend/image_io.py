@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Request-body image decoding with as few full-size copies as possible
+The JSON body arrives as one large str (data URL). The usual chain
+split("base64,") -> b64decode -> BytesIO -> Image.open -> convert("RGB") -> np.array
+keeps several full-size buffers alive at once. Here:
+- the base64 text is decoded in fixed-size chunks straight into one preallocated buffer
+  (no split copy, no ASCII bytes copy of the whole payload);
+- images are opened through a zero-copy reader over that buffer;
+- JPEGs that will be downscaled anyway are DCT-scaled while decoding (draft);
+- RGB images are not converted again, and the array is a read-only view of PIL's pixels.
+Header-only probes read through Base64Reader and decode just the bytes they touch.
+"""
+
+import base64
+import binascii
+import io
+import math
+from typing import Optional, Union
+
+import numpy as np
+from PIL import Image
+
+# Base64 characters decoded per step (multiple of 4): ~768 KB of output per chunk
+CHUNK_CHARS = 1024 * 1024
+# A data URL header ("data:image/png;base64,") is short; never scan the whole payload for it
+DATA_URL_SCAN = 256
+
+Payload = Union[bytes, bytearray, memoryview]
+
+
+def _payload_bounds(data: str):
+    start = data.find("base64,", 0, DATA_URL_SCAN)
+    start = 0 if start < 0 else start + len("base64,")
+    end = len(data)
+    while end > start and data[end - 1] in " \t\r\n":
+        end -= 1
+    return start, end
+
+
+def decode_base64_payload(data: str) -> memoryview:
+    """
+    Decode base64 text (optionally a data URL) into a single preallocated buffer
+    Returns a read-only memoryview; hashing and open_image() use it without copying.
+    Raises ValueError (binascii.Error) on invalid input.
+    """
+    start, end = _payload_bounds(data)
+    length = end - start
+    if length % 4:
+        # Line breaks inside or missing padding: let the standard decoder sort it out
+        return memoryview(base64.b64decode(data[start:end])).toreadonly()
+
+    padding = (data[end - 1] == "=") + (length > 1 and data[end - 2] == "=") if length else 0
+    size = length // 4 * 3 - padding
+    buffer = bytearray(size)
+    position = 0
+    for offset in range(start, end, CHUNK_CHARS):
+        chunk = binascii.a2b_base64(data[offset:min(offset + CHUNK_CHARS, end)])
+        if position + len(chunk) > size:
+            raise binascii.Error("Invalid base64 payload length")
+        buffer[position:position + len(chunk)] = chunk
+        position += len(chunk)
+    if position != size:
+        # Whitespace or stray characters inside the text (skipped by a2b_base64)
+        return memoryview(base64.b64decode(data[start:end])).toreadonly()
+    return memoryview(buffer).toreadonly()
+
+
+class BufferReader(io.RawIOBase):
+    """Seekable file object over a shared buffer; each reader has its own position"""
+
+    def __init__(self, payload: Payload):
+        super().__init__()
+        self._view = memoryview(payload).cast("B")
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        count = min(len(target), len(self._view) - self._position)
+        if count <= 0:
+            return 0
+        target[:count] = self._view[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = len(self._view) + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if position < 0:
+            raise ValueError("negative seek position")
+        self._position = position
+        return position
+
+    def tell(self) -> int:
+        return self._position
+
+
+class Base64Reader(io.RawIOBase):
+    """
+    Seekable file object over base64 text that decodes only the bytes actually read
+    Header probes touch a few KB of a payload that can be hundreds of MB.
+    """
+
+    def __init__(self, data: str):
+        super().__init__()
+        start, end = _payload_bounds(data)
+        if (end - start) % 4:
+            raise ValueError("base64 text is not 4-character aligned")
+        padding = (data[end - 1] == "=") + (end - start > 1 and data[end - 2] == "=") if end > start else 0
+        self._data = data
+        self._start = start
+        self._end = end
+        self._size = (end - start) // 4 * 3 - padding
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        count = min(len(target), self._size - self._position)
+        if count <= 0:
+            return 0
+        first_group = self._position // 3
+        last_group = (self._position + count + 2) // 3
+        chunk = binascii.a2b_base64(self._data[self._start + first_group * 4:
+                                               min(self._end, self._start + last_group * 4)])
+        skip = self._position - first_group * 3
+        count = min(count, len(chunk) - skip)
+        target[:count] = chunk[skip:skip + count]
+        self._position += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self._size + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if position < 0:
+            raise ValueError("negative seek position")
+        self._position = position
+        return position
+
+    def tell(self) -> int:
+        return self._position
+
+
+def open_base64(data: str) -> io.RawIOBase:
+    """Lazy reader over base64 text; irregular text (line breaks, no padding) is decoded up front"""
+    try:
+        return Base64Reader(data)
+    except ValueError:
+        return BufferReader(decode_base64_payload(data))
+
+
+def open_image(payload: Payload, max_side: Optional[int] = None) -> Image.Image:
+    """
+    Open encoded image bytes lazily (pixels are decoded on first use)
+    max_side: the caller only needs this resolution; JPEGs are then decoded at 1/2, 1/4
+    or 1/8 scale (never below max_side), which skips most of the IDCT and memory.
+    """
+    image = Image.open(BufferReader(payload))
+    if max_side and image.format == "JPEG":
+        scale = max_side / max(image.size)
+        if scale < 1:
+            image.draft("RGB", (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+    return image
+
+
+def ensure_rgb(image: Image.Image) -> Image.Image:
+    """convert("RGB") only when needed (Pillow's convert copies even when the mode matches)"""
+    return image if image.mode == "RGB" else image.convert("RGB")
+
+
+def image_array(image: Image.Image) -> np.ndarray:
+    """
+    Read-only HxWxC view of the image pixels
+    np.asarray wraps the buffer exported by Pillow (one copy out of PIL's block storage)
+    instead of np.array's second copy; callers must not write into it.
+    """
+    array = np.asarray(image)
+    if array.flags.writeable:
+        array.flags.writeable = False
+    return array
+
+
+def decode_rgb_array(data: str, max_side: Optional[int] = None) -> np.ndarray:
+    """Base64 text -> read-only RGB array, through the copy-free path above"""
+    return image_array(ensure_rgb(open_image(decode_base64_payload(data), max_side)))
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Single inference server hosting every engine (SAM, rembg, BiRefNet) in one process
+One model registry (with the MODEL_MEMORY_BUDGET_MB residency budget), one request thread
+pool, one thread budget for the native libraries and one decode/encode layer, instead of
+sam_server.py (port 8000) and tester_server.py (port 8002) each holding their own.
+
+The routes of both servers are mounted unchanged and act as compatibility aliases:
+    sam_server:    /api/segment/points, /api/segment/box, /api/refine-mask, /api/apply-mask,
+                   /api/auto-remove, /api/probe
+    tester_server: /remove
+    both:          /api/jobs/{id}[/events|/cancel], /metrics
+Common API:
+    GET  /api/engines                 engines, their model state and the thread budget
+    POST /api/remove?engine=birefnet  {"image_base64": ...}; engine rembg or birefnet
+                                      (default: IMPRIME_DEFAULT_ENGINE, else the first one available)
+
+Listens on 127.0.0.1:8000, so the Electron client (sam-api.ts) needs no change; --uds [path]
+serves on a Unix domain socket instead (see server_core.serve).
+"""
+
+import os
+from typing import Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from server_core import create_app, serve, shared
+
+# Created before the engine modules import it, so the metrics carry service="inference"
+core = shared("inference")
+
+import sam_server
+import tester_server
+from model_registry import ModelSlot
+
+models = core.models
+
+# Engines behind POST /api/remove, in default order (names are also their model slots)
+ENGINES = ("birefnet", "rembg")
+ENGINE_ROUTES = {
+    "birefnet": ["/remove"],
+    "rembg": ["/api/auto-remove", "/api/refine-mask"],
+    "sam": ["/api/segment/points", "/api/segment/box"],
+}
+DEFAULT_ENGINE = os.environ.get("IMPRIME_DEFAULT_ENGINE")
+
+
+class RemoveRequest(BaseModel):
+    image_base64: str
+    engine: Optional[str] = None
+    threshold: float = 0.5
+
+
+app = create_app(
+    title="Imprime AI Inference API",
+    version="1.0.0",
+    description="SAM, rembg e BiRefNet num único processo",
+)
+
+
+def engine_usable(name: str) -> bool:
+    return models.slot(name).state not in (ModelSlot.FAILED, ModelSlot.UNAVAILABLE)
+
+
+def pick_engine(requested: Optional[str]) -> str:
+    name = requested or DEFAULT_ENGINE
+    if name is not None:
+        if name not in ENGINES:
+            raise HTTPException(status_code=400, detail=f"Unknown engine '{name}' (available: {', '.join(ENGINES)})")
+        return name
+    for name in ENGINES:
+        if engine_usable(name):
+            return name
+    raise HTTPException(status_code=503, detail="No background removal engine available")
+
+
+# Registered before the engine routers: these win over sam_server's / and /health
+@app.get("/")
+async def root():
+    return {
+        "status": "ok",
+        "service": "Imprime AI Inference API",
+        "version": "1.0.0",
+        "engines": [name for name in ENGINE_ROUTES if models.slot(name).state != ModelSlot.UNAVAILABLE],
+    }
+
+
+@app.get("/health")
+async def health():
+    """Every engine of the process (same fields sam_server and tester_server report)"""
+    return {
+        "status": "ok" if models.all_settled() else "loading",
+        "sam_loaded": models.get("sam") is not None,
+        "rembg_available": sam_server.REMBG_AVAILABLE,
+        "models": models.status(),
+        "residency": models.residency(),
+        "thread_budget": core.thread_budget(),
+        "result_cache": core.result_cache.stats() if core.result_cache is not None else None,
+    }
+
+
+@app.get("/api/engines")
+async def list_engines():
+    return {
+        "default": DEFAULT_ENGINE or next((name for name in ENGINES if engine_usable(name)), None),
+        "engines": [
+            {"engine": name, "state": models.slot(name).state, "routes": routes,
+             "remove": name in ENGINES}
+            for name, routes in ENGINE_ROUTES.items()
+        ],
+        "thread_budget": core.thread_budget(),
+    }
+
+
+@app.post("/api/remove")
+async def remove(request: RemoveRequest, engine: Optional[str] = None, fail_fast: bool = False,
+                 progressive: bool = False):
+    """Automatic background removal with the chosen engine (same response as its own route)"""
+    name = pick_engine(engine or request.engine)
+    if name == "birefnet":
+        return await tester_server.remove_background(
+            tester_server.ImageRequest(image_base64=request.image_base64, threshold=request.threshold),
+            fail_fast=fail_fast, progressive=progressive,
+        )
+    return await sam_server.auto_remove_background(
+        sam_server.AutoRemoveRequest(image_base64=request.image_base64),
+        fail_fast=fail_fast, progressive=progressive,
+    )
+
+
+app.include_router(sam_server.router)
+app.include_router(tester_server.router)
+
+
+@app.on_event("startup")
+async def startup_event():
+    """Load every engine's models in the background (one registry, sequential, within the budget)"""
+    models.start_background_loading()
+    budget = models.residency()["budget_mb"]
+    print(f"[INFERENCE] Modelos: {', '.join(models.names())} "
+          f"(orçamento de memória: {f'{budget:.0f}MB' if budget else 'sem limite'}, "
+          f"threads: {core.thread_budget()})")
+
+
+if __name__ == "__main__":
+    serve(app, "inference", 8000, log_level="info")
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory job store for long operations
+Workers (threads) publish events on a job id; clients follow them over Server-Sent Events.
+Jobs can be cancelled cooperatively: workers call job.check() between pipeline stages,
+and a newer job on the same session supersedes (cancels) the older ones.
+
+Full-resolution payloads (PAYLOAD_KEYS, e.g. a base64 result_image) are not kept for the
+whole TTL: they are released once delivered (SSE or poll), and the store keeps at most
+`max_payloads` undelivered ones (oldest released first). A released event keeps its other
+fields plus "released": true; the client resubmits (the result cache answers at once).
+"""
+
+import asyncio
+import json
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+# Event fields holding full-resolution data (hundreds of MB across large concurrent jobs)
+PAYLOAD_KEYS = ("result_image",)
+
+
+class JobCancelled(Exception):
+    """Raised by Job.check() in the worker once the job was cancelled or superseded"""
+
+    def __init__(self, job_id: str, reason: str):
+        super().__init__(f"Job {job_id} {reason}")
+        self.job_id = job_id
+        self.reason = reason
+
+
+class Job:
+    """A job and the ordered list of events published for it"""
+
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    TERMINAL_EVENTS = ("result", "error", "cancelled")
+
+    def __init__(self, kind: str, loop: asyncio.AbstractEventLoop, session: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.session = session
+        self.status = self.RUNNING
+        self.stage: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.cancel_reason: Optional[str] = None
+        self.events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._loop = loop
+        self._changed = asyncio.Event()
+        self.on_payload = None  # set by the JobStore: enforces max_payloads
+        self.worker: Optional[asyncio.Future] = None  # background work attached with attach()
+
+    def publish(self, event: str, data: Dict[str, Any]) -> None:
+        """Append an event (safe to call from worker threads); ignored once the job is terminal"""
+        with self._lock:
+            if self.status != self.RUNNING:
+                return
+            self.events.append({"event": event, "data": data})
+            if event == "result":
+                self.status = self.DONE
+            elif event == "error":
+                self.status = self.FAILED
+            elif event == "cancelled":
+                self.status = self.CANCELLED
+            if event in self.TERMINAL_EVENTS:
+                self.finished = time.time()
+        self._loop.call_soon_threadsafe(self._changed.set)
+        if self.has_payload and self.on_payload is not None:
+            self.on_payload(self)
+
+    @property
+    def has_payload(self) -> bool:
+        return any(key in item["data"] and item["data"][key] is not None
+                   for item in self.events for key in PAYLOAD_KEYS)
+
+    def release_payload(self) -> None:
+        """Drop the full-resolution fields of every stored event (already delivered or expired)"""
+        with self._lock:
+            for item in self.events:
+                if any(item["data"].get(key) is not None for key in PAYLOAD_KEYS):
+                    item["data"] = {**item["data"], **{key: None for key in PAYLOAD_KEYS if key in item["data"]},
+                                    "released": True}
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """Ask the worker to stop at its next check(); False if the job already finished"""
+        with self._lock:
+            if self.status != self.RUNNING:
+                return False
+            self.cancel_reason = reason
+        self.publish("cancelled", {"job_id": self.id, "reason": reason, "stage": self.stage})
+        return True
+
+    def attach(self, worker: asyncio.Future) -> asyncio.Future:
+        """
+        Tie background work (e.g. a progressive refine) to this job: the future is kept, and
+        if it ends without a terminal event (an exception escaped, or it was cancelled)
+        the job is finished with an error so streams end and the store can expire it
+        """
+        self.worker = worker
+        worker.add_done_callback(self._worker_done)
+        return worker
+
+    def _worker_done(self, worker: asyncio.Future) -> None:
+        if worker.cancelled():
+            self.cancel("worker cancelled")
+        elif self.terminal:
+            pass
+        elif worker.exception() is not None:
+            self.publish("error", {"success": False, "error": str(worker.exception())})
+        else:
+            self.publish("error", {"success": False, "error": "worker finished without a result"})
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_reason is not None
+
+    def check(self, stage: Optional[str] = None) -> None:
+        """Cancellation point between pipeline stages; records the stage about to run"""
+        if self.cancel_reason is not None:
+            raise JobCancelled(self.id, self.cancel_reason)
+        if stage is not None:
+            self.stage = stage
+
+    @property
+    def terminal(self) -> bool:
+        return self.status != self.RUNNING
+
+    def latest(self, event: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            for item in reversed(self.events):
+                if item["event"] == event:
+                    return item["data"]
+        return None
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "session": self.session,
+                "stage": self.stage,
+                "events": [item["event"] for item in self.events],
+            }
+
+    async def stream(self, keepalive: float = 15.0) -> AsyncIterator[str]:
+        """SSE frames: every event already published, then new ones until a terminal event"""
+        index = 0
+        while True:
+            with self._lock:
+                pending = self.events[index:]
+                index = len(self.events)
+                self._changed.clear()
+            for item in pending:
+                yield f"event: {item['event']}\ndata: {json.dumps(item['data'])}\n\n"
+            if self.terminal and index == len(self.events):
+                # Delivered: the full-resolution result is not held for the rest of the TTL
+                self.release_payload()
+                return
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+
+
+class JobStore:
+    """Keeps recent jobs; finished jobs expire after `ttl` seconds"""
+
+    def __init__(self, ttl: float = 600.0, max_payloads: int = 2):
+        self.ttl = ttl
+        self.max_payloads = max_payloads
+        self._jobs: Dict[str, Job] = {}
+        self._payloads: List[Job] = []
+        self._payload_lock = threading.Lock()
+
+    def create(self, kind: str, session: Optional[str] = None) -> Job:
+        """
+        New running job. With a session id, older running jobs of the same kind
+        on that session are superseded: only the newest click's result matters.
+        """
+        self._expire()
+        if session is not None:
+            for job in list(self._jobs.values()):
+                if job.session == session and job.kind == kind and not job.terminal:
+                    job.cancel("superseded")
+        job = Job(kind, asyncio.get_running_loop(), session=session)
+        job.on_payload = self._track_payload
+        self._jobs[job.id] = job
+        return job
+
+    def _track_payload(self, job: Job) -> None:
+        """Keep at most max_payloads undelivered full-resolution results (oldest released)"""
+        with self._payload_lock:
+            self._payloads = [held for held in self._payloads if held is not job and held.has_payload] + [job]
+            keep = max(1, self.max_payloads)
+            expired, self._payloads = self._payloads[:-keep], self._payloads[-keep:]
+        for held in expired:
+            held.release_payload()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def _expire(self) -> None:
+        now = time.time()
+        for job_id in [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished is not None and now - job.finished > self.ttl
+        ]:
+            del self._jobs[job_id]
+
+
+def add_job_routes(app, store: JobStore) -> None:
+    """GET /api/jobs/{id} (poll), GET /api/jobs/{id}/events (SSE) and POST /api/jobs/{id}/cancel"""
+    from fastapi import HTTPException
+    from fastapi.responses import StreamingResponse
+
+    def _job_or_404(job_id: str) -> Job:
+        job = store.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+        return job
+
+    @app.get("/api/jobs/{job_id}")
+    async def job_status(job_id: str):
+        job = _job_or_404(job_id)
+        summary = job.summary()
+        summary["result"] = job.latest("result")
+        summary["error"] = job.latest("error")
+        if job.terminal:
+            job.release_payload()
+        return summary
+
+    @app.post("/api/jobs/{job_id}/cancel")
+    async def job_cancel(job_id: str):
+        job = _job_or_404(job_id)
+        return {"job_id": job.id, "cancelled": job.cancel(), "status": job.status}
+
+    @app.get("/api/jobs/{job_id}/events")
+    async def job_events(job_id: str):
+        job = _job_or_404(job_id)
+        return StreamingResponse(
+            job.stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
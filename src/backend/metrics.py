@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""
+Lightweight instrumentation for the FastAPI servers
+Per-stage latency histograms, queue wait, in-flight requests and cache counters,
+exposed in the Prometheus text format on GET /metrics and per request as a
+Server-Timing header (decode;dur=12.1, embed;dur=840.3, ...) for the Electron client.
+
+Memory debugging: a request carrying `X-Debug-Memory: 1` (or every request when
+IMPRIME_DEBUG_MEMORY=1) is profiled stage by stage (scripts/memory_profile.py) and the
+response gets an X-Memory-Profile header with peak RSS, tracemalloc top allocations and
+the number of full-image buffers alive per stage. tracemalloc is process-wide and slow:
+profile one request at a time, never in production.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Seconds; covers base64 decode (ms) up to CPU matting of large sheets (minutes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Stages timed during the current request (None outside a request, e.g. background jobs)
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+# Memory profiler of the current request (None unless X-Debug-Memory was sent)
+_request_memory: contextvars.ContextVar[Optional[object]] = contextvars.ContextVar("request_memory", default=None)
+
+DEBUG_MEMORY_HEADER = b"x-debug-memory"
+MEMORY_PROFILE_HEADER = b"x-memory-profile"
+
+
+def debug_memory_always() -> bool:
+    return os.environ.get("IMPRIME_DEBUG_MEMORY", "0").lower() in ("1", "true", "yes")
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes (None if it cannot be read)"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    TYPE = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...], **extra) -> Dict[str, str]:
+        labels = dict(zip(self.labelnames, key))
+        labels.update(extra)
+        return labels
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.TYPE}"]
+
+
+class Counter(_Metric):
+    TYPE = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}" for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    TYPE = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts + [sum]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 1)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = self.header()
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                labels = _format_labels(self._labels(key, le=_format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {_format_value(count)}")
+            labels = _format_labels(self._labels(key))
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(series[-2])}")
+        return lines
+
+
+class Metrics:
+    """Metrics of one server process; every series carries a service label"""
+
+    def __init__(self, service: str):
+        self.service = service
+        self.stage_seconds = Histogram(
+            "imprime_stage_seconds", "Time spent in each pipeline stage", ("service", "stage")
+        )
+        self.queue_wait_seconds = Histogram(
+            "imprime_queue_wait_seconds", "Time waiting for a model or a busy predictor", ("service", "queue")
+        )
+        self.request_seconds = Histogram(
+            "imprime_request_seconds", "End-to-end request latency", ("service", "route")
+        )
+        self.requests_total = Counter(
+            "imprime_requests_total", "Finished requests by route and status code", ("service", "route", "status")
+        )
+        self.in_flight = Gauge(
+            "imprime_in_flight_requests", "Requests currently being handled", ("service",)
+        )
+        self.cache_lookups = Counter(
+            "imprime_cache_lookups_total", "Cache lookups by cache and result (hit/miss)", ("service", "cache", "result")
+        )
+        self.in_flight.set(0, service=service)
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a pipeline stage (histogram + Server-Timing entry of the current request)"""
+        profile = _request_memory.get()
+        if profile is not None:
+            profile.begin(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(name, time.perf_counter() - start)
+            if profile is not None:
+                profile.end(name)
+
+    def note_image(self, image) -> None:
+        """Image size of the current request: the unit for counting full-image buffers"""
+        profile = _request_memory.get()
+        if profile is not None:
+            profile.note_image(*image.size)
+
+    def observe_stage(self, name: str, seconds: float) -> None:
+        self.stage_seconds.observe(seconds, service=self.service, stage=name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, seconds))
+
+    @contextmanager
+    def queue(self, name: str):
+        """Time spent waiting (lock, model loading); also reported as a Server-Timing entry"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.queue_wait_seconds.observe(seconds, service=self.service, queue=name)
+            timings = _request_timings.get()
+            if timings is not None:
+                timings.append((f"wait-{name}", seconds))
+
+    def cache(self, name: str, hit: bool) -> None:
+        self.cache_lookups.inc(service=self.service, cache=name, result="hit" if hit else "miss")
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]) -> None:
+        """Extra exposition lines computed at scrape time (model memory, cache size, ...)"""
+        self._collectors.append(collector)
+
+    def gauge_lines(self, name: str, help: str, values: Dict[Tuple[Tuple[str, str], ...], Optional[float]],
+                    metric_type: str = "gauge") -> List[str]:
+        """Format scrape-time values; keys are label tuples ((name, value), ...) without service"""
+        lines = [f"# HELP {name} {help}", f"# TYPE {name} {metric_type}"]
+        for labels, value in values.items():
+            if value is None:
+                continue
+            labels = _format_labels({"service": self.service, **dict(labels)})
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return lines
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in (self.stage_seconds, self.queue_wait_seconds, self.request_seconds,
+                       self.requests_total, self.in_flight, self.cache_lookups):
+            lines.extend(metric.render())
+        lines.extend(self.gauge_lines(
+            "imprime_process_resident_memory_bytes", "Resident memory of the server process",
+            {(): current_rss()}
+        ))
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                lines.append(f"# collector failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+def model_memory_lines(metrics: Metrics, registry) -> List[str]:
+    """
+    imprime_model_memory_bytes{model=...}: weights size (or RSS growth) of each model,
+    plus residency: loaded now, loads and LRU evictions under MODEL_MEMORY_BUDGET_MB
+    """
+    names = registry.names()
+    lines = metrics.gauge_lines(
+        "imprime_model_memory_bytes", "Resident memory added by loading each model",
+        {(("model", name),): registry.slot(name).memory_bytes for name in names}
+    )
+    lines += metrics.gauge_lines(
+        "imprime_model_resident", "1 while the model is loaded, 0 if unloaded or not loaded yet",
+        {(("model", name),): 1 if registry.slot(name).ready else 0 for name in names}
+    )
+    lines += metrics.gauge_lines(
+        "imprime_model_loads_total", "Model loads, including reloads after eviction",
+        {(("model", name),): registry.slot(name).loads for name in names}, metric_type="counter"
+    )
+    lines += metrics.gauge_lines(
+        "imprime_model_evictions_total", "Models unloaded to stay under the memory budget",
+        {(("model", name),): registry.slot(name).evictions for name in names}, metric_type="counter"
+    )
+    if registry.memory_budget is not None:
+        lines += metrics.gauge_lines(
+            "imprime_model_memory_budget_bytes", "Memory budget for resident models",
+            {(): registry.memory_budget}
+        )
+    return lines
+
+
+def result_cache_lines(metrics: Metrics, cache) -> List[str]:
+    """Result cache counters and occupancy (see scripts/result_cache.py)"""
+    if cache is None:
+        return []
+    stats = cache.stats()
+    lines = metrics.gauge_lines(
+        "imprime_result_cache_lookups_total", "Result cache lookups (hit/miss)",
+        {(("result", "hit"),): stats["hits"], (("result", "miss"),): stats["misses"]}, metric_type="counter"
+    )
+    lines += metrics.gauge_lines(
+        "imprime_result_cache_evictions_total", "Result cache entries evicted (LRU)",
+        {(): stats["evictions"]}, metric_type="counter"
+    )
+    lines += metrics.gauge_lines(
+        "imprime_result_cache_bytes", "Bytes currently stored in the result cache", {(): stats["bytes"]}
+    )
+    lines += metrics.gauge_lines(
+        "imprime_result_cache_hit_ratio", "Result cache hit ratio since start", {(): stats["hit_rate"]}
+    )
+    return lines
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: float) -> str:
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """ASGI middleware: in-flight gauge, request latency/status and the Server-Timing header"""
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        profile = self._memory_profile(scope)
+        memory_token = _request_memory.set(profile)
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                value = server_timing_header(timings, time.perf_counter() - start)
+                headers.append((b"server-timing", value.encode("latin-1")))
+                if profile is not None:
+                    profile.stop()
+                    for line in profile.report_lines():
+                        print(f"[MEM] {scope.get('path')} {line}")
+                    headers.append((MEMORY_PROFILE_HEADER, profile.header_value().encode("latin-1", "replace")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        metrics.in_flight.inc(service=metrics.service)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            metrics.in_flight.dec(service=metrics.service)
+            _request_timings.reset(token)
+            _request_memory.reset(memory_token)
+            if profile is not None:
+                profile.stop()
+            # Route template (/api/jobs/{job_id}), not the raw path, to keep the series bounded
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            metrics.request_seconds.observe(time.perf_counter() - start, service=metrics.service, route=route)
+            metrics.requests_total.inc(service=metrics.service, route=route, status=str(status["code"]))
+
+    @staticmethod
+    def _memory_profile(scope):
+        requested = dict(scope.get("headers") or []).get(DEBUG_MEMORY_HEADER, b"0") in (b"1", b"true")
+        if not (requested or debug_memory_always()):
+            return None
+        try:
+            # scripts/memory_profile.py: on sys.path once the server added SCRIPTS_DIR
+            from memory_profile import MemoryProfiler
+        except ImportError:
+            return None
+        return MemoryProfiler().start()
+
+
+def install_metrics(app, metrics: Metrics) -> None:
+    """Add the middleware and GET /metrics to a FastAPI app"""
+    from fastapi.responses import PlainTextResponse
+
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics_endpoint():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
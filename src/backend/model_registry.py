@@ -0,0 +1,482 @@
+# -*- coding: utf-8 -*-
+"""
+Model registry with background loading and per-model readiness
+Lets the FastAPI servers bind immediately while heavy models load in a worker thread
+
+Residency: with MODEL_MEMORY_BUDGET_MB set, the registry keeps the resident models
+(weights size, or RSS growth when it cannot be measured) under that budget by unloading
+the least recently used ones. An unloaded model reloads on the next request that needs it;
+loaders read memory-mapped weights (safetensors / torch mmap, see scripts/sam_checkpoint.py),
+so a reload mostly maps pages that are still in the OS page cache instead of re-reading disk.
+A model pinned by a request (acquire/release) is never evicted: dropping it would not free
+its memory while the request still holds it, and the budget would be overshot.
+"""
+
+import asyncio
+import ctypes
+import gc
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import current_rss
+
+
+def warmup_config() -> Tuple[bool, List[Tuple[int, int]], int]:
+    """
+    Read warmup settings from the environment
+    MODEL_WARMUP=0 disables it, MODEL_WARMUP_SIZES="1024x1024,2048x1536", MODEL_WARMUP_RUNS=3
+    """
+    enabled = os.environ.get("MODEL_WARMUP", "1").lower() not in ("0", "false", "no")
+    sizes = []
+    for item in os.environ.get("MODEL_WARMUP_SIZES", "1024x1024").split(","):
+        if "x" in item:
+            w, h = item.lower().split("x", 1)
+            sizes.append((int(w), int(h)))
+    runs = max(1, int(os.environ.get("MODEL_WARMUP_RUNS", "2")))
+    return enabled, sizes or [(1024, 1024)], runs
+
+
+def memory_budget_from_env() -> Optional[int]:
+    """MODEL_MEMORY_BUDGET_MB in bytes (unset or 0: no budget, every model stays resident)"""
+    value = float(os.environ.get("MODEL_MEMORY_BUDGET_MB", "0") or 0)
+    return int(value * 2**20) if value > 0 else None
+
+
+def model_nbytes(value: Any) -> Optional[int]:
+    """
+    Size of a loaded model's weights: parameters + buffers of torch modules (shared tensors
+    counted once), looking inside predictors (.model) and (model, device) tuples.
+    None when nothing measurable was found (e.g. ONNX Runtime sessions)
+    """
+    seen = set()
+    total = 0
+    found = False
+    pending = [value]
+    while pending:
+        item = pending.pop()
+        if isinstance(item, (tuple, list)):
+            pending.extend(item)
+            continue
+        if hasattr(item, "parameters") and hasattr(item, "buffers"):
+            found = True
+            for tensor in list(item.parameters()) + list(item.buffers()):
+                key = (tensor.device.type, tensor.data_ptr())
+                if key not in seen:
+                    seen.add(key)
+                    total += tensor.numel() * tensor.element_size()
+        elif hasattr(item, "model") and item.model is not item:
+            pending.append(item.model)
+    return total if found else None
+
+
+def release_memory() -> None:
+    """Return freed model memory to the OS (GC, CUDA cache, glibc heap trim)"""
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    if sys.platform.startswith("linux"):
+        try:
+            ctypes.CDLL("libc.so.6").malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+
+def synthetic_image(width: int, height: int) -> np.ndarray:
+    """Dummy RGB artwork (gradient background + solid shape) used to prime kernels"""
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[..., 0] = x.astype(np.uint8)
+    image[..., 1] = y.astype(np.uint8)
+    image[..., 2] = 128
+    image[height // 4: 3 * height // 4, width // 4: 3 * width // 4] = (230, 30, 30)
+    return image
+
+
+class ModelNotReady(Exception):
+    """Raised when a caller asked to fail fast and the model is still loading"""
+
+    def __init__(self, name: str, state: str):
+        super().__init__(f"Model '{name}' not ready (state: {state})")
+        self.name = name
+        self.state = state
+
+
+class ModelSlot:
+    """Holds one model, its loader and its loading state"""
+
+    PENDING = "pending"
+    LOADING = "loading"
+    WARMING = "warming"
+    READY = "ready"
+    FAILED = "failed"
+    UNAVAILABLE = "unavailable"
+    UNLOADED = "unloaded"  # evicted (or never loaded under a budget); loads on the next request
+
+    def __init__(
+        self,
+        name: str,
+        loader: Callable[[], Any],
+        available: bool = True,
+        warmup: Optional[Callable[[Any, np.ndarray], Any]] = None,
+        unloader: Optional[Callable[[Any], Any]] = None,
+    ):
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.unloader = unloader
+        self.value = None
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.memory_bytes: Optional[int] = None
+        self.warmup_stats: Optional[Dict[str, Any]] = None
+        self.loads = 0
+        self.evictions = 0
+        self.last_used = 0.0
+        self.in_use = 0  # requests holding the model (acquire/release); never evicted while > 0
+        self.state = self.PENDING if available else self.UNAVAILABLE
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        if not available:
+            self._done.set()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == self.READY
+
+    @property
+    def settled(self) -> bool:
+        """True once loading finished, successfully or not (an unloaded slot is settled too)"""
+        return self._done.is_set()
+
+    @property
+    def resident_bytes(self) -> int:
+        """Memory charged against the budget (0 unless loaded)"""
+        return (self.memory_bytes or 0) if self.state in (self.READY, self.WARMING) else 0
+
+    def touch(self) -> None:
+        self.last_used = time.monotonic()
+
+    def acquire(self) -> Any:
+        """Pin the loaded model against eviction and return it; None (not pinned) if not loaded"""
+        with self._lock:
+            if self.state != self.READY or self.value is None:
+                return None
+            self.in_use += 1
+            self.touch()
+            return self.value
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def mark_unloaded(self) -> None:
+        """Pending slot left for on-demand loading (the budget is already used up)"""
+        with self._lock:
+            if self.state == self.PENDING:
+                self.state = self.UNLOADED
+                self._done.set()
+
+    def load(self) -> Any:
+        """Run the loader synchronously (no-op unless pending or unloaded)"""
+        with self._lock:
+            if self.state not in (self.PENDING, self.UNLOADED):
+                return self.value
+
+            reload = self.loads > 0
+            self._done.clear()
+            self.state = self.LOADING
+            self.load_seconds = None
+            start = time.perf_counter()
+            rss_before = current_rss()
+            try:
+                value = self.loader()
+                if value is None:
+                    raise RuntimeError("loader returned no model")
+                self.value = value
+                self.loads += 1
+                self.load_seconds = time.perf_counter() - start
+                # Weights size when measurable; otherwise the RSS growth (models load one at a time,
+                # so it is this model's). A reload keeps the first measurement: freed pages may not
+                # have gone back to the OS, which makes the RSS delta of a reload meaningless.
+                measured = model_nbytes(value)
+                rss_after = current_rss()
+                if measured is not None:
+                    self.memory_bytes = measured
+                elif not reload and rss_before is not None and rss_after is not None:
+                    self.memory_bytes = max(0, rss_after - rss_before)
+                # Kernels and allocator pools are already primed after the first load
+                if not reload:
+                    self._run_warmup()
+                self.state = self.READY
+                self.touch()
+            except Exception as e:
+                self.error = str(e)
+                self.state = self.FAILED
+                print(f"[MODELS] Falha ao carregar '{self.name}': {e}")
+            finally:
+                if self.load_seconds is None:
+                    self.load_seconds = time.perf_counter() - start
+                self._done.set()
+
+        return self.value
+
+    def unload(self) -> bool:
+        """Drop the model; False if not loaded or still pinned by a request"""
+        with self._lock:
+            if self.state != self.READY or self.in_use:
+                return False
+            value, self.value = self.value, None
+            if self.unloader is not None:
+                try:
+                    self.unloader(value)
+                except Exception as e:
+                    print(f"[MODELS] Erro ao descarregar '{self.name}' (ignorado): {e}")
+            del value
+            self.state = self.UNLOADED
+            self.evictions += 1
+        release_memory()
+        return True
+
+    def _run_warmup(self) -> None:
+        """Run dummy inferences so allocator growth and kernel selection happen before real traffic"""
+        enabled, sizes, runs = warmup_config()
+        if self.warmup is None or not enabled:
+            return
+
+        self.state = self.WARMING
+        stats = {"sizes": [], "cold_ms": None, "warm_ms": None}
+        cold = []
+        warm = []
+        try:
+            for width, height in sizes:
+                image = synthetic_image(width, height)
+                timings = []
+                for _ in range(runs):
+                    start = time.perf_counter()
+                    self.warmup(self.value, image)
+                    timings.append((time.perf_counter() - start) * 1000)
+                cold.append(timings[0])
+                warm.extend(timings[1:])
+                stats["sizes"].append({
+                    "size": f"{width}x{height}",
+                    "cold_ms": round(timings[0], 1),
+                    "warm_ms": round(sum(timings[1:]) / len(timings[1:]), 1) if len(timings) > 1 else None,
+                })
+            stats["cold_ms"] = round(cold[0], 1)
+            stats["warm_ms"] = round(sum(warm) / len(warm), 1) if warm else None
+            print(f"[MODELS] Warmup '{self.name}': frio {stats['cold_ms']}ms, quente {stats['warm_ms']}ms")
+        except Exception as e:
+            # Warmup failure never makes the model unusable
+            stats["error"] = str(e)
+            print(f"[MODELS] Warmup de '{self.name}' falhou (não crítico): {e}")
+        self.warmup_stats = stats
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until loading finished; returns False on timeout"""
+        return self._done.wait(timeout)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "ready": self.ready,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "memory_mb": round(self.memory_bytes / 2**20, 1) if self.memory_bytes is not None else None,
+            "warmup": self.warmup_stats,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "in_use": self.in_use,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1) if self.last_used else None,
+            "error": self.error,
+        }
+
+
+class ModelRegistry:
+    """
+    Registry of named model slots loaded sequentially in a background thread
+    memory_budget (bytes, default MODEL_MEMORY_BUDGET_MB): resident models are kept under it
+    by unloading the least recently used ones; unloaded models reload on demand
+    """
+
+    def __init__(self, wait_timeout: float = 300.0, memory_budget: Optional[int] = None):
+        self.wait_timeout = wait_timeout
+        self.memory_budget = memory_budget if memory_budget is not None else memory_budget_from_env()
+        self._slots: Dict[str, ModelSlot] = {}
+        self._thread: Optional[threading.Thread] = None
+        # Loads and evictions are serialized so two reloads cannot both fit in the same headroom
+        self._residency_lock = threading.RLock()
+        self._reloads: Dict[str, threading.Thread] = {}
+        self._reloads_lock = threading.Lock()
+
+    def register(
+        self,
+        name: str,
+        loader: Callable[[], Any],
+        available: bool = True,
+        warmup: Optional[Callable[[Any, np.ndarray], Any]] = None,
+        unloader: Optional[Callable[[Any], Any]] = None,
+    ) -> ModelSlot:
+        slot = ModelSlot(name, loader, available, warmup, unloader)
+        self._slots[name] = slot
+        return slot
+
+    def slot(self, name: str) -> ModelSlot:
+        return self._slots[name]
+
+    def get(self, name: str) -> Any:
+        """Return the loaded model or None (never blocks)"""
+        slot = self._slots.get(name)
+        return slot.value if slot is not None and slot.ready else None
+
+    def names(self) -> List[str]:
+        return list(self._slots)
+
+    def resident_bytes(self) -> int:
+        return sum(slot.resident_bytes for slot in self._slots.values())
+
+    def _evict_until(self, needed: int, keep: str) -> None:
+        """Unload least recently used models until `needed` more bytes fit in the budget"""
+        while self.resident_bytes() + needed > self.memory_budget:
+            # A pinned model stays: unloading it frees nothing until its requests finish
+            victims = [slot for slot in self._slots.values()
+                       if slot.ready and slot.name != keep and not slot.in_use]
+            if not victims:
+                if needed or self.resident_bytes() > self.memory_budget:
+                    busy = [slot.name for slot in self._slots.values() if slot.ready and slot.in_use and slot.name != keep]
+                    print(f"[MODELS] Orçamento de {self.memory_budget / 2**20:.0f}MB excedido por '{keep}' "
+                          f"({self.resident_bytes() / 2**20:.0f}MB residentes"
+                          f"{', em uso: ' + ', '.join(busy) if busy else ''})")
+                return
+            victim = min(victims, key=lambda slot: slot.last_used)
+            freed = victim.resident_bytes
+            if victim.unload():
+                print(f"[MODELS] '{victim.name}' descarregado (LRU, {freed / 2**20:.0f}MB) para '{keep}'")
+
+    def ensure_loaded(self, name: str) -> Any:
+        """
+        Load (or reload) a model synchronously within the memory budget
+        Makes room first when the model's size is known from an earlier load, then trims again
+        with the measured size.
+        """
+        slot = self._slots[name]
+        slot.touch()
+        value = slot.value
+        if slot.ready and value is not None:
+            return value
+        if slot.state in (ModelSlot.LOADING, ModelSlot.WARMING):
+            # Another caller is (re)loading it: wait for that load instead of returning None
+            slot.wait(self.wait_timeout)
+        with self._residency_lock:
+            # Re-checked under the lock: the load may have finished, or been evicted, meanwhile
+            if slot.state in (ModelSlot.PENDING, ModelSlot.UNLOADED):
+                if self.memory_budget is not None:
+                    self._evict_until(slot.memory_bytes or 0, keep=name)
+                if slot.loads:
+                    print(f"[MODELS] Recarregando '{name}' sob demanda...")
+                slot.load()
+                if self.memory_budget is not None and slot.ready:
+                    self._evict_until(0, keep=name)
+            return slot.value if slot.ready else None
+
+    def reload_in_background(self, name: str) -> None:
+        """Start (re)loading an unloaded model without waiting for it (one reload thread per model)"""
+        with self._reloads_lock:
+            thread = self._reloads.get(name)
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=self.ensure_loaded, args=(name,),
+                                      name=f"model-reload-{name}", daemon=True)
+            self._reloads[name] = thread
+            thread.start()
+
+    def start_background_loading(self) -> None:
+        """
+        Load every pending slot in registration order without blocking the caller
+        With a memory budget, loading stops once the budget is used up; the remaining
+        slots are left unloaded and load on their first request.
+        """
+        if self._thread is not None:
+            return
+
+        def _run():
+            for slot in list(self._slots.values()):
+                if slot.settled:
+                    continue
+                if self.memory_budget is not None and self.resident_bytes() >= self.memory_budget:
+                    slot.mark_unloaded()
+                    print(f"[MODELS] '{slot.name}': orçamento de memória cheio, carrega sob demanda")
+                    continue
+                print(f"[MODELS] Carregando '{slot.name}' em segundo plano...")
+                self.ensure_loaded(slot.name)
+                print(f"[MODELS] '{slot.name}': {slot.state} ({slot.load_seconds:.2f}s)")
+
+        self._thread = threading.Thread(target=_run, name="model-loader", daemon=True)
+        self._thread.start()
+
+    async def wait_ready(self, name: str, fail_fast: bool = False) -> Any:
+        """
+        Wait until the named model finished loading and return it (None if it failed)
+        An unloaded model is reloaded here. With fail_fast=True, raise ModelNotReady instead of waiting
+        """
+        slot = self._slots[name]
+        slot.touch()
+        if not slot.settled:
+            if fail_fast:
+                raise ModelNotReady(name, slot.state)
+            finished = await asyncio.get_running_loop().run_in_executor(
+                None, slot.wait, self.wait_timeout
+            )
+            if not finished:
+                raise ModelNotReady(name, slot.state)
+        if slot.state in (ModelSlot.FAILED, ModelSlot.UNAVAILABLE):
+            return None
+        value = slot.value
+        if slot.ready and value is not None:
+            return value
+        # Unloaded, or being reloaded by another request: ensure_loaded waits for that load
+        if fail_fast:
+            # Fail-fast clients never wait, so something else has to bring the model back
+            self.reload_in_background(name)
+            raise ModelNotReady(name, slot.state)
+        return await asyncio.get_running_loop().run_in_executor(None, self.ensure_loaded, name)
+
+    async def acquire(self, name: str, fail_fast: bool = False) -> Any:
+        """
+        wait_ready() and pin the model: it is not evicted until release(name)
+        Returns None (nothing pinned) if the model failed or is unavailable
+        """
+        while True:
+            value = await self.wait_ready(name, fail_fast=fail_fast)
+            if value is None:
+                return None
+            pinned = self._slots[name].acquire()
+            if pinned is not None:
+                return pinned
+            # Evicted between wait_ready and the pin: wait for (or trigger) the reload again
+
+    def release(self, name: str) -> None:
+        self._slots[name].release()
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {name: slot.status() for name, slot in self._slots.items()}
+
+    def residency(self) -> Dict[str, Any]:
+        """Budget, resident models (most recently used first) and load/eviction counters"""
+        resident = sorted((slot for slot in self._slots.values() if slot.resident_bytes or slot.ready),
+                          key=lambda slot: slot.last_used, reverse=True)
+        return {
+            "budget_mb": round(self.memory_budget / 2**20, 1) if self.memory_budget is not None else None,
+            "resident_mb": round(self.resident_bytes() / 2**20, 1),
+            "resident": [slot.name for slot in resident],
+            "loads": sum(slot.loads for slot in self._slots.values()),
+            "evictions": sum(slot.evictions for slot in self._slots.values()),
+        }
+
+    def all_settled(self) -> bool:
+        return all(slot.settled for slot in self._slots.values())
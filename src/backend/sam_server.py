@@ -4,60 +4,85 @@ FastAPI server for SAM-based image segmentation
 Provides endpoints for intelligent background removal with Segment Anything Model
 """
 
-from fastapi import FastAPI, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import APIRouter, HTTPException
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import numpy as np
-import cv2
 from PIL import Image
 import io
-import base64
-import uvicorn
+import asyncio
+import importlib.util
+import time
 import os
 import sys
-import requests
 from pathlib import Path
 
-# Check for SAM availability
-SAM_AVAILABLE = False
-REMBG_AVAILABLE = False
-
-try:
-    from segment_anything import sam_model_registry, SamPredictor
-    SAM_AVAILABLE = True
+# Shared app setup, model registry, jobs, thread pool and decode/encode layer (also puts the
+# CLI scripts directory, src/main/modules/upscayl/scripts, on sys.path)
+from server_core import (
+    create_app, serve, shared, decode_base64_bytes, decode_base64_image, decode_base64_to_pil,
+    encode_image_to_base64, encode_image_to_png, encode_mask_to_base64, open_image_bytes, png_to_base64,
+)
+from model_registry import ModelNotReady
+from jobs import JobCancelled
+from image_io import Payload, open_base64
+
+from sam_checkpoint import build_sam
+from model_downloader import download, percent_printer
+from sam_embedding_cache import EmbeddingCache, array_digest, cache_enabled
+from sam_roi import roi_from_box, roi_from_points, predict_in_roi, paste_mask
+from result_cache import ResultCache, bytes_digest
+from image_probe import ProbeError, as_dict, probe
+
+# Check for SAM availability without importing the heavy packages.
+# segment_anything, rembg, cv2 and torch are imported lazily by the code that needs them,
+# so the server binds and answers /health immediately.
+SAM_AVAILABLE = importlib.util.find_spec("segment_anything") is not None
+REMBG_AVAILABLE = importlib.util.find_spec("rembg") is not None
+
+if SAM_AVAILABLE:
     print("[SAM] Segment Anything Model disponível")
-except ImportError:
+else:
     print("[SAM] segment_anything não instalado. Usando modo fallback.")
 
-try:
-    from rembg import remove as rembg_remove
-    REMBG_AVAILABLE = True
+if REMBG_AVAILABLE:
     print("[REMBG] rembg disponível para refinamento")
-except ImportError:
+else:
     print("[REMBG] rembg não instalado. Refinamento simplificado.")
 
-app = FastAPI(
-    title="SAM Background Removal API",
-    version="1.0.0",
-    description="API para remoção inteligente de fundo usando SAM e refinamento"
-)
-
-# Enable CORS for Electron renderer
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Process-wide state: when inference_server.py hosts this module, BiRefNet shares all of it
+core = shared("sam")
+metrics = core.metrics
 
-# Global model instances
-sam_predictor = None
+# Global model instances (loaded in background, see startup_event)
+models = core.models
 MODEL_DIR = Path(__file__).parent / "models"
 SAM_CHECKPOINT_URL = "https://dl.fbaipublicfiles.com/segment_anything/sam_vit_b_01ec64.pth"
 SAM_CHECKPOINT_NAME = "sam_vit_b_01ec64.pth"
+SAM_MODEL_ID = "vit_b:" + SAM_CHECKPOINT_NAME
+
+# Progressive jobs (preview now, refined result over SSE)
+jobs = core.jobs
+PREVIEW_MAX_SIDE = 512
+# Rows per stripe in the color-similarity fallback (bounds its float32 temporaries)
+FALLBACK_STRIPE_ROWS = 256
+
+# Disk cache for ROI (zoom mode) crop embeddings
+roi_embedding_cache = EmbeddingCache() if cache_enabled() else None
+
+# Content-addressed cache of finished results, shared with tester_server and the CLI removers.
+# rembg u2net + default alpha matting is the same key background_remover_highprecision.py uses.
+result_cache = core.result_cache
+REMBG_CACHE_PARAMS = {"alpha_matting": True, "remove_blacks": None}
+
+# Routes live on a router so inference_server.py can mount them next to the other engines
+router = APIRouter()
+
+# Interactive segmentation: the SAM predictor is stateful, so requests take turns on it.
+# sam_image_key is the digest of the image currently embedded in the predictor.
+sam_lock = asyncio.Lock()
+sam_image_key: Optional[str] = None
 
 
 # Request/Response Models
@@ -77,11 +102,15 @@ class Box(BaseModel):
 class SegmentPointsRequest(BaseModel):
     points: List[Point]
     image_base64: str
+    zoom: bool = False  # segment a native-resolution ROI around the prompt
+    session_id: Optional[str] = None  # newer requests on the same session cancel older ones
 
 
 class SegmentBoxRequest(BaseModel):
     box: Box
     image_base64: str
+    zoom: bool = False  # segment a native-resolution ROI around the prompt
+    session_id: Optional[str] = None  # newer requests on the same session cancel older ones
 
 
 class RefineMaskRequest(BaseModel):
@@ -93,69 +122,37 @@ class AutoRemoveRequest(BaseModel):
     image_base64: str
 
 
-# Helper functions
-def decode_base64_image(base64_str: str) -> np.ndarray:
-    """Decode base64 string to numpy array (RGB format)"""
-    try:
-        if "base64," in base64_str:
-            base64_str = base64_str.split("base64,")[1]
-        
-        image_bytes = base64.b64decode(base64_str)
-        image = Image.open(io.BytesIO(image_bytes))
-        image_np = np.array(image.convert("RGB"))
-        return image_np
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid image data: {str(e)}")
-
-
-def decode_base64_to_pil(base64_str: str) -> Image.Image:
-    """Decode base64 string to PIL Image"""
-    try:
-        if "base64," in base64_str:
-            base64_str = base64_str.split("base64,")[1]
-        
-        image_bytes = base64.b64decode(base64_str)
-        return Image.open(io.BytesIO(image_bytes))
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid image data: {str(e)}")
+class ProbeRequest(BaseModel):
+    image_base64: str
 
 
-def encode_mask_to_base64(mask: np.ndarray) -> str:
-    """Encode numpy mask array to base64 PNG"""
-    try:
-        if mask.dtype != np.uint8:
-            if mask.max() <= 1.0:
-                mask = (mask * 255).astype(np.uint8)
-            else:
-                mask = mask.astype(np.uint8)
-        
-        pil_image = Image.fromarray(mask, mode='L')
-        buffer = io.BytesIO()
-        pil_image.save(buffer, format='PNG')
-        buffer.seek(0)
-        
-        base64_str = base64.b64encode(buffer.read()).decode('utf-8')
-        return f"data:image/png;base64,{base64_str}"
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error encoding mask: {str(e)}")
+# Helper functions (decode / encode: see server_core)
+def rembg_cache_key(image_bytes: Payload) -> Optional[str]:
+    """Result cache key for rembg u2net + alpha matting on these input bytes"""
+    if result_cache is None:
+        return None
+    return ResultCache.make_key(bytes_digest(image_bytes), "rembg", "u2net", REMBG_CACHE_PARAMS)
 
 
-def encode_image_to_base64(image: Image.Image) -> str:
-    """Encode PIL Image to base64 PNG"""
-    try:
-        buffer = io.BytesIO()
-        image.save(buffer, format='PNG')
-        buffer.seek(0)
-        
-        base64_str = base64.b64encode(buffer.read()).decode('utf-8')
-        return f"data:image/png;base64,{base64_str}"
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error encoding image: {str(e)}")
+def rembg_cutout_png(session, pil_image: Image.Image, cache_key: Optional[str]) -> bytes:
+    """rembg with alpha matting, encoded as PNG and stored in the result cache"""
+    from rembg import remove as rembg_remove
+    
+    with core.inference(), metrics.stage("rembg"):
+        result = rembg_remove(pil_image, session=session, alpha_matting=True)
+    with metrics.stage("encode"):
+        png_bytes = encode_image_to_png(result)
+    if cache_key is not None:
+        try:
+            with metrics.stage("cache-store"):
+                result_cache.put(cache_key, png_bytes)
+        except OSError as e:
+            print(f"[CACHE] Não foi possível gravar o resultado: {e}")
+    return png_bytes
 
 
 def download_sam_model():
-    """Download SAM model checkpoint if not exists"""
-    MODEL_DIR.mkdir(parents=True, exist_ok=True)
+    """Download SAM model checkpoint if not exists (resumable, verified, atomic)"""
     checkpoint_path = MODEL_DIR / SAM_CHECKPOINT_NAME
     
     if checkpoint_path.exists():
@@ -167,21 +164,8 @@ def download_sam_model():
     print(f"[SAM] Destino: {checkpoint_path}")
     
     try:
-        response = requests.get(SAM_CHECKPOINT_URL, stream=True)
-        response.raise_for_status()
-        
-        total_size = int(response.headers.get('content-length', 0))
-        downloaded = 0
-        
-        with open(checkpoint_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-                downloaded += len(chunk)
-                if total_size:
-                    progress = (downloaded / total_size) * 100
-                    print(f"\r[SAM] Download: {progress:.1f}%", end="", flush=True)
-        
-        print(f"\n[SAM] Download concluído: {checkpoint_path}")
+        download(SAM_CHECKPOINT_URL, str(checkpoint_path), progress=percent_printer("[SAM] ", sys.stdout, step=10))
+        print(f"[SAM] Download concluído: {checkpoint_path}")
         return str(checkpoint_path)
     except Exception as e:
         print(f"[SAM] Erro ao baixar modelo: {e}")
@@ -189,22 +173,22 @@ def download_sam_model():
 
 
 def initialize_sam():
-    """Initialize SAM model"""
-    global sam_predictor
-    
+    """Initialize SAM model (runs in the background loader thread)"""
     if not SAM_AVAILABLE:
         print("[SAM] segment_anything não disponível")
-        return False
+        return None
     
     try:
+        from segment_anything import SamPredictor
+        
         checkpoint_path = download_sam_model()
         if not checkpoint_path:
-            return False
+            return None
         
         print("[SAM] Carregando modelo SAM...")
         
-        # Use ViT-B (smaller, faster)
-        sam = sam_model_registry["vit_b"](checkpoint=checkpoint_path)
+        # Use ViT-B (smaller, faster); weights are memory-mapped from a converted copy
+        sam = build_sam("vit_b", checkpoint_path)
         
         # Use CUDA if available
         device = "cuda" if os.environ.get("CUDA_VISIBLE_DEVICES") else "cpu"
@@ -219,109 +203,271 @@ def initialize_sam():
             print("[SAM] Usando CPU (torch não detectado)")
         
         sam.to(device=device)
-        sam_predictor = SamPredictor(sam)
+        predictor = SamPredictor(sam)
         
         print("[SAM] Modelo SAM carregado com sucesso!")
-        return True
+        return predictor
     except Exception as e:
         print(f"[SAM] Erro ao carregar modelo: {e}")
-        return False
+        return None
+
+
+def initialize_rembg():
+    """Create the rembg session once, instead of on every rembg.remove() call"""
+    from rembg import new_session
+    print("[REMBG] Carregando sessão u2net...")
+    return new_session("u2net")
+
+
+def warmup_sam(predictor, image: np.ndarray):
+    """Dummy encoder + decoder pass (point prompt at the center)"""
+    h, w = image.shape[:2]
+    predictor.set_image(image)
+    predictor.predict(
+        point_coords=np.array([[w // 2, h // 2]]),
+        point_labels=np.array([1]),
+        multimask_output=True
+    )
+    predictor.reset_image()
+
+
+def warmup_rembg(session, image: np.ndarray):
+    """Dummy rembg pass (primes the ONNX Runtime graph optimizations)"""
+    from rembg import remove as rembg_remove
+    rembg_remove(Image.fromarray(image), session=session)
+
+
+# No unloader needed: requests pin the model (require_model / models.release), and the registry
+# never evicts a pinned one. A reloaded predictor starts without an image, so
+# set_predictor_image never reuses the stale sam_image_key.
+models.register("sam", initialize_sam, available=SAM_AVAILABLE, warmup=warmup_sam)
+models.register("rembg", initialize_rembg, available=REMBG_AVAILABLE, warmup=warmup_rembg)
+
+
+async def require_model(name: str, fail_fast: bool = False):
+    """
+    Wait for a model to finish loading and pin it against LRU eviction; 503 if the caller
+    asked to fail fast. A returned model must be given back with models.release(name)
+    """
+    try:
+        if models.slot(name).settled:
+            return await models.acquire(name, fail_fast=fail_fast)
+        with metrics.queue(f"model-{name}"):
+            return await models.acquire(name, fail_fast=fail_fast)
+    except ModelNotReady as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Model '{e.name}' is still loading ({e.state})",
+            headers={"Retry-After": "2"},
+        )
 
 
 # API Endpoints
 
-@app.get("/")
+@router.get("/")
 async def root():
     """Health check endpoint"""
     return {
         "status": "ok",
         "service": "SAM Background Removal API",
         "version": "1.0.0",
-        "sam_available": SAM_AVAILABLE and sam_predictor is not None,
+        "sam_available": models.get("sam") is not None,
         "rembg_available": REMBG_AVAILABLE
     }
 
 
-@app.get("/health")
+@router.get("/health")
 async def health():
-    """Check if models are loaded"""
+    """Check if models are loaded (answers immediately, even while loading)"""
     return {
-        "status": "ok",
-        "sam_loaded": sam_predictor is not None,
-        "rembg_available": REMBG_AVAILABLE
+        "status": "ok" if models.all_settled() else "loading",
+        "sam_loaded": models.get("sam") is not None,
+        "rembg_available": REMBG_AVAILABLE,
+        "models": models.status(),
+        "residency": models.residency(),
+        "result_cache": result_cache.stats() if result_cache is not None else None
     }
 
 
-@app.post("/api/segment/points")
-async def segment_with_points(request: SegmentPointsRequest):
-    """Generate segmentation mask based on user-clicked points"""
+def set_predictor_image(predictor, image: np.ndarray):
+    """set_image() unless the predictor already holds this image (repeated clicks on one artwork)"""
+    global sam_image_key
+    key = array_digest(image)
+    reuse = key == sam_image_key and predictor.is_image_set
+    metrics.cache("sam_predictor_image", reuse)
+    if not reuse:
+        sam_image_key = None
+        predictor.set_image(image)
+        sam_image_key = key
+
+
+def sam_segment_stages(job, predictor, image: np.ndarray, prompt: dict, roi):
+    """
+    Embed -> decode-mask -> encode, with a cancellation point before each stage
+    (runs in the executor while holding sam_lock)
+    """
+    global sam_image_key
+    job.check("embed")
+    start = time.perf_counter()
+    if roi is not None:
+        # Zoom mode: embed only a native-resolution crop around the prompt
+        sam_image_key = None
+        embedded = []
+        
+        def on_embedded():
+            embedded.append(time.perf_counter())
+            metrics.observe_stage("embed", embedded[0] - start)
+            job.check("decode-mask")
+        
+        masks, scores, cached = predict_in_roi(
+            predictor, image, roi,
+            cache=roi_embedding_cache, model_id=SAM_MODEL_ID,
+            on_embedded=on_embedded,
+            **prompt
+        )
+        metrics.cache("sam_roi_embedding", cached)
+        metrics.observe_stage("decode-mask", time.perf_counter() - embedded[0])
+    else:
+        with metrics.stage("embed"):
+            set_predictor_image(predictor, image)
+        job.check("decode-mask")
+        with metrics.stage("decode-mask"):
+            masks, scores, logits = predictor.predict(multimask_output=True, **prompt)
+    
+    # Get best mask (highest score)
+    best_idx = np.argmax(scores)
+    best_mask = masks[best_idx]
+    best_score = float(scores[best_idx])
+    if roi is not None:
+        best_mask = paste_mask(best_mask, roi, image.shape)
+    
+    job.check("encode")
+    with metrics.stage("encode"):
+        mask_uint8 = (best_mask * 255).astype(np.uint8)
+        return encode_mask_to_base64(mask_uint8), best_score
+
+
+def run_inference(function, *args):
+    """Run a model call while holding one of the process' inference slots (see server_core)"""
+    with core.inference():
+        return function(*args)
+
+
+async def run_segment_job(request, fail_fast: bool, prompt: dict, roi_for, fallback):
+    """
+    Shared point/box pipeline: decode -> (wait for the predictor) -> embed -> decode-mask -> encode.
+    Each request gets a job id; a newer request with the same session_id supersedes it,
+    and the stale request stops at its next stage boundary with a 409.
+    """
+    job = jobs.create("segment", session=request.session_id)
+    sam_predictor = None
     try:
-        image = decode_base64_image(request.image_base64)
+        sam_predictor = await require_model("sam", fail_fast)
+        job.check("decode")
+        image = await asyncio.to_thread(decode_base64_image, request.image_base64)
         
         if sam_predictor is None:
-            # Fallback: simple threshold-based segmentation
-            return await fallback_segment(image, request.points)
-        
-        # Set image for SAM
-        sam_predictor.set_image(image)
-        
-        # Extract points and labels
-        points = np.array([[p.x, p.y] for p in request.points])
-        labels = np.array([p.label for p in request.points])
-        
-        # Generate masks
-        masks, scores, logits = sam_predictor.predict(
-            point_coords=points,
-            point_labels=labels,
-            multimask_output=True
-        )
-        
-        # Get best mask (highest score)
-        best_idx = np.argmax(scores)
-        best_mask = masks[best_idx]
-        best_score = float(scores[best_idx])
-        
-        # Convert to uint8
-        mask_uint8 = (best_mask * 255).astype(np.uint8)
+            response = await fallback(image)
+            job.publish("result", {"success": True, "fallback": True})
+            return response
+        
+        roi = roi_for(image.shape) if request.zoom else None
+        job.check("queued")
+        with metrics.queue("predictor"):
+            await sam_lock.acquire()
+        try:
+            # to_thread (not run_in_executor) keeps the request context: stages land in Server-Timing
+            mask_b64, best_score = await asyncio.to_thread(
+                run_inference, sam_segment_stages, job, sam_predictor, image, prompt, roi
+            )
+        finally:
+            sam_lock.release()
+        job.check()
+        job.publish("result", {"success": True, "confidence": best_score})
         
         return JSONResponse(content={
             "success": True,
-            "mask": encode_mask_to_base64(mask_uint8),
+            "job_id": job.id,
+            "mask": mask_b64,
             "confidence": best_score
         })
         
+    except JobCancelled as e:
+        return JSONResponse(status_code=409, content={
+            "success": False,
+            "cancelled": True,
+            "job_id": job.id,
+            "reason": e.reason,
+            "stage": job.stage
+        })
     except HTTPException as he:
+        job.publish("error", {"success": False, "error": str(he.detail)})
         raise he
     except Exception as e:
+        job.publish("error", {"success": False, "error": str(e)})
         raise HTTPException(status_code=500, detail=f"Segmentation failed: {str(e)}")
+    except asyncio.CancelledError:
+        job.cancel("request cancelled")
+        raise
+    finally:
+        if sam_predictor is not None:
+            models.release("sam")
+        # Anything else that escaped (BaseException) must still finish the job: the store only
+        # expires finished jobs, and /api/jobs/{id}/events streams until a terminal event
+        if not job.terminal:
+            job.publish("error", {"success": False, "error": "Segmentation aborted"})
+
+
+@router.post("/api/segment/points")
+async def segment_with_points(request: SegmentPointsRequest, fail_fast: bool = False):
+    """Generate segmentation mask based on user-clicked points"""
+    # Extract points and labels
+    points = np.array([[p.x, p.y] for p in request.points])
+    labels = np.array([p.label for p in request.points])
+    
+    return await run_segment_job(
+        request, fail_fast,
+        prompt={"point_coords": points, "point_labels": labels},
+        roi_for=lambda shape: roi_from_points(points, shape),
+        # Fallback: simple threshold-based segmentation
+        fallback=lambda image: fallback_segment(image, request.points),
+    )
 
 
 async def fallback_segment(image: np.ndarray, points: List[Point]):
-    """Fallback segmentation when SAM is not available"""
+    """
+    Fallback segmentation when SAM is not available
+    Computed in row stripes: the whole-image float32 copies (image, distance, similarity,
+    blur input) never exist at once, only FALLBACK_STRIPE_ROWS rows of each.
+    """
+    import cv2
+    
     h, w = image.shape[:2]
+    colors = [image[point.y, point.x].astype(np.float32) for point in points if point.label == 1]
+    stripes = [(start, min(h, start + FALLBACK_STRIPE_ROWS)) for start in range(0, h, FALLBACK_STRIPE_ROWS)]
     
-    # Create mask based on color similarity to clicked points
-    mask = np.zeros((h, w), dtype=np.float32)
+    def color_distance(start, stop, color):
+        return np.sqrt(np.sum((image[start:stop].astype(np.float32) - color) ** 2, axis=2))
     
-    for point in points:
-        if point.label == 1:  # Foreground
-            # Get color at point
-            color = image[point.y, point.x]
-            
-            # Calculate color distance for entire image
-            diff = np.sqrt(np.sum((image.astype(np.float32) - color.astype(np.float32)) ** 2, axis=2))
-            
-            # Create soft mask based on color similarity
-            similarity = 1 - (diff / (diff.max() + 1e-6))
-            mask = np.maximum(mask, similarity)
+    # Pass 1: largest distance per clicked color (the similarity is normalized by it)
+    max_distance = [0.0] * len(colors)
+    for start, stop in stripes:
+        for index, color in enumerate(colors):
+            max_distance[index] = max(max_distance[index], float(color_distance(start, stop, color).max()))
     
-    # Apply threshold
-    mask = (mask > 0.5).astype(np.float32)
+    # Pass 2: soft mask based on color similarity, thresholded
+    mask = np.zeros((h, w), dtype=np.uint8)
+    for start, stop in stripes:
+        for color, diff_max in zip(colors, max_distance):
+            similarity = 1 - (color_distance(start, stop, color) / (np.float32(diff_max) + 1e-6))
+            mask[start:stop] |= similarity > 0.5
     
-    # Smooth edges
-    mask = cv2.GaussianBlur(mask, (5, 5), 0)
-    
-    mask_uint8 = (mask * 255).astype(np.uint8)
+    # Smooth edges: 5x5 blur per stripe with a 2-row halo (same result as blurring the whole mask)
+    mask_uint8 = np.empty((h, w), dtype=np.uint8)
+    for start, stop in stripes:
+        low, high = max(0, start - 2), min(h, stop + 2)
+        blurred = cv2.GaussianBlur(mask[low:high].astype(np.float32), (5, 5), 0)
+        mask_uint8[start:stop] = (blurred[start - low:stop - low] * 255).astype(np.uint8)
     
     return JSONResponse(content={
         "success": True,
@@ -331,49 +477,25 @@ async def fallback_segment(image: np.ndarray, points: List[Point]):
     })
 
 
-@app.post("/api/segment/box")
-async def segment_with_box(request: SegmentBoxRequest):
+@router.post("/api/segment/box")
+async def segment_with_box(request: SegmentBoxRequest, fail_fast: bool = False):
     """Generate segmentation mask based on bounding box"""
-    try:
-        image = decode_base64_image(request.image_base64)
-        
-        if sam_predictor is None:
-            # Fallback: use GrabCut
-            return await fallback_grabcut(image, request.box)
-        
-        # Set image for SAM
-        sam_predictor.set_image(image)
-        
-        # Box coordinates
-        box = np.array([request.box.x1, request.box.y1, request.box.x2, request.box.y2])
-        
-        # Generate mask
-        masks, scores, logits = sam_predictor.predict(
-            box=box,
-            multimask_output=True
-        )
-        
-        # Get best mask
-        best_idx = np.argmax(scores)
-        best_mask = masks[best_idx]
-        best_score = float(scores[best_idx])
-        
-        mask_uint8 = (best_mask * 255).astype(np.uint8)
-        
-        return JSONResponse(content={
-            "success": True,
-            "mask": encode_mask_to_base64(mask_uint8),
-            "confidence": best_score
-        })
-        
-    except HTTPException as he:
-        raise he
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Segmentation failed: {str(e)}")
+    # Box coordinates
+    box = np.array([request.box.x1, request.box.y1, request.box.x2, request.box.y2])
+    
+    return await run_segment_job(
+        request, fail_fast,
+        prompt={"box": box},
+        roi_for=lambda shape: roi_from_box(box, shape),
+        # Fallback: use GrabCut
+        fallback=lambda image: fallback_grabcut(image, request.box),
+    )
 
 
 async def fallback_grabcut(image: np.ndarray, box: Box):
     """Fallback using OpenCV GrabCut"""
+    import cv2
+    
     h, w = image.shape[:2]
     
     # Initialize mask for GrabCut
@@ -406,28 +528,43 @@ async def fallback_grabcut(image: np.ndarray, box: Box):
     })
 
 
-@app.post("/api/refine-mask")
-async def refine_mask(request: RefineMaskRequest):
+@router.post("/api/refine-mask")
+async def refine_mask(request: RefineMaskRequest, fail_fast: bool = False):
     """Refine mask using rembg for smoother edges"""
+    rembg_session = None
     try:
-        pil_image = decode_base64_to_pil(request.image_base64)
-        
-        if REMBG_AVAILABLE:
-            # Use rembg for high-quality refinement
-            result = rembg_remove(pil_image, alpha_matting=True)
+        image_bytes = decode_base64_bytes(request.image_base64)
+        with metrics.stage("cache-lookup"):
+            cache_key = rembg_cache_key(image_bytes)
+            cutout_png = result_cache.get(cache_key) if cache_key is not None else None
+        
+        if cutout_png is None:
+            rembg_session = await require_model("rembg", fail_fast)
+        
+        if cutout_png is not None or rembg_session is not None:
+            # Use rembg for high-quality refinement (same cutout as /api/auto-remove, so it is cached)
+            if cutout_png is None:
+                pil_image = open_image_bytes(image_bytes)
+                cutout_png = await asyncio.to_thread(rembg_cutout_png, rembg_session, pil_image, cache_key)
             
-            # Extract alpha channel as refined mask
-            if result.mode == 'RGBA':
-                alpha = np.array(result.split()[-1])
-            else:
-                alpha = np.array(result.convert('L'))
+            with metrics.stage("encode-mask"):
+                result = Image.open(io.BytesIO(cutout_png))
+                
+                # Extract alpha channel as refined mask
+                if result.mode == 'RGBA':
+                    alpha = np.array(result.split()[-1])
+                else:
+                    alpha = np.array(result.convert('L'))
+                refined_mask = encode_mask_to_base64(alpha)
             
             return JSONResponse(content={
                 "success": True,
-                "refined_mask": encode_mask_to_base64(alpha)
+                "refined_mask": refined_mask
             })
         else:
             # Fallback: simple edge smoothing
+            import cv2
+            
             mask_pil = decode_base64_to_pil(request.mask_base64).convert('L')
             mask = np.array(mask_pil)
             
@@ -446,26 +583,33 @@ async def refine_mask(request: RefineMaskRequest):
         raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Mask refinement failed: {str(e)}")
+    finally:
+        if rembg_session is not None:
+            models.release("rembg")
 
 
-@app.post("/api/apply-mask")
+@router.post("/api/apply-mask")
 async def apply_mask(request: RefineMaskRequest):
     """Apply mask to image and return result with transparent background"""
     try:
         pil_image = decode_base64_to_pil(request.image_base64).convert('RGB')
         mask_pil = decode_base64_to_pil(request.mask_base64).convert('L')
         
-        # Resize mask to match image if needed
-        if mask_pil.size != pil_image.size:
-            mask_pil = mask_pil.resize(pil_image.size, Image.LANCZOS)
+        with metrics.stage("compose"):
+            # Resize mask to match image if needed
+            if mask_pil.size != pil_image.size:
+                mask_pil = mask_pil.resize(pil_image.size, Image.LANCZOS)
+            
+            # Create RGBA image
+            result = pil_image.copy()
+            result.putalpha(mask_pil)
         
-        # Create RGBA image
-        result = pil_image.copy()
-        result.putalpha(mask_pil)
+        with metrics.stage("encode"):
+            result_image = encode_image_to_base64(result)
         
         return JSONResponse(content={
             "success": True,
-            "result_image": encode_image_to_base64(result)
+            "result_image": result_image
         })
         
     except HTTPException as he:
@@ -474,58 +618,145 @@ async def apply_mask(request: RefineMaskRequest):
         raise HTTPException(status_code=500, detail=f"Mask application failed: {str(e)}")
 
 
-@app.post("/api/auto-remove")
-async def auto_remove_background(request: AutoRemoveRequest):
-    """Automatically remove background using rembg"""
+@router.post("/api/probe")
+async def probe_image(request: ProbeRequest):
+    """
+    Header-only image info: format, size, mode, bit depth, DPI, ICC and alpha presence
+    Nothing is decoded beyond the header bytes (base64 bodies are read lazily, see image_io).
+    Only the image bytes are accepted, never a server-side path: the API is reachable from any
+    page in the operator's browser (CORS *), which could otherwise probe the local disk.
+    """
+    start = time.perf_counter()
+    try:
+        with metrics.stage("probe"):
+            info = probe(open_base64(request.image_base64))
+    except (OSError, ProbeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Not a readable image: {str(e)}")
+    return {"success": True, **as_dict(info), "probe_us": round((time.perf_counter() - start) * 1e6, 1)}
+
+
+def rembg_preview_mask(session, pil_image: Image.Image) -> np.ndarray:
+    """Coarse pass: rembg on a downscaled copy, no alpha matting"""
+    from rembg import remove as rembg_remove
+    
+    preview = pil_image.convert("RGB")
+    preview.thumbnail((PREVIEW_MAX_SIDE, PREVIEW_MAX_SIDE), Image.BILINEAR)
+    with core.inference():
+        result = rembg_remove(preview, session=session, only_mask=True)
+    return np.array(result.convert('L'))
+
+
+@router.post("/api/auto-remove")
+async def auto_remove_background(request: AutoRemoveRequest, fail_fast: bool = False, progressive: bool = False):
+    """
+    Automatically remove background using rembg
+    With ?progressive=true, answers with a low-res mask preview and a job id;
+    the full-resolution result follows on /api/jobs/{job_id}/events
+    """
+    rembg_session = None
     try:
-        if not REMBG_AVAILABLE:
+        image_bytes = decode_base64_bytes(request.image_base64)
+        with metrics.stage("cache-lookup"):
+            cache_key = rembg_cache_key(image_bytes)
+            cached = result_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            # Same artwork already processed (here, by the CLI or by /api/refine-mask)
+            return JSONResponse(content={
+                "success": True,
+                "cached": True,
+                "result_image": png_to_base64(cached)
+            })
+        
+        rembg_session = await require_model("rembg", fail_fast)
+        if rembg_session is None:
             raise HTTPException(status_code=503, detail="rembg not available")
         
-        pil_image = decode_base64_to_pil(request.image_base64)
+        pil_image = open_image_bytes(image_bytes)
+        loop = asyncio.get_running_loop()
+        
+        if progressive:
+            job = jobs.create("auto-remove")
+            with metrics.stage("preview"):
+                # Separate lazy image: a JPEG is decoded straight at ~preview size for the coarse pass
+                preview_source = open_image_bytes(image_bytes, PREVIEW_MAX_SIDE)
+                preview_mask = await loop.run_in_executor(None, rembg_preview_mask, rembg_session, preview_source)
+            preview = {"preview_mask": encode_mask_to_base64(preview_mask)}
+            job.publish("preview", preview)
+            
+            def refine():
+                try:
+                    job.check("refine")
+                    # Same path as the foreground request: rembg_cutout_png holds an inference slot
+                    png_bytes = rembg_cutout_png(rembg_session, pil_image, cache_key)
+                    job.check("encode")
+                    job.publish("result", {"success": True, "result_image": png_to_base64(png_bytes)})
+                except JobCancelled:
+                    pass  # "cancelled" event already published by POST /api/jobs/{id}/cancel
+                except Exception as e:
+                    job.publish("error", {"success": False, "error": f"Auto remove failed: {str(e)}"})
+            
+            # The refine outlives this request: it holds its own pin until it finishes
+            models.slot("rembg").acquire()
+            worker = job.attach(loop.run_in_executor(None, refine))
+            worker.add_done_callback(lambda _: models.release("rembg"))
+            return JSONResponse(content={
+                "success": True,
+                "progressive": True,
+                "job_id": job.id,
+                "events_url": f"/api/jobs/{job.id}/events",
+                **preview
+            })
         
         # Use rembg with alpha matting for best quality
-        result = rembg_remove(pil_image, alpha_matting=True)
+        png_bytes = await asyncio.to_thread(rembg_cutout_png, rembg_session, pil_image, cache_key)
         
         return JSONResponse(content={
             "success": True,
-            "result_image": encode_image_to_base64(result)
+            "result_image": png_to_base64(png_bytes)
         })
         
     except HTTPException as he:
         raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Auto remove failed: {str(e)}")
+    finally:
+        if rembg_session is not None:
+            models.release("rembg")
 
 
-# Startup event
-@app.on_event("startup")
+# Startup event (standalone app only; inference_server.py starts loading itself)
 async def startup_event():
-    """Initialize models on startup"""
+    """Start loading models in background; the API answers right away"""
     print("=" * 60)
     print("  SAM Background Removal API - Starting...")
     print("=" * 60)
     
-    # Try to initialize SAM
-    if SAM_AVAILABLE:
-        success = initialize_sam()
-        if not success:
-            print("[WARN] SAM não pôde ser inicializado. Usando fallback.")
+    models.start_background_loading()
     
     print("=" * 60)
-    print(f"  API pronta em http://localhost:8000")
-    print(f"  Docs em http://localhost:8000/docs")
-    print(f"  SAM: {'✓' if sam_predictor else '✗ (usando fallback)'}")
-    print(f"  REMBG: {'✓' if REMBG_AVAILABLE else '✗'}")
+    print("  API pronta em http://127.0.0.1:8000")
+    print("  Docs em http://127.0.0.1:8000/docs")
+    print("  Modelos carregando em segundo plano (veja /health)")
+    print(f"  SAM: {'carregando' if SAM_AVAILABLE else '✗ (usando fallback)'}")
+    print(f"  REMBG: {'carregando' if REMBG_AVAILABLE else '✗'}")
     print("=" * 60)
 
 
-@app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
-    global sam_predictor
-    sam_predictor = None
     print("SAM API encerrada.")
 
 
+app = create_app(
+    title="SAM Background Removal API",
+    version="1.0.0",
+    description="API para remoção inteligente de fundo usando SAM e refinamento"
+)
+app.include_router(router)
+app.on_event("startup")(startup_event)
+app.on_event("shutdown")(shutdown_event)
+
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
+    # Loopback TCP :8000 (renderer client) or --uds [path] / IMPRIME_SOCKET for local socket clients
+    serve(app, "sam", 8000, log_level="info")
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Shared building blocks of the inference servers
+sam_server and tester_server used to build their own CORS setup, base64/PNG helpers,
+model registry, job store and thread pool. Whether they run standalone or together in
+inference_server.py, one process now has a single instance of each:
+
+    core = shared("sam")   # the first caller names the metrics service, later calls reuse it
+    core.models, core.metrics, core.jobs, core.result_cache, core.executor
+
+Thread budget (scripts/thread_budget.py, shared with the CLI removers): the CPU count
+(IMPRIME_THREADS) is split between IMPRIME_INFERENCE_SLOTS concurrent model inferences, or
+the split saved by `thread_budget.py autotune` on this machine. Each inference gets
+budget // slots intra-op threads (OMP/MKL/OpenBLAS variables, read by torch and by rembg's
+ONNX Runtime sessions when they are first imported; torch and OpenCV are also set directly),
+and core.inference() admits at most `slots` inferences at a time.
+The request thread pool (IMPRIME_WORKERS) is the event loop's default executor, so
+asyncio.to_thread / run_in_executor(None, ...) from every engine share it.
+
+Transport (serve): loopback TCP by default (127.0.0.1, not every interface), or a Unix
+domain socket with --uds [path] / IMPRIME_SOCKET=path for local clients that can use one
+(Electron main process: http.request({socketPath}); Python: UnixHTTPConnection below).
+The default socket lives in a per-user 0700 directory. The renderer's axios client can only
+speak TCP, so the port stays available. Windows: CPython has no AF_UNIX there and uvicorn
+cannot listen on a named pipe, so --uds falls back to loopback TCP with a warning.
+"""
+
+import asyncio
+import base64
+import http.client
+import io
+import os
+import socket
+import stat
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+
+from model_registry import ModelRegistry
+from jobs import JobStore, add_job_routes
+from metrics import Metrics, install_metrics, model_memory_lines, result_cache_lines
+from image_io import Payload, decode_base64_payload, ensure_rgb, image_array, open_image
+
+# Helpers shared with the CLI removers (src/main/modules/upscayl/scripts)
+SCRIPTS_DIR = Path(__file__).resolve().parents[1] / "main" / "modules" / "upscayl" / "scripts"
+if str(SCRIPTS_DIR) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS_DIR))
+
+from result_cache import open_result_cache
+from image_encode import encode_png_bytes
+import thread_budget
+
+UDS_AVAILABLE = hasattr(socket, "AF_UNIX")
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.environ.get(name, "") or default))
+    except ValueError:
+        return default
+
+
+class ServerCore:
+    """Process-wide state shared by every engine hosted in this process"""
+
+    def __init__(self, service: str):
+        self.service = service
+        budget = thread_budget.plan()
+        if budget.source == "padrão" and budget.cores >= 4:
+            # No explicit or autotuned split: two concurrent requests on a multi-core machine
+            budget = thread_budget.plan(workers=2)
+        self.budget = budget
+        self.threads = budget.cores
+        self.inference_slots = budget.workers
+        self.intra_threads = budget.intra_threads
+        self.workers = _env_int("IMPRIME_WORKERS", min(16, self.threads + 4))
+        # Before torch / onnxruntime are imported (they are imported lazily by the loaders)
+        thread_budget.apply(budget, load_cv2=True)
+
+        self.metrics = Metrics(service)
+        self.models = ModelRegistry(wait_timeout=float(os.environ.get("MODEL_WAIT_TIMEOUT", "300")))
+        self.jobs = JobStore()
+        # Content-addressed cache of finished results, shared with the CLI removers
+        self.result_cache = open_result_cache()
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        self._inference = threading.BoundedSemaphore(self.inference_slots)
+
+        self.metrics.add_collector(lambda: model_memory_lines(self.metrics, self.models))
+        self.metrics.add_collector(lambda: result_cache_lines(self.metrics, self.result_cache))
+
+    @contextmanager
+    def inference(self):
+        """Hold one of the inference slots while a model runs (worker threads only)"""
+        with self.metrics.queue("inference"):
+            self._inference.acquire()
+        try:
+            yield
+        finally:
+            self._inference.release()
+
+    def thread_budget(self) -> dict:
+        return {
+            "threads": self.threads,
+            "inference_slots": self.inference_slots,
+            "intra_op_threads": int(os.environ.get("OMP_NUM_THREADS", self.intra_threads)),
+            "workers": self.workers,
+            "source": self.budget.source,
+        }
+
+
+_core: Optional[ServerCore] = None
+_core_lock = threading.Lock()
+
+
+def shared(service: str = "inference") -> ServerCore:
+    """The process' ServerCore (created on first use; `service` only matters then)"""
+    global _core
+    with _core_lock:
+        if _core is None:
+            _core = ServerCore(service)
+        return _core
+
+
+def create_app(title: str, version: str, description: Optional[str] = None):
+    """FastAPI app with CORS for the Electron renderer, metrics, job routes and the shared pool"""
+    from fastapi import FastAPI
+    from fastapi.middleware.cors import CORSMiddleware
+
+    core = shared()
+    app = FastAPI(title=title, version=version, **({"description": description} if description else {}))
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["Server-Timing", "X-Memory-Profile"],
+    )
+    # Per-stage timing: GET /metrics (Prometheus) and a Server-Timing header on every response
+    install_metrics(app, core.metrics)
+    # Progressive jobs (preview now, refined result over SSE)
+    add_job_routes(app, core.jobs)
+
+    @app.on_event("startup")
+    async def use_shared_executor():
+        asyncio.get_running_loop().set_default_executor(core.executor)
+
+    return app
+
+
+# Decode / encode layer (HTTP 400 on unreadable input, 500 on encoding failures)
+
+def decode_base64_bytes(base64_str: str) -> Payload:
+    """Decode base64 string (optionally a data URL) to the raw file bytes (read-only buffer)"""
+    from fastapi import HTTPException
+    try:
+        with shared().metrics.stage("base64"):
+            return decode_base64_payload(base64_str)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image data: {str(e)}")
+
+
+def open_image_bytes(image_bytes: Payload, max_side: Optional[int] = None) -> Image.Image:
+    """Open raw image file bytes as a PIL Image (JPEGs decoded at reduced scale if max_side)"""
+    from fastapi import HTTPException
+    try:
+        image = open_image(image_bytes, max_side)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image data: {str(e)}")
+    shared().metrics.note_image(image)
+    return image
+
+
+def decode_base64_image(base64_str: str) -> np.ndarray:
+    """Decode base64 string to a read-only numpy array (RGB format), see image_io"""
+    from fastapi import HTTPException
+    metrics = shared().metrics
+    try:
+        with metrics.stage("decode"):
+            image = open_image(decode_base64_payload(base64_str))
+            metrics.note_image(image)
+            return image_array(ensure_rgb(image))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image data: {str(e)}")
+
+
+def decode_base64_to_pil(base64_str: str) -> Image.Image:
+    """Decode base64 string to PIL Image"""
+    return open_image_bytes(decode_base64_bytes(base64_str))
+
+
+def png_to_base64(png_bytes: bytes) -> str:
+    """Wrap PNG bytes as a data URL"""
+    return "data:image/png;base64," + base64.b64encode(png_bytes).decode("utf-8")
+
+
+def encode_mask_to_base64(mask: np.ndarray) -> str:
+    """Encode numpy mask array to base64 PNG"""
+    from fastapi import HTTPException
+    try:
+        if mask.dtype != np.uint8:
+            if mask.max() <= 1.0:
+                mask = (mask * 255).astype(np.uint8)
+            else:
+                mask = mask.astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(mask, mode="L").save(buffer, format="PNG")
+        return png_to_base64(buffer.getvalue())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error encoding mask: {str(e)}")
+
+
+def encode_image_to_png(image: Image.Image) -> bytes:
+    """Encode PIL Image to PNG bytes (stripe-parallel zlib on large images)"""
+    from fastapi import HTTPException
+    try:
+        return encode_png_bytes(image)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error encoding image: {str(e)}")
+
+
+def encode_image_to_base64(image: Image.Image) -> str:
+    """Encode PIL Image to base64 PNG"""
+    return png_to_base64(encode_image_to_png(image))
+
+
+# Transport: loopback TCP or Unix domain socket
+
+def default_socket_path(name: str) -> str:
+    """<runtime dir>/imprime-ai/<name>.sock in a directory only this user can enter"""
+    base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    directory = os.path.join(base, "imprime-ai" if os.environ.get("XDG_RUNTIME_DIR") else f"imprime-ai-{os.getuid()}")
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    os.chmod(directory, 0o700)
+    return os.path.join(directory, f"{name}.sock")
+
+
+def transport_options(name: str, default_port: int, argv=None) -> dict:
+    """
+    uvicorn bind options from argv (--uds [path], --host, --port) or the environment
+    (IMPRIME_SOCKET, IMPRIME_HOST, IMPRIME_PORT); loopback TCP unless a socket was asked for
+    """
+    argv = list(sys.argv[1:] if argv is None else argv)
+    options = {"host": os.environ.get("IMPRIME_HOST", "127.0.0.1"),
+               "port": int(os.environ.get("IMPRIME_PORT", default_port))}
+    socket_path = os.environ.get("IMPRIME_SOCKET") or None
+    for index, arg in enumerate(argv):
+        value = argv[index + 1] if index + 1 < len(argv) and not argv[index + 1].startswith("--") else None
+        if arg == "--uds":
+            socket_path = value or ""
+        elif arg == "--host" and value:
+            options["host"] = value
+        elif arg == "--port" and value:
+            options["port"] = int(value)
+    if socket_path is None:
+        return options
+    if not UDS_AVAILABLE:
+        print(f"[SERVER] Unix domain socket indisponível nesta plataforma (uvicorn não escuta em named pipe); "
+              f"usando http://{options['host']}:{options['port']}")
+        return options
+    return {"uds": socket_path or default_socket_path(name)}
+
+
+def _remove_stale_socket(path: str) -> None:
+    """A socket file left by a crashed server blocks bind(); anything else is never touched"""
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def serve(app, name: str, default_port: int, argv=None, **uvicorn_options) -> None:
+    """Run the app on loopback TCP or a Unix domain socket (see transport_options)"""
+    import uvicorn
+
+    options = transport_options(name, default_port, argv)
+    if "uds" in options:
+        _remove_stale_socket(options["uds"])
+        print(f"[SERVER] {name}: unix:{options['uds']}")
+    else:
+        print(f"[SERVER] {name}: http://{options['host']}:{options['port']}")
+    try:
+        uvicorn.run(app, **options, **uvicorn_options)
+    finally:
+        if "uds" in options:
+            _remove_stale_socket(options["uds"])
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """http.client over a Unix domain socket (same API; the Host header is cosmetic)"""
+
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
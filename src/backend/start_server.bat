@@ -1,6 +1,6 @@
 @echo off
 echo ========================================
-echo   SAM Background Removal API Server
+echo   Imprime AI Inference Server (SAM + rembg + BiRefNet)
 echo ========================================
 echo.
 
@@ -21,12 +21,13 @@ pip install -q -r requirements.txt
 echo [4/4] Iniciando servidor FastAPI...
 echo.
 echo ========================================
-echo   Servidor iniciado em http://localhost:8000
-echo   Docs: http://localhost:8000/docs
+echo   Servidor iniciado em http://127.0.0.1:8000
+echo   Docs: http://127.0.0.1:8000/docs
 echo   Pressione Ctrl+C para parar
 echo ========================================
 echo.
 
-python sam_server.py
+REM Um processo para todos os motores; sam_server.py e tester_server.py continuam rodando sozinhos
+python inference_server.py
 
 pause
@@ -5,52 +5,67 @@ Modelo: BiRefNet (Melhor qualidade)
 Resolução: 1024x1024 (Rápido - ~15s)
 Extras: Gamma Boost 0.4 (Salva textos finos) + Proteção Recursiva
 """
-import uvicorn
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-import base64
-import io
+import asyncio
+from contextlib import nullcontext
 from PIL import Image
-import torch
-from torchvision import transforms
-from transformers import AutoModelForImageSegmentation
 import numpy as np
 
-app = FastAPI(title="BiRefNet Speed", version="Final.Speed")
+# App, registro de modelos, jobs, pool de threads e codificação compartilhados (server_core também
+# coloca src/main/modules/upscayl/scripts no sys.path: cache de resultados dos scripts de remoção)
+from server_core import create_app, serve, shared, png_to_base64
+from model_registry import ModelNotReady
+from jobs import JobCancelled
+from image_io import decode_base64_payload, ensure_rgb, open_image
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+from result_cache import ResultCache, bytes_digest
+from image_encode import encode_png_bytes
 
-model = None
-device = None
+# torch / torchvision / transformers são importados sob demanda (carregamento em segundo plano)
+
+# Estado do processo: no inference_server.py o SAM/rembg dividem o mesmo registro, pool e métricas
+core = shared("birefnet")
+metrics = core.metrics
+models = core.models
+
+# Modo progressivo: prévia em baixa resolução agora, resultado final via SSE (/api/jobs/{id}/events)
+jobs = core.jobs
+PREVIEW_SIZE = 512
+
+# Rotas num router: o inference_server.py monta junto com os outros motores
+router = APIRouter()
+
+# Chave do cache: bytes de entrada + modelo + resolução de inferência e gamma (mudar qualquer um invalida)
+result_cache = core.result_cache
+BIREFNET_MODEL_ID = 'ZhengPeng7/BiRefNet'
+BIREFNET_CACHE_PARAMS = {"target_size": 1024, "gamma": 0.4}
 
 class ImageRequest(BaseModel):
     image_base64: str
     threshold: float = 0.5 
 
 def get_model():
-    global model, device
-    if model is None:
-        print("Carregando BiRefNet Otimizado...")
-        try:
-            model = AutoModelForImageSegmentation.from_pretrained('ZhengPeng7/BiRefNet', trust_remote_code=True)
-            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-            model.to(device)
-            model.eval()
-            print(f"BiRefNet Carregado! Device: {device}")
-        except Exception as e:
-            print(f"Erro: {e}")
-            raise e
+    # Sem global: o registro de modelos é o único dono (descarregar por LRU libera a memória de verdade).
+    # Os pesos vêm do safetensors no cache do Hugging Face (mmap): recarregar sai do page cache.
+    print("Carregando BiRefNet Otimizado...")
+    try:
+        import torch
+        from transformers import AutoModelForImageSegmentation
+        model = AutoModelForImageSegmentation.from_pretrained(BIREFNET_MODEL_ID, trust_remote_code=True)
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        model.to(device)
+        model.eval()
+        print(f"BiRefNet Carregado! Device: {device}")
+    except Exception as e:
+        print(f"Erro: {e}")
+        raise e
     return model, device
 
+
 # Função RECURSIVA para extrair tensor (Blindagem)
 def find_tensor(obj):
+    import torch
     if isinstance(obj, torch.Tensor):
         return obj
     if hasattr(obj, 'logits'):
@@ -64,13 +79,16 @@ def find_tensor(obj):
                 return res
     return None
 
-def process_image(im: Image.Image):
-    model, device = get_model()
+def process_image(im: Image.Image, target_size: int = 1024, output_size=None, loaded=None):
+    import torch
+    from torchvision import transforms
+    
+    model, device = loaded or models.get("birefnet")
     w, h = im.size
     
     # RESOLUÇÃO OTIMIZADA: 1024x1024
     # É o equilíbrio perfeito entre velocidade e detalhe.
-    target_size = 1024
+    # (a prévia progressiva usa 512 e devolve a máscara pequena)
     scale = target_size / max(w, h)
     new_w = int(w * scale)
     new_h = int(h * scale)
@@ -89,7 +107,8 @@ def process_image(im: Image.Image):
     
     input_images = tensor_transform(im_resized).unsqueeze(0).to(device)
     
-    with torch.no_grad():
+    # Uma das vagas de inferência do processo (orçamento de threads, ver server_core)
+    with core.inference(), torch.no_grad():
         preds = model(input_images)
         
     # Extração Segura
@@ -108,38 +127,133 @@ def process_image(im: Image.Image):
     pred = pred.pow(0.4)
         
     pred_pil = transforms.ToPILImage()(pred)
-    mask = pred_pil.resize((w, h), Image.BILINEAR)
+    mask = pred_pil.resize(output_size or (w, h), Image.BILINEAR)
     
     return mask
 
-@app.on_event("startup")
+def warmup_birefnet(loaded, image: np.ndarray):
+    # Inferência de aquecimento (alocador + seleção de kernels oneDNN)
+    process_image(Image.fromarray(image), loaded=loaded)
+
+models.register("birefnet", get_model, warmup=warmup_birefnet)
+
 async def startup_event():
-    try: get_model()
-    except: pass
+    # Não bloqueia: o servidor responde /health enquanto o BiRefNet carrega
+    models.start_background_loading()
 
-@app.post("/remove")
-async def remove_background(request: ImageRequest):
-    try:
-        if "base64," in request.image_base64:
-            base64_data = request.image_base64.split("base64,")[1]
-        else:
-            base64_data = request.image_base64
-        image_bytes = base64.b64decode(base64_data)
-        original_image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-        
-        mask = process_image(original_image)
-        
+@router.get("/health")
+async def health():
+    return {
+        "status": "ok" if models.all_settled() else "loading",
+        "models": models.status(),
+        "residency": models.residency(),
+        "result_cache": result_cache.stats() if result_cache is not None else None
+    }
+
+def encode_png_base64(image: Image.Image) -> str:
+    return png_to_base64(encode_png_bytes(image))
+
+def remove_full(original_image: Image.Image, cache_key=None, loaded=None, job=None) -> dict:
+    # job: pontos de cancelamento antes e depois da inferência (refinamento progressivo)
+    if job is not None:
+        job.check("refine")
+    with metrics.stage("birefnet"):
+        mask = process_image(original_image, loaded=loaded)
+    if job is not None:
+        job.check("encode")
+    
+    with metrics.stage("compose"):
         final_image = original_image.convert("RGBA")
         final_image.putalpha(mask)
+    with metrics.stage("encode"):
+        png_bytes = encode_png_bytes(final_image)
+    if cache_key is not None:
+        try:
+            result_cache.put(cache_key, png_bytes)
+        except OSError as e:
+            print(f"Cache: não foi possível gravar o resultado: {e}")
+    return {"success": True, "result_image": png_to_base64(png_bytes)}
+
+def decode_request_bytes(image_base64: str) -> memoryview:
+    # Decodificação em blocos num buffer único (sem cópias do texto base64), ver image_io
+    return decode_base64_payload(image_base64)
+
+@router.post("/remove")
+async def remove_background(request: ImageRequest, fail_fast: bool = False, progressive: bool = False):
+    # Acerto no cache responde na hora, sem esperar o modelo carregar
+    cache_key = None
+    try:
+        with metrics.stage("base64"):
+            image_bytes = decode_request_bytes(request.image_base64)
+        if result_cache is not None:
+            with metrics.stage("cache-lookup"):
+                cache_key = ResultCache.make_key(bytes_digest(image_bytes), "birefnet", BIREFNET_MODEL_ID, BIREFNET_CACHE_PARAMS)
+                cached = result_cache.get(cache_key)
+            if cached is not None:
+                return {"success": True, "cached": True, "result_image": png_to_base64(cached)}
+    except Exception as e:
+        print(f"Erro: {e}")
+        return {"success": False, "error": str(e)}
+    
+    try:
+        # Só conta como espera quando o modelo ainda está carregando
+        waiting = metrics.queue("model-birefnet") if not models.slot("birefnet").settled else nullcontext()
+        with waiting:
+            # Fixado contra a evicção LRU até o fim da requisição (models.release abaixo)
+            loaded = await models.acquire("birefnet", fail_fast=fail_fast)
+        if loaded is None:
+            return {"success": False, "error": models.slot("birefnet").error or "BiRefNet indisponível"}
+    except ModelNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "2"})
+    
+    try:
+        with metrics.stage("decode"):
+            original_image = ensure_rgb(open_image(image_bytes))
+            original_image.load()
+            metrics.note_image(original_image)
+        loop = asyncio.get_running_loop()
+        
+        if progressive:
+            job = jobs.create("birefnet")
+            w, h = original_image.size
+            ratio = min(1.0, PREVIEW_SIZE / max(w, h))
+            preview_size = (max(1, round(w * ratio)), max(1, round(h * ratio)))
+            with metrics.stage("preview"):
+                preview_mask = await loop.run_in_executor(
+                    None, lambda: process_image(original_image, PREVIEW_SIZE, preview_size, loaded)
+                )
+            preview = {"preview_mask": encode_png_base64(preview_mask)}
+            job.publish("preview", preview)
+            
+            def refine():
+                try:
+                    job.publish("result", remove_full(original_image, cache_key, loaded, job))
+                except JobCancelled:
+                    pass  # evento "cancelled" já publicado por POST /api/jobs/{id}/cancel
+                except Exception as e:
+                    print(f"Erro: {e}")
+                    job.publish("error", {"success": False, "error": str(e)})
+            
+            # O refine termina depois da requisição: fixa o modelo por conta própria
+            models.slot("birefnet").acquire()
+            worker = job.attach(loop.run_in_executor(None, refine))
+            worker.add_done_callback(lambda _: models.release("birefnet"))
+            return {"success": True, "progressive": True, "job_id": job.id,
+                    "events_url": f"/api/jobs/{job.id}/events", **preview}
         
-        buffered = io.BytesIO()
-        final_image.save(buffered, format="PNG")
-        result_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-        return {"success": True, "result_image": f"data:image/png;base64,{result_base64}"}
+        # to_thread mantém o contexto da requisição: as etapas entram no Server-Timing
+        return await asyncio.to_thread(remove_full, original_image, cache_key, loaded)
     except Exception as e:
         print(f"Erro: {e}")
         return {"success": False, "error": str(e)}
+    finally:
+        models.release("birefnet")
+
+app = create_app(title="BiRefNet Speed", version="Final.Speed")
+app.include_router(router)
+app.on_event("startup")(startup_event)
 
 if __name__ == "__main__":
     print("Iniciando BiRefNet SPEED na porta 8002...")
-    uvicorn.run(app, host="0.0.0.0", port=8002)
+    # Loopback TCP :8002 ou --uds [caminho] / IMPRIME_SOCKET (socket Unix local)
+    serve(app, "birefnet", 8002)
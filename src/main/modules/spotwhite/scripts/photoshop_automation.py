@@ -13,6 +13,31 @@ import time
 # Iniciar log de debug
 print(f"[Debug] Python Executable: {sys.executable}", file=sys.stderr)
 
+# Eventos estruturados opcionais (--events / IMPRIME_EVENTS), compartilhados com os removedores.
+# Empacotado, cli_events.py fica ao lado deste script; no desenvolvimento, em upscayl/scripts.
+try:
+    from cli_events import events, progress
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'upscayl', 'scripts'))
+    try:
+        from cli_events import events, progress
+    except ImportError:
+        print("[Debug] cli_events não disponível (eventos estruturados desativados)", file=sys.stderr)
+
+        class _NoEvents:
+            def configure(self, tool, argv=None):
+                if '--events' in (argv or []):
+                    argv.remove('--events')
+                return self
+
+            def finish(self, *args, **kwargs):
+                pass
+
+        events = _NoEvents()
+
+        def progress(stage, pct=None, message=None, nbytes=None):
+            pass
+
 # Importar pythoncom para processar mensagens COM e evitar erros de "aplicativo ocupado"
 try:
     import pythoncom
@@ -630,6 +655,7 @@ def process_spot_white(file_path, output_file, action_name="SPOTWHITE-PHOTOSHOP"
             raise Exception(f"Arquivo de entrada não encontrado: {file_path}")
         
         # Conectar ao Photoshop usando a nova função auxiliar
+        progress('connect', 5, nbytes=os.path.getsize(file_path))
         ps_app = _get_ps_app()
 
         if PYTHONCOM_AVAILABLE:
@@ -684,6 +710,7 @@ def process_spot_white(file_path, output_file, action_name="SPOTWHITE-PHOTOSHOP"
         
         try:
             # Abrir arquivo
+            progress('open', 15)
             doc = None
             for open_attempt in range(3):
                 try:
@@ -723,6 +750,7 @@ def process_spot_white(file_path, output_file, action_name="SPOTWHITE-PHOTOSHOP"
                 pass
 
             # Executar ação
+            progress('action', 40)
             action_executed = False
             # Verificar se já existe canal Spot White
             try:
@@ -756,6 +784,7 @@ def process_spot_white(file_path, output_file, action_name="SPOTWHITE-PHOTOSHOP"
                 os.makedirs(output_dir, exist_ok=True)
 
             print(f"[Debug] Salvando em: {output_path_abs}", file=sys.stderr)
+            progress('save', 80)
             
             # Opções de TIFF para fundo transparente
             try:
@@ -772,6 +801,7 @@ def process_spot_white(file_path, output_file, action_name="SPOTWHITE-PHOTOSHOP"
                 doc.SaveAs(output_path_abs)
 
             print(f"[Debug] Sucesso no processamento de {file_path}", file=sys.stderr)
+            progress('close', 95, nbytes=os.path.getsize(output_file) if os.path.exists(output_file) else None)
 
         finally:
             monitor.stop()
@@ -818,6 +848,7 @@ def process_spot_white(file_path, output_file, action_name="SPOTWHITE-PHOTOSHOP"
 
 
 def main():
+    events.configure('photoshop_automation', sys.argv)
     if len(sys.argv) < 2:
         print("Uso: python photoshop_automation.py <comando> [argumentos]", file=sys.stderr)
         sys.exit(1)
@@ -882,10 +913,12 @@ def main():
         
         try:
             process_spot_white(input_file, output_file, action_name, action_set, page)
+            events.finish('ok', output=output_file, input_path=input_file)
             print(f"SUCCESS:{output_file}", file=sys.stdout)
             sys.stdout.flush()
         except Exception as e:
             error_msg = str(e)
+            events.finish('error', error=error_msg, input_path=input_file)
             print(f"ERROR:{error_msg}", file=sys.stderr)
             sys.stderr.flush()
             sys.exit(1)
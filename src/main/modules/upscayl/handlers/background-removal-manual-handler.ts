@@ -12,6 +12,7 @@ export interface SelectionData {
     y1?: number;
     x2?: number;
     y2?: number;
+    zoom?: boolean; // segmenta uma ROI em resolução nativa (objetos pequenos em folhas grandes)
 }
 
 export class BackgroundRemovalManualHandler {
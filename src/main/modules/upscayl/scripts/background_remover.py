@@ -7,6 +7,7 @@ Versão rápida e inteligente para remoção automática de fundo
 
 import sys
 import os
+import math
 import numpy as np
 from PIL import Image
 
@@ -18,6 +19,13 @@ except ImportError as e:
     print(f"ERROR:Execute: pip install rembg[gpu]", file=sys.stderr)
     sys.exit(1)
 
+from remover_cli import pop_flag, write_preview, downscaled, describe_input
+from result_cache import cli_lookup, cli_store
+from image_encode import configure_output, output_path_for, profile_cache_params, save_image
+from stripe_pipeline import configure_streaming, use_streaming, compose_stream, resized_rows
+from cli_events import events, progress, file_size, image_nbytes
+from thread_budget import configure_threads
+
 def remove_black_pixels(image, threshold=30):
     """
     Remove pixels pretos/escuros da imagem (útil para limpar artefatos)
@@ -41,7 +49,7 @@ def remove_black_pixels(image, threshold=30):
     data[:,:,3] = a
     return Image.fromarray(data, 'RGBA')
 
-def remove_background_advanced(input_path, output_path, remove_internal_blacks=False, black_threshold=30):
+def remove_background_advanced(input_path, output_path, remove_internal_blacks=False, black_threshold=30, preview=False):
     """
     Remove o fundo de uma imagem usando rembg
     
@@ -50,6 +58,7 @@ def remove_background_advanced(input_path, output_path, remove_internal_blacks=F
         output_path: Caminho da imagem de saída (PNG com transparência)
         remove_internal_blacks: Se True, remove pretos internos também
         black_threshold: Threshold para considerar pixel como "preto" (0-255)
+        preview: Se True, grava antes uma prévia da máscara em baixa resolução (PREVIEW:<caminho>)
     
     Returns:
         str: Caminho do arquivo de saída se sucesso
@@ -59,18 +68,35 @@ def remove_background_advanced(input_path, output_path, remove_internal_blacks=F
         if not os.path.exists(input_path):
             raise Exception(f"ERROR:Arquivo de entrada não encontrado: {input_path}")
         
-        print(f"PROGRESS:Carregando imagem...", file=sys.stderr, flush=True)
+        # OTIMIZAÇÃO: Qualidade superior para DTF (ISNET é o estado da arte para bordas limpas)
+        # (IMPRIME_MAX_SIDE: lado de trabalho menor escolhido pelo engine_router para caber no orçamento)
+        MAX_DIMENSION = int(os.environ.get('IMPRIME_MAX_SIDE') or 2500)
+        
+        # Mesma arte + mesmos parâmetros: devolve o PNG já processado
+        cache, cache_key, hit = cli_lookup(input_path, output_path, 'rembg', 'isnet-general-use', {
+            'max_dimension': MAX_DIMENSION,
+            'remove_blacks': black_threshold if remove_internal_blacks else None,
+            **profile_cache_params(),
+        })
+        if hit:
+            return output_path
+        
+        info = describe_input(input_path)
+        
+        progress('load', 5, f"Carregando imagem...", nbytes=file_size(input_path))
         input_image = Image.open(input_path)
         original_size = input_image.size
+        if info.format == 'JPEG' and max(original_size) >= 2 * MAX_DIMENSION:
+            # Só a versão reduzida é usada: o JPEG já é decodificado em escala 1/2..1/8 (nunca abaixo de MAX_DIMENSION)
+            scale = MAX_DIMENSION / max(original_size)
+            input_image.draft('RGB', (math.ceil(original_size[0] * scale), math.ceil(original_size[1] * scale)))
         
         # Converter para RGB se necessário
         if input_image.mode != 'RGB':
             input_image = input_image.convert('RGB')
         
-        # OTIMIZAÇÃO: Qualidade superior para DTF (ISNET é o estado da arte para bordas limpas)
-        MAX_DIMENSION = 2500 
         if max(original_size) > MAX_DIMENSION:
-            print(f"PROGRESS:Redimensionando para {MAX_DIMENSION}px (limite para performance)...", file=sys.stderr, flush=True)
+            progress('resize', 10, f"Redimensionando para {MAX_DIMENSION}px (limite para performance)...")
             ratio = MAX_DIMENSION / max(original_size)
             new_size = (int(original_size[0] * ratio), int(original_size[1] * ratio))
             input_image = input_image.resize(new_size, Image.Resampling.LANCZOS)
@@ -83,7 +109,11 @@ def remove_background_advanced(input_path, output_path, remove_internal_blacks=F
             print(f"WARNING:Erro ao carregar modelo {model_name}: {e}. Baixando modelo de alta precisão (pode demorar na primeira vez)...", file=sys.stderr, flush=True)
             session = new_session(model_name)
 
-        print(f"PROGRESS:Removendo fundo (Modo Ultra-Rápido)...", file=sys.stderr, flush=True)
+        if preview:
+            # Passe grosseiro em baixa resolução: o usuário vê algo antes do resultado final
+            write_preview(remove(downscaled(input_image), session=session, only_mask=True), output_path)
+        
+        progress('inference', 20, f"Removendo fundo (Modo Ultra-Rápido)...", nbytes=image_nbytes(input_image))
         
         # Remover fundo
         output_image = remove(
@@ -92,15 +122,24 @@ def remove_background_advanced(input_path, output_path, remove_internal_blacks=F
             alpha_matting=False, 
         )
         
-        # Se redimensionamos, voltar ao tamanho original
-        if max(original_size) > MAX_DIMENSION:
-            print(f"PROGRESS:Restaurando resolução original...", file=sys.stderr, flush=True)
-            output_image = output_image.resize(original_size, Image.Resampling.LANCZOS)
-        
-        # Remover pretos internos se solicitado
-        if remove_internal_blacks:
-            print(f"PROGRESS:Removendo pretos internos (threshold: {black_threshold})...", file=sys.stderr, flush=True)
-            output_image = remove_black_pixels(output_image, black_threshold)
+        if max(original_size) > MAX_DIMENSION and use_streaming(original_size):
+            # Impressão muito grande: ampliação + pretos faixa por faixa, direto para o disco
+            progress('restore', 80, f"Restaurando resolução original em faixas...")
+            output_image = compose_stream(
+                original_size,
+                rgba_rows=resized_rows(output_image, original_size),
+                black_threshold=black_threshold if remove_internal_blacks else None,
+            )
+        else:
+            # Se redimensionamos, voltar ao tamanho original
+            if max(original_size) > MAX_DIMENSION:
+                progress('restore', 80, f"Restaurando resolução original...")
+                output_image = output_image.resize(original_size, Image.Resampling.LANCZOS)
+            
+            # Remover pretos internos se solicitado
+            if remove_internal_blacks:
+                progress('postprocess', 85, f"Removendo pretos internos (threshold: {black_threshold})...")
+                output_image = remove_black_pixels(output_image, black_threshold)
         
         # Garantir que o diretório de saída existe
         output_dir = os.path.dirname(output_path)
@@ -108,14 +147,18 @@ def remove_background_advanced(input_path, output_path, remove_internal_blacks=F
             os.makedirs(output_dir, exist_ok=True)
         
         # Salvar
-        print(f"PROGRESS:Salvando resultado...", file=sys.stderr, flush=True)
-        output_image.save(output_path, 'PNG', optimize=True)
+        progress('save', 90, f"Salvando resultado...", nbytes=image_nbytes(output_image))
+        try:
+            save_image(output_image, output_path)
+        finally:
+            output_image.close()  # no modo streaming apaga o temporário das faixas
         
-        print(f"PROGRESS:Concluído!", file=sys.stderr, flush=True)
+        progress('done', 100, f"Concluído!")
         
         if not os.path.exists(output_path):
             raise Exception("ERROR:Arquivo de saída não foi criado")
         
+        cli_store(cache, cache_key, output_path)
         return output_path
         
     except Exception as e:
@@ -126,19 +169,26 @@ def remove_background_advanced(input_path, output_path, remove_internal_blacks=F
             raise Exception(f"ERROR:Erro ao remover fundo: {error_msg}")
 
 if __name__ == '__main__':
+    events.configure('background_remover', sys.argv)
+    preview = pop_flag(sys.argv, '--preview', 'IMPRIME_PREVIEW')
+    configure_output(sys.argv)
+    configure_threads(sys.argv)
+    configure_streaming(sys.argv)
     if len(sys.argv) < 3:
-        print("ERROR:Uso: python background_remover.py <input_path> <output_path> [remove_blacks] [threshold]")
+        print("ERROR:Uso: python background_remover.py <input_path> <output_path> [remove_blacks] [threshold] [--preview] [--output-profile nome] [--threads N] [--stream]")
         sys.exit(1)
     
     input_path = sys.argv[1]
-    output_path = sys.argv[2]
+    output_path = output_path_for(sys.argv[2])
     remove_blacks = sys.argv[3].lower() == 'true' if len(sys.argv) > 3 else False
     threshold = int(sys.argv[4]) if len(sys.argv) > 4 else 30
     
     try:
-        result = remove_background_advanced(input_path, output_path, remove_blacks, threshold)
+        result = remove_background_advanced(input_path, output_path, remove_blacks, threshold, preview)
+        events.finish('ok', output=result, input_path=input_path)
         print(f"SUCCESS:{result}")
         sys.exit(0)
     except Exception as e:
+        events.finish('error', error=str(e), input_path=input_path)
         print(str(e), file=sys.stderr, flush=True)
         sys.exit(1)
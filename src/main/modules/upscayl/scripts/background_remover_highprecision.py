@@ -18,6 +18,13 @@ except ImportError as e:
     print(f"ERROR:Execute: pip install rembg[gpu]", file=sys.stderr)
     sys.exit(1)
 
+from remover_cli import pop_flag, write_preview, downscaled, describe_input
+from result_cache import cli_lookup, cli_store
+from image_encode import configure_output, output_path_for, profile_cache_params, save_image
+from stripe_pipeline import configure_streaming, use_streaming, compose_stream, image_rows
+from cli_events import events, progress, file_size, image_nbytes
+from thread_budget import configure_threads
+
 def remove_black_pixels(image, threshold=30):
     """
     Remove pixels pretos/escuros da imagem (útil para limpar artefatos)
@@ -41,7 +48,7 @@ def remove_black_pixels(image, threshold=30):
     data[:,:,3] = a
     return Image.fromarray(data, 'RGBA')
 
-def remove_background_high_precision(input_path, output_path, remove_internal_blacks=False, black_threshold=30):
+def remove_background_high_precision(input_path, output_path, remove_internal_blacks=False, black_threshold=30, preview=False):
     """
     Remove o fundo de uma imagem usando rembg com alta precisão
     
@@ -50,6 +57,7 @@ def remove_background_high_precision(input_path, output_path, remove_internal_bl
         output_path: Caminho da imagem de saída (PNG com transparência)
         remove_internal_blacks: Se True, remove pretos internos também
         black_threshold: Threshold para considerar pixel como "preto" (0-255)
+        preview: Se True, grava antes uma prévia da máscara em baixa resolução (PREVIEW:<caminho>)
     
     Returns:
         str: Caminho do arquivo de saída se sucesso
@@ -59,7 +67,18 @@ def remove_background_high_precision(input_path, output_path, remove_internal_bl
         if not os.path.exists(input_path):
             raise Exception(f"ERROR:Arquivo de entrada não encontrado: {input_path}")
         
-        print(f"PROGRESS:Carregando imagem...", file=sys.stderr, flush=True)
+        # Mesma chave do /api/auto-remove do sam_server (u2net + alpha matting padrão do rembg):
+        # o resultado de um serve para o outro
+        cache, cache_key, hit = cli_lookup(input_path, output_path, 'rembg', 'u2net', {
+            'alpha_matting': True,
+            'remove_blacks': black_threshold if remove_internal_blacks else None,
+            **profile_cache_params(),
+        })
+        if hit:
+            return output_path
+        
+        describe_input(input_path)
+        progress('load', 5, f"Carregando imagem...", nbytes=file_size(input_path))
         input_image = Image.open(input_path)
         original_size = input_image.size
         
@@ -68,7 +87,7 @@ def remove_background_high_precision(input_path, output_path, remove_internal_bl
             input_image = input_image.convert('RGB')
         
         # Remover fundo principal com ALTA PRECISÃO
-        print(f"PROGRESS:Inicializando modelo AI (u2net - Alta Precisão)...", file=sys.stderr, flush=True)
+        progress('model-load', 10, f"Inicializando modelo AI (u2net - Alta Precisão)...")
         
         # Usar u2net (melhor qualidade) com alpha matting ATIVADO
         model_name = "u2net"
@@ -76,10 +95,15 @@ def remove_background_high_precision(input_path, output_path, remove_internal_bl
             session = new_session(model_name)
         except Exception as e:
             print(f"WARNING:Erro ao carregar modelo {model_name}: {e}", file=sys.stderr, flush=True)
-            # Fallback para u2netp
+            # Fallback para u2netp (resultado diferente: não entra no cache do u2net)
             session = new_session("u2netp")
+            cache = None
 
-        print(f"PROGRESS:Removendo fundo com alta precisão...", file=sys.stderr, flush=True)
+        if preview:
+            # Passe grosseiro em baixa resolução (sem alpha matting) antes do refinamento completo
+            write_preview(remove(downscaled(input_image), session=session, only_mask=True), output_path)
+        
+        progress('inference', 20, f"Removendo fundo com alta precisão...", nbytes=image_nbytes(input_image))
         
         # Remover fundo COM alpha matting para máxima qualidade
         output_image = remove(
@@ -92,8 +116,13 @@ def remove_background_high_precision(input_path, output_path, remove_internal_bl
         )
         
         # Remover pretos internos se solicitado
-        if remove_internal_blacks:
-            print(f"PROGRESS:Removendo pretos internos (threshold: {black_threshold})...", file=sys.stderr, flush=True)
+        if remove_internal_blacks and use_streaming(original_size):
+            # Impressão muito grande: faixa por faixa, sem as cópias inteiras de remove_black_pixels
+            progress('postprocess', 85, f"Removendo pretos internos em faixas (threshold: {black_threshold})...")
+            output_image = compose_stream(original_size, rgba_rows=image_rows(output_image),
+                                          black_threshold=black_threshold)
+        elif remove_internal_blacks:
+            progress('postprocess', 85, f"Removendo pretos internos (threshold: {black_threshold})...")
             output_image = remove_black_pixels(output_image, black_threshold)
         
         # Garantir que o diretório de saída existe
@@ -102,14 +131,18 @@ def remove_background_high_precision(input_path, output_path, remove_internal_bl
             os.makedirs(output_dir, exist_ok=True)
         
         # Salvar
-        print(f"PROGRESS:Salvando resultado...", file=sys.stderr, flush=True)
-        output_image.save(output_path, 'PNG', optimize=True)
+        progress('save', 90, f"Salvando resultado...", nbytes=image_nbytes(output_image))
+        try:
+            save_image(output_image, output_path)
+        finally:
+            output_image.close()  # no modo streaming apaga o temporário das faixas
         
-        print(f"PROGRESS:Concluído!", file=sys.stderr, flush=True)
+        progress('done', 100, f"Concluído!")
         
         if not os.path.exists(output_path):
             raise Exception("ERROR:Arquivo de saída não foi criado")
         
+        cli_store(cache, cache_key, output_path)
         return output_path
         
     except Exception as e:
@@ -120,19 +153,26 @@ def remove_background_high_precision(input_path, output_path, remove_internal_bl
             raise Exception(f"ERROR:Erro ao remover fundo: {error_msg}")
 
 if __name__ == '__main__':
+    events.configure('background_remover_highprecision', sys.argv)
+    preview = pop_flag(sys.argv, '--preview', 'IMPRIME_PREVIEW')
+    configure_output(sys.argv)
+    configure_threads(sys.argv)
+    configure_streaming(sys.argv)
     if len(sys.argv) < 3:
-        print("ERROR:Uso: python background_remover_highprecision.py <input_path> <output_path> [remove_blacks] [threshold]")
+        print("ERROR:Uso: python background_remover_highprecision.py <input_path> <output_path> [remove_blacks] [threshold] [--preview] [--output-profile nome] [--threads N] [--stream]")
         sys.exit(1)
     
     input_path = sys.argv[1]
-    output_path = sys.argv[2]
+    output_path = output_path_for(sys.argv[2])
     remove_blacks = sys.argv[3].lower() == 'true' if len(sys.argv) > 3 else False
     threshold = int(sys.argv[4]) if len(sys.argv) > 4 else 30
     
     try:
-        result = remove_background_high_precision(input_path, output_path, remove_blacks, threshold)
+        result = remove_background_high_precision(input_path, output_path, remove_blacks, threshold, preview)
+        events.finish('ok', output=result, input_path=input_path)
         print(f"SUCCESS:{result}")
         sys.exit(0)
     except Exception as e:
+        events.finish('error', error=str(e), input_path=input_path)
         print(str(e), file=sys.stderr, flush=True)
         sys.exit(1)
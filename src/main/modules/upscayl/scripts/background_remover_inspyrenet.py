@@ -20,7 +20,13 @@ except ImportError as e:
     print(f"ERROR:Por favor, instale com: pip install transparent-background", file=sys.stderr, flush=True)
     sys.exit(1)
 
-def remove_background_inspyrenet(input_path, output_path, mode='base'):
+from remover_cli import pop_flag, write_preview, downscaled, describe_input
+from result_cache import cli_lookup, cli_store
+from image_encode import configure_output, output_path_for, profile_cache_params, save_image
+from cli_events import events, progress, file_size, image_nbytes
+from thread_budget import configure_threads
+
+def remove_background_inspyrenet(input_path, output_path, mode='base', preview=False):
     """
     Remove o fundo usando InSPyReNet
     
@@ -28,40 +34,60 @@ def remove_background_inspyrenet(input_path, output_path, mode='base'):
         input_path: Caminho da imagem de entrada
         output_path: Caminho da imagem de saída
         mode: 'base' ou 'fast' (base é mais preciso, fast é mais rápido)
+        preview: Se True, grava antes uma prévia da máscara em baixa resolução (PREVIEW:<caminho>)
     """
     try:
         if not os.path.exists(input_path):
             raise Exception(f"Arquivo não encontrado: {input_path}")
+        
+        cache, cache_key, hit = cli_lookup(input_path, output_path, 'inspyrenet', mode, profile_cache_params())
+        if hit:
+            events.finish('ok', output=output_path, input_path=input_path)
+            print(f"SUCCESS:{output_path}", flush=True)
+            return
 
-        print(f"PROGRESS:Inicializando InSPyReNet ({mode})...", file=sys.stderr, flush=True)
+        describe_input(input_path)
+        progress('model-load', 5, f"Inicializando InSPyReNet ({mode})...")
         
         # Configurar o removedor
         # mode='base' usa o checkpoint padrão (InSPyReNet_SwinB) - Alta qualidade
         # mode='fast' usa InSPyReNet_Res2Net50 - Mais rápido
         remover = Remover(mode=mode, device='cuda' if torch.cuda.is_available() else 'cpu')
         
-        print(f"PROGRESS:Carregando imagem...", file=sys.stderr, flush=True)
+        progress('load', 30, f"Carregando imagem...", nbytes=file_size(input_path))
         img = Image.open(input_path).convert('RGB')
         
-        print(f"PROGRESS:Processando imagem (pode demorar alguns segundos)...", file=sys.stderr, flush=True)
+        if preview:
+            # Passe grosseiro em baixa resolução antes do processamento completo
+            write_preview(remover.process(downscaled(img), type='map'), output_path)
+        
+        progress('inference', 40, f"Processando imagem (pode demorar alguns segundos)...", nbytes=image_nbytes(img))
         out = remover.process(img)
         
-        print(f"PROGRESS:Salvando resultado...", file=sys.stderr, flush=True)
-        out.save(output_path)
+        progress('save', 90, f"Salvando resultado...", nbytes=image_nbytes(out))
+        save_image(out, output_path)
+        cli_store(cache, cache_key, output_path)
         
+        events.finish('ok', output=output_path, input_path=input_path)
         print(f"SUCCESS:{output_path}", flush=True)
         
     except Exception as e:
-        print(f"ERROR:{str(e)}", file=sys.stderr, flush=True)
+        message = str(e) if str(e).startswith("ERROR:") else f"ERROR:{str(e)}"
+        events.finish('error', error=message, input_path=input_path)
+        print(message, file=sys.stderr, flush=True)
         sys.exit(1)
 
 if __name__ == "__main__":
+    events.configure('background_remover_inspyrenet', sys.argv)
+    preview = pop_flag(sys.argv, '--preview', 'IMPRIME_PREVIEW')
+    configure_output(sys.argv)
+    configure_threads(sys.argv)
     if len(sys.argv) < 3:
-        print("Uso: python background_remover_inspyrenet.py <input_path> <output_path> [mode]")
+        print("Uso: python background_remover_inspyrenet.py <input_path> <output_path> [mode] [--preview] [--output-profile nome] [--threads N]")
         sys.exit(1)
         
     input_file = sys.argv[1]
-    output_file = sys.argv[2]
+    output_file = output_path_for(sys.argv[2])
     mode = sys.argv[3] if len(sys.argv) > 3 else 'base'
     
-    remove_background_inspyrenet(input_file, output_file, mode)
+    remove_background_inspyrenet(input_file, output_file, mode, preview)
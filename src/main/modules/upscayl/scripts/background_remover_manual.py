@@ -20,6 +20,17 @@ except ImportError as e:
     print(f"ERROR:Execute: pip install git+https://github.com/facebookresearch/segment-anything.git", file=sys.stderr)
     sys.exit(1)
 
+from sam_checkpoint import build_sam
+from model_downloader import download, percent_printer
+from sam_embedding_cache import EmbeddingCache, cache_enabled, file_digest, set_image_cached
+from sam_roi import roi_from_box, roi_from_points, predict_in_roi, paste_mask
+from remover_cli import describe_input
+from result_cache import cli_lookup, cli_store
+from image_encode import configure_output, output_path_for, profile_cache_params, save_image
+from stripe_pipeline import configure_streaming, use_streaming, compose_stream, image_rows
+from cli_events import events, progress, file_size, note_image
+from thread_budget import configure_threads
+
 # Caminho do modelo
 MODEL_FILENAME = "sam_vit_b_01ec64.pth"
 MODEL_URL = "https://dl.fbaipublicfiles.com/segment_anything/sam_vit_b_01ec64.pth"
@@ -37,15 +48,15 @@ def get_model_path():
     return os.path.join(base_path, MODEL_FILENAME)
 
 MODEL_PATH = get_model_path()
+MODEL_ID = "vit_b:" + MODEL_FILENAME
 
 def download_model_if_needed():
-    """Baixa o modelo SAM se não existir"""
+    """Baixa o modelo SAM se não existir (retomável, verificado e com rename atômico)"""
     if not os.path.exists(MODEL_PATH):
-        print(f"PROGRESS:Baixando modelo SAM (~375MB)...", file=sys.stderr, flush=True)
+        progress('download', 0, f"Baixando modelo SAM (~375MB)...")
         try:
-            import urllib.request
-            urllib.request.urlretrieve(MODEL_URL, MODEL_PATH)
-            print(f"PROGRESS:Modelo baixado com sucesso!", file=sys.stderr, flush=True)
+            download(MODEL_URL, MODEL_PATH, progress=percent_printer())
+            progress('download', 5, f"Modelo baixado com sucesso!")
         except Exception as e:
             raise Exception(f"ERROR:Erro ao baixar modelo: {e}")
 
@@ -59,6 +70,7 @@ def remove_background_manual(input_path, output_path, selection_data):
         selection_data: Dict com 'type' ('point' ou 'box') e coordenadas
             - point: {'type': 'point', 'x': int, 'y': int}
             - box: {'type': 'box', 'x1': int, 'y1': int, 'x2': int, 'y2': int}
+            - 'zoom': True (opcional) segmenta uma ROI em resolução nativa em volta do prompt
     
     Returns:
         str: Caminho do arquivo de saída se sucesso
@@ -68,11 +80,22 @@ def remove_background_manual(input_path, output_path, selection_data):
         if not os.path.exists(input_path):
             raise Exception(f"ERROR:Arquivo não encontrado: {input_path}")
         
+        # A seleção (tipo, coordenadas, zoom) faz parte da chave
+        cache_params = {key: value for key, value in selection_data.items() if key != 'zoom'}
+        cache_params['zoom'] = bool(selection_data.get('zoom', False))
+        cache_params.update(profile_cache_params())
+        output_cache, output_key, hit = cli_lookup(input_path, output_path, 'sam-manual', MODEL_ID, cache_params)
+        if hit:
+            return output_path
+        
+        describe_input(input_path)
+        
         # Baixar modelo se necessário
         download_model_if_needed()
         
-        print(f"PROGRESS:Carregando imagem...", file=sys.stderr, flush=True)
+        progress('load', 5, f"Carregando imagem...", nbytes=file_size(input_path))
         input_image = Image.open(input_path)
+        note_image(input_image)
         
         if input_image.mode != 'RGB':
             input_image = input_image.convert('RGB')
@@ -80,35 +103,27 @@ def remove_background_manual(input_path, output_path, selection_data):
         img_array = np.array(input_image)
         
         # Carregar modelo SAM
-        print(f"PROGRESS:Inicializando SAM...", file=sys.stderr, flush=True)
+        progress('model-load', 10, f"Inicializando SAM...")
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
         
-        sam = sam_model_registry["vit_b"](checkpoint=MODEL_PATH)
+        sam = build_sam("vit_b", MODEL_PATH)
         sam.to(device=device)
         
         predictor = SamPredictor(sam)
         
-        # Processar imagem
-        print(f"PROGRESS:Processando imagem...", file=sys.stderr, flush=True)
-        predictor.set_image(img_array)
+        cache = EmbeddingCache() if cache_enabled() else None
+        zoom = bool(selection_data.get('zoom', False))
         
         # Preparar prompt baseado no tipo de seleção
         if selection_data['type'] == 'point':
             # Modo ponto: usuário clicou no objeto
-            point_coords = np.array([[selection_data['x'], selection_data['y']]])
-            point_labels = np.array([1])  # 1 = foreground
-            
-            print(f"PROGRESS:Segmentando objeto no ponto ({selection_data['x']}, {selection_data['y']})...", file=sys.stderr, flush=True)
-            
-            masks, scores, _ = predictor.predict(
-                point_coords=point_coords,
-                point_labels=point_labels,
-                multimask_output=True  # Gera 3 máscaras, pegamos a melhor
-            )
-            
-            # Pegar a máscara com melhor score
-            best_mask_idx = np.argmax(scores)
-            mask = masks[best_mask_idx]
+            prompt = {
+                'point_coords': np.array([[selection_data['x'], selection_data['y']]]),
+                'point_labels': np.array([1]),  # 1 = foreground
+                'multimask_output': True  # Gera 3 máscaras, pegamos a melhor
+            }
+            roi = roi_from_points(prompt['point_coords'], img_array.shape) if zoom else None
+            message = f"Segmentando objeto no ponto ({selection_data['x']}, {selection_data['y']})..."
             
         elif selection_data['type'] == 'box':
             # Modo caixa: usuário desenhou retângulo
@@ -118,28 +133,51 @@ def remove_background_manual(input_path, output_path, selection_data):
                 selection_data['x2'],
                 selection_data['y2']
             ])
-            
-            print(f"PROGRESS:Segmentando área selecionada...", file=sys.stderr, flush=True)
-            
-            masks, scores, _ = predictor.predict(
-                box=box,
-                multimask_output=False  # Box já define bem a área
-            )
-            
-            mask = masks[0]
+            prompt = {
+                'box': box,
+                'multimask_output': False  # Box já define bem a área
+            }
+            roi = roi_from_box(box, img_array.shape) if zoom else None
+            message = "Segmentando área selecionada..."
         else:
             raise Exception(f"ERROR:Tipo de seleção inválido: {selection_data['type']}")
         
-        # Criar imagem RGBA com máscara
-        print(f"PROGRESS:Criando imagem com fundo transparente...", file=sys.stderr, flush=True)
+        if zoom:
+            # Modo zoom: embedding só do recorte (ROI) em resolução nativa, máscara colada de volta
+            progress('inference', 30, f"Processando região ampliada {roi[2] - roi[0]}x{roi[3] - roi[1]}...")
+            masks, scores, cached = predict_in_roi(predictor, img_array, roi, cache=cache, model_id=MODEL_ID, **prompt)
+            if cached:
+                progress('inference', 40, f"Embedding em cache, pulando o encoder...")
+            progress('inference', 50, message)
+            mask = paste_mask(masks[np.argmax(scores)], roi, img_array.shape)
+        else:
+            # Processar imagem (embedding reaproveitado do cache em disco quando a mesma arte já foi usada)
+            progress('inference', 30, f"Processando imagem...", nbytes=img_array.nbytes)
+            cache_key = EmbeddingCache.make_key(file_digest(input_path), MODEL_ID) if cache else None
+            if set_image_cached(predictor, img_array, cache, cache_key):
+                progress('inference', 40, f"Embedding em cache, pulando o encoder...")
+            
+            progress('inference', 50, message)
+            masks, scores, _ = predictor.predict(**prompt)
+            
+            # Pegar a máscara com melhor score
+            mask = masks[np.argmax(scores)]
         
-        result = Image.new('RGBA', (img_array.shape[1], img_array.shape[0]))
-        img_pil = Image.fromarray(img_array)
-        result.paste(img_pil, (0, 0))
+        # Criar imagem RGBA com máscara
+        progress('compose', 80, f"Criando imagem com fundo transparente...")
         
-        # Aplicar máscara
-        alpha = np.where(mask, 255, 0).astype(np.uint8)
-        result.putalpha(Image.fromarray(alpha))
+        if use_streaming((img_array.shape[1], img_array.shape[0])):
+            # Impressão muito grande: cor + máscara faixa por faixa, direto para o disco
+            result = compose_stream((img_array.shape[1], img_array.shape[0]),
+                                    rgb_rows=image_rows(img_array), alpha_rows=image_rows(mask))
+        else:
+            result = Image.new('RGBA', (img_array.shape[1], img_array.shape[0]))
+            img_pil = Image.fromarray(img_array)
+            result.paste(img_pil, (0, 0))
+            
+            # Aplicar máscara
+            alpha = np.where(mask, 255, 0).astype(np.uint8)
+            result.putalpha(Image.fromarray(alpha))
         
         # Garantir diretório de saída
         output_dir = os.path.dirname(output_path)
@@ -147,14 +185,18 @@ def remove_background_manual(input_path, output_path, selection_data):
             os.makedirs(output_dir, exist_ok=True)
         
         # Salvar
-        print(f"PROGRESS:Salvando resultado...", file=sys.stderr, flush=True)
-        result.save(output_path, 'PNG', optimize=True)
+        progress('save', 90, f"Salvando resultado...")
+        try:
+            save_image(result, output_path)
+        finally:
+            result.close()  # no modo streaming apaga o temporário das faixas
         
-        print(f"PROGRESS:Concluído!", file=sys.stderr, flush=True)
+        progress('done', 100, f"Concluído!")
         
         if not os.path.exists(output_path):
             raise Exception("ERROR:Arquivo de saída não foi criado")
         
+        cli_store(output_cache, output_key, output_path)
         return output_path
         
     except Exception as e:
@@ -165,20 +207,26 @@ def remove_background_manual(input_path, output_path, selection_data):
             raise Exception(f"ERROR:Erro ao remover fundo: {error_msg}")
 
 if __name__ == '__main__':
+    events.configure('background_remover_manual', sys.argv)
+    configure_output(sys.argv)
+    configure_threads(sys.argv)
+    configure_streaming(sys.argv)
     if len(sys.argv) < 4:
-        print("ERROR:Uso: python background_remover_manual.py <input_path> <output_path> <selection_json>")
+        print("ERROR:Uso: python background_remover_manual.py <input_path> <output_path> <selection_json> [--output-profile nome] [--threads N] [--stream]")
         print("ERROR:selection_json exemplo: {\"type\":\"point\",\"x\":100,\"y\":200}")
         sys.exit(1)
     
     input_path = sys.argv[1]
-    output_path = sys.argv[2]
+    output_path = output_path_for(sys.argv[2])
     selection_json = sys.argv[3]
     
     try:
         selection_data = json.loads(selection_json)
         result = remove_background_manual(input_path, output_path, selection_data)
+        events.finish('ok', output=result, input_path=input_path)
         print(f"SUCCESS:{result}")
         sys.exit(0)
     except Exception as e:
+        events.finish('error', error=str(e), input_path=input_path)
         print(str(e), file=sys.stderr, flush=True)
         sys.exit(1)
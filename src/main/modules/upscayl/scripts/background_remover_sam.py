@@ -7,85 +7,174 @@ Versão otimizada para remoção automática de fundo
 
 import sys
 import os
+import time
 import numpy as np
 from PIL import Image
 import torch
 
 # Imports do SAM
 try:
-    from segment_anything import sam_model_registry, SamAutomaticMaskGenerator
+    from segment_anything import sam_model_registry, SamAutomaticMaskGenerator, SamPredictor
 except ImportError as e:
     print(f"ERROR:Erro ao importar SAM: {str(e)}", file=sys.stderr)
     print(f"ERROR:Execute: pip install git+https://github.com/facebookresearch/segment-anything.git", file=sys.stderr)
     sys.exit(1)
 
+from sam_checkpoint import build_sam
+from model_downloader import download, percent_printer
+from remover_cli import pop_flag, write_preview, describe_input
+from result_cache import cli_lookup, cli_store
+from image_encode import configure_output, output_path_for, profile_cache_params, save_image
+from stripe_pipeline import configure_streaming, use_streaming, compose_stream, image_rows, resized_rows
+from cli_events import events, progress, file_size, note_image
+from thread_budget import configure_threads
+
 # Caminho do modelo (será baixado automaticamente se necessário)
 MODEL_PATH = "sam_vit_b_01ec64.pth"
 MODEL_URL = "https://dl.fbaipublicfiles.com/segment_anything/sam_vit_b_01ec64.pth"
 
 def download_model_if_needed():
-    """Baixa o modelo SAM se não existir"""
+    """Baixa o modelo SAM se não existir (retomável, verificado e com rename atômico)"""
     if not os.path.exists(MODEL_PATH):
-        print(f"PROGRESS:Baixando modelo SAM (~375MB)...", file=sys.stderr, flush=True)
+        progress('download', 0, f"Baixando modelo SAM (~375MB)...")
         try:
-            import urllib.request
-            urllib.request.urlretrieve(MODEL_URL, MODEL_PATH)
-            print(f"PROGRESS:Modelo baixado com sucesso!", file=sys.stderr, flush=True)
+            download(MODEL_URL, MODEL_PATH, progress=percent_printer())
+            progress('download', 5, f"Modelo baixado com sucesso!")
         except Exception as e:
             raise Exception(f"ERROR:Erro ao baixar modelo: {e}")
 
+# Estratégias do modo automático:
+# - 'grid': SamAutomaticMaskGenerator com grade 24x24 + crop layer (padrão, ~1150 prompts e 5 passes do encoder)
+# - 'center': grade de pontos ponderada ao centro, em anéis, com parada antecipada (opt-in pelo 5º argumento;
+#   mais rápido, mas ainda sem comparação de qualidade com os pesos reais)
+AUTO_STRATEGIES = ('center', 'grid')
+
+# Anéis (raio normalizado, número de pontos): 1 + 6 + 8 + 10 + 12 = 37 prompts no máximo
+CENTER_RINGS = [(0.0, 1), (0.08, 6), (0.16, 8), (0.25, 10), (0.35, 12)]
+
+# Candidato "dominante": bom IoU previsto, tamanho razoável e bem centralizado -> para de gerar
+DOMINANT_MIN_IOU = 0.88
+DOMINANT_MIN_AREA = 0.05
+DOMINANT_MAX_DIST = 0.2
+
+def score_candidate(area_ratio, center_x, center_y, predicted_iou):
+    """
+    Score do objeto principal: quanto maior a área e mais centralizado, melhor
+    center_x/center_y normalizados (0-1). Retorna (score, distância do centro)
+    """
+    dist_from_center = np.sqrt((center_x - 0.5) ** 2 + (center_y - 0.5) ** 2)
+    return area_ratio * (1 - dist_from_center) * predicted_iou, dist_from_center
+
 def find_main_object_mask(masks, image_shape):
     """
-    Encontra a máscara do objeto principal
+    Encontra a máscara do objeto principal (estratégia 'grid')
     Estratégia: maior área que não seja o fundo inteiro, mais centralizada
+    Usa 'area' e 'bbox' (XYWH) já calculados pelo gerador, sem varrer cada máscara
     """
     if not masks:
         return None
     
     height, width = image_shape[:2]
     total_pixels = height * width
-    center_y, center_x = height // 2, width // 2
-    
-    # Ordenar por área (maior primeiro)
-    masks_sorted = sorted(masks, key=lambda x: x['area'], reverse=True)
     
     best_mask = None
     best_score = -1
     
-    for mask_data in masks_sorted:
-        area = mask_data['area']
-        area_ratio = area / total_pixels
+    for mask_data in masks:
+        area_ratio = mask_data['area'] / total_pixels
         
         # Ignorar se for muito grande (provavelmente fundo) ou muito pequeno
         if area_ratio > 0.85 or area_ratio < 0.01:
             continue
         
-        # Calcular centralização
-        segmentation = mask_data['segmentation']
-        y_coords, x_coords = np.where(segmentation)
-        if len(y_coords) == 0:
-            continue
-        
-        centroid_y = np.mean(y_coords)
-        centroid_x = np.mean(x_coords)
-        
-        # Distância do centro (normalizada)
-        dist_from_center = np.sqrt(
-            ((centroid_x - center_x) / width) ** 2 +
-            ((centroid_y - center_y) / height) ** 2
+        # Centro da bounding box como aproximação do centróide
+        x, y, w, h = mask_data['bbox']
+        score, _ = score_candidate(
+            area_ratio,
+            (x + w / 2) / width,
+            (y + h / 2) / height,
+            mask_data['predicted_iou']
         )
         
-        # Score: combina área e centralização
-        # Quanto maior a área e mais centralizado, melhor
-        score = area_ratio * (1 - dist_from_center) * mask_data['predicted_iou']
-        
         if score > best_score:
             best_score = score
             best_mask = mask_data
     
     return best_mask['segmentation'] if best_mask else None
 
-def remove_background_sam(input_path, output_path, remove_internal_blacks=False, black_threshold=30):
+def center_weighted_points(width, height, rings=CENTER_RINGS):
+    """Gera os anéis de pontos (em pixels) do centro para fora"""
+    for ring_index, (radius, count) in enumerate(rings):
+        if radius == 0:
+            normalized = np.array([[0.5, 0.5]])
+        else:
+            # Anéis alternados defasados para não alinhar os pontos radialmente
+            angles = np.linspace(0, 2 * np.pi, count, endpoint=False) + (np.pi / count) * (ring_index % 2)
+            normalized = np.stack([0.5 + radius * np.cos(angles), 0.5 + radius * np.sin(angles)], axis=1)
+        yield normalized * np.array([width, height])
+
+def _mask_stats(mask, step):
+    """Área e centróide normalizados a partir de uma versão subamostrada da máscara"""
+    small = mask[::step, ::step]
+    total = small.sum()
+    if total == 0:
+        return 0.0, 0.5, 0.5
+    cols = small.sum(axis=0)
+    rows = small.sum(axis=1)
+    center_x = (cols @ np.arange(small.shape[1])) / total / small.shape[1]
+    center_y = (rows @ np.arange(small.shape[0])) / total / small.shape[0]
+    return total / small.size, center_x, center_y
+
+def find_main_object_center_first(predictor, img_array):
+    """
+    Estratégia 'center': um único passe do encoder e prompts em anéis a partir do centro,
+    decodificados em lote por anel; para assim que encontra um candidato dominante
+
+    Returns:
+        (máscara ou None, dict com estatísticas)
+    """
+    import torch
+    
+    height, width = img_array.shape[:2]
+    step = max(1, max(height, width) // 256)
+    stats = {'decoder_calls': 0, 'masks': 0, 'early_stop': False}
+    
+    best_mask = None
+    best_score = -1
+    
+    for ring in center_weighted_points(width, height):
+        coords = predictor.transform.apply_coords(ring, predictor.original_size)
+        coords = torch.as_tensor(coords, dtype=torch.float, device=predictor.device)[:, None, :]
+        labels = torch.ones((len(ring), 1), dtype=torch.int, device=predictor.device)
+        
+        with torch.no_grad():
+            masks, scores, _ = predictor.predict_torch(coords, labels, multimask_output=True)
+        stats['decoder_calls'] += len(ring)
+        
+        masks = masks.cpu().numpy()
+        scores = scores.cpu().numpy()
+        stats['masks'] += masks.shape[0] * masks.shape[1]
+        
+        dominant = False
+        for point_masks, point_scores in zip(masks, scores):
+            for mask, predicted_iou in zip(point_masks, point_scores):
+                area_ratio, center_x, center_y = _mask_stats(mask, step)
+                if area_ratio > 0.85 or area_ratio < 0.01:
+                    continue
+                score, dist = score_candidate(area_ratio, center_x, center_y, float(predicted_iou))
+                if score > best_score:
+                    best_score = score
+                    best_mask = mask
+                if predicted_iou >= DOMINANT_MIN_IOU and area_ratio >= DOMINANT_MIN_AREA and dist <= DOMINANT_MAX_DIST:
+                    dominant = True
+        
+        if dominant:
+            stats['early_stop'] = True
+            break
+    
+    return best_mask, stats
+
+def remove_background_sam(input_path, output_path, remove_internal_blacks=False, black_threshold=30, strategy='grid', preview=False):
     """
     Remove o fundo usando SAM
     
@@ -94,6 +183,8 @@ def remove_background_sam(input_path, output_path, remove_internal_blacks=False,
         output_path: Caminho da imagem de saída (PNG com transparência)
         remove_internal_blacks: Se True, remove pretos internos também
         black_threshold: Threshold para considerar pixel como "preto" (0-255)
+        strategy: 'grid' (gerador automático completo, padrão) ou 'center' (rápido, opt-in)
+        preview: Se True, grava a máscara em resolução de trabalho antes de restaurar o tamanho original
     
     Returns:
         str: Caminho do arquivo de saída se sucesso
@@ -103,11 +194,23 @@ def remove_background_sam(input_path, output_path, remove_internal_blacks=False,
         if not os.path.exists(input_path):
             raise Exception(f"ERROR:Arquivo de entrada não encontrado: {input_path}")
         
+        cache, cache_key, hit = cli_lookup(input_path, output_path, 'sam', MODEL_PATH, {
+            'strategy': strategy,
+            'max_dimension': 1024,
+            'remove_blacks': black_threshold if remove_internal_blacks else None,
+            **profile_cache_params(),
+        })
+        if hit:
+            return output_path
+        
+        describe_input(input_path)
+        
         # Baixar modelo se necessário
         download_model_if_needed()
         
-        print(f"PROGRESS:Carregando imagem...", file=sys.stderr, flush=True)
+        progress('load', 5, f"Carregando imagem...", nbytes=file_size(input_path))
         input_image = Image.open(input_path)
+        note_image(input_image)
         original_size = input_image.size
         
         # Converter para RGB se necessário
@@ -119,69 +222,107 @@ def remove_background_sam(input_path, output_path, remove_internal_blacks=False,
         # OTIMIZAÇÃO: Redimensionar se muito grande
         MAX_DIMENSION = 1024  # SAM funciona bem com imagens menores
         if max(original_size) > MAX_DIMENSION:
-            print(f"PROGRESS:Redimensionando imagem grande ({original_size[0]}x{original_size[1]}) para {MAX_DIMENSION}px...", file=sys.stderr, flush=True)
+            progress('resize', 10, f"Redimensionando imagem grande ({original_size[0]}x{original_size[1]}) para {MAX_DIMENSION}px...")
             ratio = MAX_DIMENSION / max(original_size)
             new_size = (int(original_size[0] * ratio), int(original_size[1] * ratio))
             input_image_resized = input_image.resize(new_size, Image.Resampling.LANCZOS)
             img_array = np.array(input_image_resized)
-            print(f"PROGRESS:Nova resolução para processamento: {new_size[0]}x{new_size[1]}", file=sys.stderr, flush=True)
+            progress('resize', 12, f"Nova resolução para processamento: {new_size[0]}x{new_size[1]}")
         
         # Carregar modelo SAM
-        print(f"PROGRESS:Inicializando SAM (Meta AI)...", file=sys.stderr, flush=True)
+        progress('model-load', 15, f"Inicializando SAM (Meta AI)...")
         device = 'cuda' if torch.cuda.is_available() else 'cpu'
         
-        sam = sam_model_registry["vit_b"](checkpoint=MODEL_PATH)
+        sam = build_sam("vit_b", MODEL_PATH)
         sam.to(device=device)
         
-        # Criar gerador de máscaras
-        print(f"PROGRESS:Gerando máscaras de segmentação...", file=sys.stderr, flush=True)
-        mask_generator = SamAutomaticMaskGenerator(
-            model=sam,
-            points_per_side=24,  # Otimizado para performance
-            pred_iou_thresh=0.88,
-            stability_score_thresh=0.95,
-            crop_n_layers=1,
-            crop_n_points_downscale_factor=2,
-            min_mask_region_area=100,
-        )
+        if strategy not in AUTO_STRATEGIES:
+            raise Exception(f"ERROR:Estratégia inválida: {strategy}")
         
-        masks = mask_generator.generate(img_array)
-        print(f"PROGRESS:Geradas {len(masks)} máscaras. Identificando objeto principal...", file=sys.stderr, flush=True)
+        segment_start = time.perf_counter()
+        if strategy == 'center':
+            progress('inference', 30, f"Segmentando a partir do centro...", nbytes=img_array.nbytes)
+            predictor = SamPredictor(sam)
+            predictor.set_image(img_array)
+            main_mask, stats = find_main_object_center_first(predictor, img_array)
+            mask_count = stats['masks']
+            decoder_calls = stats['decoder_calls']
+            if stats['early_stop']:
+                progress('inference', 60, f"Objeto dominante encontrado após {decoder_calls} prompts")
+        else:
+            # Criar gerador de máscaras
+            progress('inference', 30, f"Gerando máscaras de segmentação...", nbytes=img_array.nbytes)
+            mask_generator = SamAutomaticMaskGenerator(
+                model=sam,
+                points_per_side=24,  # Otimizado para performance
+                pred_iou_thresh=0.88,
+                stability_score_thresh=0.95,
+                crop_n_layers=1,
+                crop_n_points_downscale_factor=2,
+                min_mask_region_area=100,
+            )
+            
+            masks = mask_generator.generate(img_array)
+            mask_count = len(masks)
+            decoder_calls = 24 * 24 + 4 * (24 // 2) ** 2
+            progress('select', 60, f"Geradas {len(masks)} máscaras. Identificando objeto principal...")
+            
+            # Encontrar máscara do objeto principal
+            main_mask = find_main_object_mask(masks, img_array.shape)
         
-        # Encontrar máscara do objeto principal
-        main_mask = find_main_object_mask(masks, img_array.shape)
+        segment_ms = (time.perf_counter() - segment_start) * 1000
+        progress('select', 65, f"Segmentação ({strategy}): {mask_count} máscaras, {decoder_calls} prompts, {segment_ms:.0f}ms")
         
         if main_mask is None:
             raise Exception("ERROR:Não foi possível identificar o objeto principal na imagem")
         
-        print(f"PROGRESS:Objeto principal identificado. Criando imagem com fundo transparente...", file=sys.stderr, flush=True)
+        progress('compose', 70, f"Objeto principal identificado. Criando imagem com fundo transparente...")
         
-        # Se redimensionamos, voltar ao tamanho original
-        if max(original_size) > MAX_DIMENSION:
-            print(f"PROGRESS:Restaurando resolução original...", file=sys.stderr, flush=True)
-            main_mask_pil = Image.fromarray(main_mask.astype(np.uint8) * 255)
-            main_mask_pil = main_mask_pil.resize(original_size, Image.Resampling.LANCZOS)
-            main_mask = np.array(main_mask_pil) > 128
-            img_array = np.array(input_image)
-        
-        # Criar imagem RGBA
-        result = Image.new('RGBA', (img_array.shape[1], img_array.shape[0]))
-        img_pil = Image.fromarray(img_array)
-        result.paste(img_pil, (0, 0))
-        
-        # Aplicar máscara alpha
-        alpha = np.where(main_mask, 255, 0).astype(np.uint8)
-        result.putalpha(Image.fromarray(alpha))
-        
-        # Remover pretos internos se solicitado
-        if remove_internal_blacks:
-            print(f"PROGRESS:Removendo pretos internos (threshold: {black_threshold})...", file=sys.stderr, flush=True)
-            data = np.array(result)
-            r, g, b, a = data[:,:,0], data[:,:,1], data[:,:,2], data[:,:,3]
-            is_black = (r <= black_threshold) & (g <= black_threshold) & (b <= black_threshold)
-            a[is_black] = 0
-            data[:,:,3] = a
-            result = Image.fromarray(data, 'RGBA')
+        if preview:
+            write_preview(main_mask.astype(np.uint8) * 255, output_path)
+        
+        if use_streaming(original_size):
+            # Impressão muito grande: máscara ampliada, alpha e pretos faixa por faixa, direto para o disco
+            progress('restore', 75, f"Montando resultado em faixas...")
+            if max(original_size) > MAX_DIMENSION:
+                upscaled = resized_rows(Image.fromarray(main_mask.astype(np.uint8) * 255), original_size)
+                mask_rows = lambda start, stop: upscaled(start, stop) > 128
+            else:
+                mask_rows = image_rows(main_mask)
+            del img_array
+            result = compose_stream(
+                original_size,
+                rgb_rows=image_rows(input_image),
+                alpha_rows=mask_rows,
+                black_threshold=black_threshold if remove_internal_blacks else None,
+            )
+        else:
+            # Se redimensionamos, voltar ao tamanho original
+            if max(original_size) > MAX_DIMENSION:
+                progress('restore', 75, f"Restaurando resolução original...")
+                main_mask_pil = Image.fromarray(main_mask.astype(np.uint8) * 255)
+                main_mask_pil = main_mask_pil.resize(original_size, Image.Resampling.LANCZOS)
+                main_mask = np.array(main_mask_pil) > 128
+                img_array = np.array(input_image)
+            
+            # Criar imagem RGBA
+            result = Image.new('RGBA', (img_array.shape[1], img_array.shape[0]))
+            img_pil = Image.fromarray(img_array)
+            result.paste(img_pil, (0, 0))
+            
+            # Aplicar máscara alpha
+            alpha = np.where(main_mask, 255, 0).astype(np.uint8)
+            result.putalpha(Image.fromarray(alpha))
+            
+            # Remover pretos internos se solicitado
+            if remove_internal_blacks:
+                progress('postprocess', 85, f"Removendo pretos internos (threshold: {black_threshold})...")
+                data = np.array(result)
+                r, g, b, a = data[:,:,0], data[:,:,1], data[:,:,2], data[:,:,3]
+                is_black = (r <= black_threshold) & (g <= black_threshold) & (b <= black_threshold)
+                a[is_black] = 0
+                data[:,:,3] = a
+                result = Image.fromarray(data, 'RGBA')
         
         # Garantir que o diretório de saída existe
         output_dir = os.path.dirname(output_path)
@@ -189,14 +330,18 @@ def remove_background_sam(input_path, output_path, remove_internal_blacks=False,
             os.makedirs(output_dir, exist_ok=True)
         
         # Salvar
-        print(f"PROGRESS:Salvando resultado...", file=sys.stderr, flush=True)
-        result.save(output_path, 'PNG', optimize=True)
+        progress('save', 90, f"Salvando resultado...")
+        try:
+            save_image(result, output_path)
+        finally:
+            result.close()  # no modo streaming apaga o temporário das faixas
         
-        print(f"PROGRESS:Concluído!", file=sys.stderr, flush=True)
+        progress('done', 100, f"Concluído!")
         
         if not os.path.exists(output_path):
             raise Exception("ERROR:Arquivo de saída não foi criado")
         
+        cli_store(cache, cache_key, output_path)
         return output_path
         
     except Exception as e:
@@ -207,19 +352,27 @@ def remove_background_sam(input_path, output_path, remove_internal_blacks=False,
             raise Exception(f"ERROR:Erro ao remover fundo: {error_msg}")
 
 if __name__ == '__main__':
+    events.configure('background_remover_sam', sys.argv)
+    preview = pop_flag(sys.argv, '--preview', 'IMPRIME_PREVIEW')
+    configure_output(sys.argv)
+    configure_threads(sys.argv)
+    configure_streaming(sys.argv)
     if len(sys.argv) < 3:
-        print("ERROR:Uso: python background_remover_sam.py <input_path> <output_path> [remove_blacks] [threshold]")
+        print("ERROR:Uso: python background_remover_sam.py <input_path> <output_path> [remove_blacks] [threshold] [grid|center] [--preview] [--output-profile nome] [--threads N] [--stream]")
         sys.exit(1)
     
     input_path = sys.argv[1]
-    output_path = sys.argv[2]
+    output_path = output_path_for(sys.argv[2])
     remove_blacks = sys.argv[3].lower() == 'true' if len(sys.argv) > 3 else False
     threshold = int(sys.argv[4]) if len(sys.argv) > 4 else 30
+    strategy = sys.argv[5] if len(sys.argv) > 5 else 'grid'
     
     try:
-        result = remove_background_sam(input_path, output_path, remove_blacks, threshold)
+        result = remove_background_sam(input_path, output_path, remove_blacks, threshold, strategy, preview)
+        events.finish('ok', output=result, input_path=input_path)
         print(f"SUCCESS:{result}")
         sys.exit(0)
     except Exception as e:
+        events.finish('error', error=str(e), input_path=input_path)
         print(str(e), file=sys.stderr, flush=True)
         sys.exit(1)
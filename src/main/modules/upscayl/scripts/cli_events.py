@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Eventos estruturados (JSON por linha) para os scripts de linha de comando
+As linhas PROGRESS:/ERROR:/SUCCESS: continuam iguais; o modo estruturado é opcional e
+acrescenta, para cada etapa, uma linha EVENT:{json} em stderr (e/ou uma linha JSON pura
+num arquivo, para agregar dados de desempenho de milhares de jobs).
+
+Ativação:
+    --events na linha de comando, ou IMPRIME_EVENTS=1   -> EVENT:{...} em stderr
+    IMPRIME_EVENTS_FILE=/caminho/eventos.jsonl          -> JSON por linha anexado ao arquivo
+    --profile-memory, ou IMPRIME_PROFILE_MEMORY=1       -> perfil de memória por etapa
+                                                           (memory_profile.py; linhas [Debug] e
+                                                           campo "memory" no evento final)
+
+Evento de etapa:
+    {"event": "progress", "tool": ..., "run_id": ..., "stage": "load", "pct": 5,
+     "elapsed_ms": 12.3, "peak_rss": 123456789, "bytes": 4096, "message": "..."}
+Evento final (finish):
+    {"event": "summary", "status": "ok", "elapsed_ms": ..., "peak_rss": ...,
+     "stages": {"load": {"ms": 12.3, "bytes": 4096}, ...}, "bytes_in": ..., "bytes_out": ...}
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+EVENTS_FLAG = "--events"
+EVENTS_ENV = "IMPRIME_EVENTS"
+EVENTS_FILE_ENV = "IMPRIME_EVENTS_FILE"
+
+
+def peak_rss():
+    """Pico de memória residente do processo em bytes (None se indisponível)"""
+    if sys.platform == "win32":
+        # Windows não tem o módulo resource; o psutil expõe o pico do working set
+        if psutil is None:
+            return None
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reporta em KB, macOS em bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+class ProgressEvents:
+    """Linhas PROGRESS: de sempre + eventos estruturados opcionais com tempo por etapa"""
+
+    def __init__(self, tool="script", enabled=False, events_file=None, stream=None):
+        self.tool = tool
+        self.enabled = enabled
+        self.events_file = events_file
+        self.stream = stream
+        self.run_id = uuid.uuid4().hex
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.bytes_in = None
+        self.bytes_out = None
+        self._current = None
+        self._current_start = None
+        self._finished = False
+        self.memory = None
+
+    def configure(self, tool, argv=None):
+        """Define o nome da ferramenta e lê --events (removido de argv) / variáveis de ambiente"""
+        self.tool = tool
+        flag = False
+        if argv is not None:
+            flag = EVENTS_FLAG in argv
+            while EVENTS_FLAG in argv:
+                argv.remove(EVENTS_FLAG)
+        env = os.environ.get(EVENTS_ENV, "0").lower() in ("1", "true", "yes", "json")
+        self.enabled = flag or env
+        self.events_file = os.environ.get(EVENTS_FILE_ENV) or None
+        self.start = time.perf_counter()
+        self._configure_memory(argv)
+        return self
+
+    def _configure_memory(self, argv):
+        try:
+            from memory_profile import MemoryProfiler, profile_memory_requested
+        except ImportError:
+            return
+        if profile_memory_requested(argv):
+            self.memory = MemoryProfiler().start()
+
+    @property
+    def active(self):
+        return self.enabled or self.events_file is not None
+
+    def _elapsed_ms(self, since=None):
+        return round((time.perf_counter() - (since if since is not None else self.start)) * 1000, 1)
+
+    def _emit(self, payload):
+        if not self.active:
+            return
+        payload = {"v": 1, "tool": self.tool, "run_id": self.run_id, **payload}
+        line = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        if self.enabled:
+            print(f"EVENT:{line}", file=self.stream or sys.stderr, flush=True)
+        if self.events_file:
+            try:
+                with open(self.events_file, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError:
+                pass
+
+    def _close_stage(self):
+        if self._current is None:
+            return
+        entry = self.stages.setdefault(self._current, {"ms": 0.0, "bytes": None})
+        entry["ms"] = round(entry["ms"] + self._elapsed_ms(self._current_start), 1)
+        if self.memory is not None:
+            self.memory.end(self._current)
+        self._current = None
+
+    def progress(self, stage, pct=None, message=None, nbytes=None):
+        """
+        Abre a etapa `stage` (fechando a anterior) e anuncia: PROGRESS:<message> sempre,
+        EVENT:{...} no modo estruturado. nbytes = bytes processados nesta etapa, se conhecido.
+        """
+        if stage != self._current:
+            self._close_stage()
+            self._current = stage
+            self._current_start = time.perf_counter()
+            if self.memory is not None:
+                self.memory.begin(stage)
+        if nbytes is not None:
+            entry = self.stages.setdefault(stage, {"ms": 0.0, "bytes": None})
+            entry["bytes"] = (entry["bytes"] or 0) + int(nbytes)
+        if message is not None:
+            print(f"PROGRESS:{message}", file=self.stream or sys.stderr, flush=True)
+        self._emit({
+            "event": "progress",
+            "stage": stage,
+            "pct": pct,
+            "elapsed_ms": self._elapsed_ms(),
+            "peak_rss": peak_rss(),
+            "bytes": nbytes,
+            "message": message,
+        })
+
+    def finish(self, status="ok", output=None, error=None, input_path=None):
+        """Evento final com o tempo de cada etapa (uma vez por execução)"""
+        if self._finished:
+            return
+        self._finished = True
+        self._close_stage()
+        if input_path is not None and self.bytes_in is None:
+            self.bytes_in = file_size(input_path)
+        if output is not None and self.bytes_out is None:
+            self.bytes_out = file_size(output)
+        memory = None
+        peak = peak_rss()
+        if self.memory is not None:
+            self.memory.stop()
+            memory = self.memory.summary()
+            for line in self.memory.report_lines():
+                print(f"[Debug] {line}", file=self.stream or sys.stderr, flush=True)
+            # O perfil zera o pico do kernel a cada etapa: o pico do processo é o maior das etapas
+            if memory["peak_rss_mb"] is not None:
+                peak = max(peak or 0, int(memory["peak_rss_mb"] * 1024 * 1024))
+        self._emit({
+            "event": "summary",
+            "status": status,
+            "elapsed_ms": self._elapsed_ms(),
+            "peak_rss": peak,
+            "stages": self.stages,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "output": output,
+            "error": error,
+            **({"memory": memory} if memory is not None else {}),
+        })
+
+
+# Um processo = uma execução de script: instância única compartilhada pelos módulos auxiliares
+events = ProgressEvents()
+
+
+def progress(stage, pct=None, message=None, nbytes=None):
+    events.progress(stage, pct, message, nbytes)
+
+
+def note_image(image):
+    """Informa ao perfil de memória (se ativo) o tamanho da imagem: define o que é uma cópia inteira"""
+    if events.memory is None:
+        return
+    if hasattr(image, "shape"):
+        if len(image.shape) >= 2:
+            events.memory.note_image(image.shape[1], image.shape[0])
+    else:
+        events.memory.note_image(*image.size)
+
+
+def image_nbytes(image):
+    """Bytes do buffer de pixels de uma PIL Image ou array numpy"""
+    note_image(image)
+    if hasattr(image, "nbytes"):
+        return int(image.nbytes)
+    width, height = image.size
+    return width * height * len(image.getbands())
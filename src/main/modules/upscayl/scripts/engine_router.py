@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Roteador automático de motores de remoção de fundo
+Escolhe motor, resolução de trabalho e refinamento a partir de características baratas da
+imagem e de um orçamento de latência por pedido, e executa o script escolhido (mesmo protocolo
+PROGRESS:/ERROR:/SUCCESS: dos background_remover*.py, repassado sem alteração).
+
+Características (dezenas de ms, numa miniatura de FEATURE_SIDE px):
+    cabeçalho       image_probe: dimensões, formato, canal alpha
+    recorte pronto  alpha já usado (borda transparente): nada a remover, só regrava
+    borda uniforme  desvio padrão da cor na borda: fundo liso -> motor rápido basta
+    densidade de bordas  fração de pixels com gradiente forte: arte detalhada -> motor fino
+
+Decisão: entre os motores disponíveis, o de maior qualidade para a classe de conteúdo
+(simple/complex) cuja latência estimada cabe no orçamento; se nenhum cabe, o mais rápido.
+Latência estimada = fixed_ms + per_mp_ms * MP de trabalho + output_mp_ms * MP da imagem.
+Cada decisão vai para stderr ([Router]) e para um log JSONL (IMPRIME_ROUTER_LOG; "0" desliga).
+
+Tabela de roteamento: DEFAULT_TABLE, sobreposta pelo JSON em IMPRIME_ROUTING_TABLE (ou
+routing_table.json na pasta de dados). "tune" recalcula latências e qualidade a partir dos
+relatórios de benchmarks/bench_removers.py e benchmarks/bench_quality.py.
+
+Uso:
+    python engine_router.py <input> <output> [remove_blacks] [threshold] [--budget-ms N]
+                            [--engine nome] [--dry-run] [flags dos scripts: --preview, --stream, --threads N, ...]
+    python engine_router.py tune <relatorio.json> [<relatorio.json> ...] [--out tabela.json]
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import base64
+import argparse
+import subprocess
+import urllib.request
+from collections import namedtuple
+from importlib.util import find_spec
+
+import numpy as np
+from PIL import Image
+
+from image_probe import ProbeError, describe, probe
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROUTING_TABLE_ENV = "IMPRIME_ROUTING_TABLE"
+ROUTER_LOG_ENV = "IMPRIME_ROUTER_LOG"
+DEFAULT_BUDGET_MS = 60000
+FEATURE_SIDE = 256
+# Diferença de cinza entre vizinhos que conta como borda na miniatura
+EDGE_STEP = 24
+SERVER_TIMEOUT_S = 0.5
+PASSTHROUGH = "passthrough"
+
+# Latências de referência: CPU de 8 núcleos, modelo em cache de disco (rodar "tune" para a máquina real).
+# quality: nota 0-1 por classe de conteúdo; max_side: lado máximo em que o motor infere (None = inteiro).
+DEFAULT_TABLE = {
+    "version": 1,
+    "thresholds": {
+        "cutout_transparent": 0.02,   # fração mínima de pixels transparentes para "recorte pronto"
+        "cutout_border": 0.5,         # ... e fração da borda que precisa estar transparente
+        "uniform_border_std": 14.0,   # desvio padrão da borda (0-255) abaixo do qual o fundo é liso
+        "complex_edge_density": 0.10,  # fração de pixels de borda acima da qual a arte é detalhada
+    },
+    "output_mp_ms": 120,
+    "engines": {
+        "rembg-isnet-1600": {
+            "script": "background_remover.py", "env": {"IMPRIME_MAX_SIDE": "1600"}, "module": "rembg",
+            "max_side": 1600, "blacks": True, "fixed_ms": 5000, "per_mp_ms": 1400,
+            "quality": {"simple": 0.86, "complex": 0.74},
+        },
+        "rembg-isnet": {
+            "script": "background_remover.py", "module": "rembg",
+            "max_side": 2500, "blacks": True, "fixed_ms": 5000, "per_mp_ms": 1400,
+            "quality": {"simple": 0.90, "complex": 0.80},
+        },
+        "rembg-u2net": {
+            "script": "background_remover_highprecision.py", "module": "rembg",
+            "max_side": None, "blacks": True, "fixed_ms": 7000, "per_mp_ms": 6000,
+            "quality": {"simple": 0.88, "complex": 0.85},
+        },
+        "inspyrenet-fast": {
+            "script": "background_remover_inspyrenet.py", "args": ["fast"], "module": "transparent_background",
+            "max_side": None, "blacks": False, "fixed_ms": 9000, "per_mp_ms": 1800,
+            "quality": {"simple": 0.91, "complex": 0.88},
+        },
+        "inspyrenet-base": {
+            "script": "background_remover_inspyrenet.py", "args": ["base"], "module": "transparent_background",
+            "max_side": None, "blacks": False, "fixed_ms": 14000, "per_mp_ms": 5000,
+            "quality": {"simple": 0.93, "complex": 0.93},
+        },
+        "sam-auto": {
+            "script": "background_remover_sam.py", "args_after_blacks": ["center"], "module": "segment_anything",
+            "max_side": 1024, "blacks": True, "fixed_ms": 9000, "per_mp_ms": 25000,
+            "quality": {"simple": 0.82, "complex": 0.70},
+        },
+        "birefnet": {
+            # tester_server.py (8002); com o inference_server.py, IMPRIME_BIREFNET_URL=http://127.0.0.1:8000
+            "server": os.environ.get("IMPRIME_BIREFNET_URL", "http://127.0.0.1:8002"), "max_side": 1024, "blacks": False,
+            "fixed_ms": 2500, "per_mp_ms": 2500,
+            "quality": {"simple": 0.94, "complex": 0.95},
+        },
+    },
+}
+
+Features = namedtuple("Features", "info megapixels transparent border_transparent border_std edge_density ms")
+Decision = namedtuple("Decision", "engine content working_side estimate_ms budget_ms reason candidates")
+
+
+def data_dir():
+    base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "imprime-ai")
+
+
+def routing_table_path():
+    return os.environ.get(ROUTING_TABLE_ENV) or os.path.join(data_dir(), "routing_table.json")
+
+
+def load_table(path=None):
+    """DEFAULT_TABLE com os valores do JSON ajustado por cima (motores e limites campo a campo)"""
+    table = copy.deepcopy(DEFAULT_TABLE)
+    path = path or routing_table_path()
+    if not os.path.exists(path):
+        return table
+    try:
+        with open(path, encoding="utf-8") as f:
+            tuned = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[Router] Tabela de roteamento ignorada ({path}): {e}", file=sys.stderr, flush=True)
+        return table
+    table["thresholds"].update(tuned.get("thresholds", {}))
+    table["output_mp_ms"] = tuned.get("output_mp_ms", table["output_mp_ms"])
+    for name, values in tuned.get("engines", {}).items():
+        table["engines"].setdefault(name, {}).update(values)
+    return table
+
+
+def extract_features(input_path):
+    """Cabeçalho + estatísticas de uma miniatura (JPEG decodificado já reduzido)"""
+    start = time.perf_counter()
+    info = probe(input_path)
+    with Image.open(input_path) as image:
+        if info.format == "JPEG":
+            image.draft("RGB", (FEATURE_SIDE, FEATURE_SIDE))
+        image.thumbnail((FEATURE_SIDE, FEATURE_SIDE), Image.Resampling.BILINEAR)
+        rgba = np.asarray(image.convert("RGBA"))
+
+    alpha = rgba[:, :, 3]
+    border_alpha = np.concatenate([alpha[0], alpha[-1], alpha[:, 0], alpha[:, -1]])
+    rgb = rgba[:, :, :3].astype(np.float32)
+    border = np.concatenate([rgb[0], rgb[-1], rgb[:, 0], rgb[:, -1]])
+    opaque = border_alpha >= 250
+    gray = rgb.mean(axis=2)
+    edges = (np.abs(np.diff(gray, axis=1))[:-1] + np.abs(np.diff(gray, axis=0))[:, :-1]) > EDGE_STEP
+    return Features(
+        info=info,
+        megapixels=info.width * info.height / 1e6,
+        transparent=float((alpha < 250).mean()),
+        border_transparent=float((border_alpha < 250).mean()),
+        border_std=float(border[opaque].std(axis=0).mean()) if opaque.any() else 0.0,
+        edge_density=float(edges.mean()) if edges.size else 0.0,
+        ms=round((time.perf_counter() - start) * 1000, 1),
+    )
+
+
+def content_class(features, thresholds):
+    """'cutout' (alpha já recortado), 'simple' (fundo liso, pouco detalhe) ou 'complex'"""
+    if (features.info.has_alpha and features.transparent >= thresholds["cutout_transparent"]
+            and features.border_transparent >= thresholds["cutout_border"]):
+        return "cutout"
+    if (features.border_std <= thresholds["uniform_border_std"]
+            and features.edge_density < thresholds["complex_edge_density"]):
+        return "simple"
+    return "complex"
+
+
+def working_megapixels(features, max_side):
+    """MP em que o motor realmente infere (motores com max_side reduzem a imagem antes)"""
+    side = max(features.info.width, features.info.height)
+    if max_side and side > max_side:
+        return features.megapixels * (max_side / side) ** 2
+    return features.megapixels
+
+
+def estimate_ms(engine, features, table):
+    return (engine["fixed_ms"] + engine["per_mp_ms"] * working_megapixels(features, engine.get("max_side"))
+            + table["output_mp_ms"] * features.megapixels)
+
+
+def server_available(url):
+    try:
+        with urllib.request.urlopen(url.rstrip("/") + "/health", timeout=SERVER_TIMEOUT_S) as response:
+            return response.status == 200
+    except (OSError, ValueError):
+        return False
+
+
+def engine_available(name, engine):
+    """Motivo de indisponibilidade (str) ou None"""
+    if "server" in engine:
+        return None if server_available(engine["server"]) else f"servidor {engine['server']} fora do ar"
+    if not os.path.exists(os.path.join(SCRIPTS_DIR, engine["script"])) and not getattr(sys, "frozen", False):
+        return f"script {engine['script']} ausente"
+    module = engine.get("module")
+    if module and not getattr(sys, "frozen", False) and find_spec(module) is None:
+        return f"módulo '{module}' não instalado"
+    return None
+
+
+def decide(features, table, budget_ms=DEFAULT_BUDGET_MS, forced=None, availability=engine_available):
+    thresholds = table["thresholds"]
+    content = content_class(features, thresholds)
+    if forced is None and content == "cutout":
+        return Decision(PASSTHROUGH, content, None, round(table["output_mp_ms"] * features.megapixels),
+                        budget_ms, "alpha já recortado: só regravar", [])
+
+    candidates = []
+    for name, engine in table["engines"].items():
+        if forced is not None and name != forced:
+            continue
+        reason = availability(name, engine)
+        quality = engine["quality"].get("complex" if content == "cutout" else content, 0)
+        candidates.append({"engine": name, "estimate_ms": round(estimate_ms(engine, features, table)),
+                           "quality": quality, "unavailable": reason})
+    usable = [c for c in candidates if c["unavailable"] is None]
+    if forced is not None and not usable:
+        raise Exception(f"ERROR:Motor '{forced}' indisponível: "
+                        + (candidates[0]["unavailable"] if candidates else "desconhecido"))
+    if not usable:
+        raise Exception("ERROR:Nenhum motor de remoção de fundo disponível")
+
+    fits = [c for c in usable if c["estimate_ms"] <= budget_ms]
+    if fits:
+        chosen = max(fits, key=lambda c: (c["quality"], -c["estimate_ms"]))
+        reason = f"maior qualidade ({chosen['quality']:.2f}) dentro do orçamento"
+    else:
+        chosen = min(usable, key=lambda c: c["estimate_ms"])
+        reason = "nenhum motor cabe no orçamento: o mais rápido"
+    if forced is not None:
+        reason = "motor forçado (--engine)"
+    engine = table["engines"][chosen["engine"]]
+    side = max(features.info.width, features.info.height)
+    working_side = min(side, engine["max_side"]) if engine.get("max_side") else side
+    return Decision(chosen["engine"], content, working_side, chosen["estimate_ms"], budget_ms, reason, candidates)
+
+
+def log_decision(input_path, features, decision):
+    """[Router] em stderr + uma linha JSON no log de decisões (material para ajustar a tabela)"""
+    print(f"[Router] {os.path.basename(input_path)}: {describe(features.info)} | conteúdo {decision.content} "
+          f"(borda σ {features.border_std:.1f}, bordas {features.edge_density:.3f}, "
+          f"transparente {features.transparent:.3f}) -> {decision.engine}"
+          f"{f' @ {decision.working_side}px' if decision.working_side else ''}, "
+          f"estimado {decision.estimate_ms / 1000:.1f}s / orçamento {decision.budget_ms / 1000:.1f}s "
+          f"({decision.reason})", file=sys.stderr, flush=True)
+    log_path = os.environ.get(ROUTER_LOG_ENV) or os.path.join(data_dir(), "router.jsonl")
+    if log_path.lower() in ("0", "false", "no"):
+        return
+    entry = {
+        "ts": round(time.time(), 3),
+        "input": input_path,
+        "format": features.info.format,
+        "width": features.info.width,
+        "height": features.info.height,
+        "has_alpha": features.info.has_alpha,
+        "features": {"transparent": round(features.transparent, 4),
+                     "border_transparent": round(features.border_transparent, 4),
+                     "border_std": round(features.border_std, 2),
+                     "edge_density": round(features.edge_density, 4), "ms": features.ms},
+        **decision._asdict(),
+    }
+    try:
+        os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+
+
+def _engine_command(engine):
+    """Executável do script (PyInstaller: o .exe ao lado do roteador)"""
+    stem = os.path.splitext(engine["script"])[0]
+    if getattr(sys, "frozen", False):
+        return [os.path.join(os.path.dirname(sys.executable), stem + ".exe")]
+    return [sys.executable, os.path.join(SCRIPTS_DIR, engine["script"])]
+
+
+def run_script(engine, input_path, output_path, remove_blacks, threshold, passthrough_flags):
+    """Executa o script com stdout/stderr herdados: PROGRESS/SUCCESS chegam direto ao Electron"""
+    args = [input_path, output_path]
+    if engine.get("blacks"):
+        args += [str(remove_blacks).lower(), str(threshold)] + engine.get("args_after_blacks", [])
+    args += engine.get("args", [])
+    env = dict(os.environ, **engine.get("env", {}))
+    return subprocess.call(_engine_command(engine) + args + passthrough_flags, env=env)
+
+
+def run_server(engine, input_path, output_path):
+    """Motor de servidor (BiRefNet no tester_server): POST /remove e grava o PNG devolvido"""
+    from cli_events import progress
+    progress("inference", 20, "Enviando para o servidor BiRefNet...")
+    with open(input_path, "rb") as f:
+        body = json.dumps({"image_base64": base64.b64encode(f.read()).decode("ascii")}).encode("utf-8")
+    request = urllib.request.Request(engine["server"].rstrip("/") + "/remove", data=body,
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request) as response:
+        result = json.loads(response.read())
+    if not result.get("success"):
+        raise Exception(f"ERROR:Servidor BiRefNet: {result.get('error', 'falha desconhecida')}")
+    png = base64.b64decode(result["result_image"].split("base64,", 1)[-1])
+    progress("save", 90, "Salvando resultado...")
+    with open(output_path, "wb") as f:
+        f.write(png)
+
+
+def finish_in_process(input_path, output_path, remove_blacks, threshold, source=None):
+    """
+    Passthrough (recorte pronto) e pós-processamento dos motores sem remoção de pretos:
+    regrava no perfil de saída, removendo pretos faixa por faixa se pedido
+    """
+    from cli_events import progress
+    from image_encode import save_image
+    from stripe_pipeline import compose_stream, image_rows
+    with Image.open(source or input_path) as image:
+        image = image.convert("RGBA")
+    if remove_blacks:
+        progress("postprocess", 85, f"Removendo pretos internos (threshold: {threshold})...")
+        image = compose_stream(image.size, rgba_rows=image_rows(image), black_threshold=threshold)
+    progress("save", 90, "Salvando resultado...")
+    try:
+        save_image(image, output_path)
+    finally:
+        image.close()
+
+
+def route(argv):
+    from image_encode import configure_output, output_path_for, profile_cache_params
+    configure_output(argv)
+    parser = argparse.ArgumentParser(prog="engine_router.py", add_help=False)
+    parser.add_argument("input_path")
+    parser.add_argument("output_path")
+    parser.add_argument("remove_blacks", nargs="?", default="false")
+    parser.add_argument("threshold", nargs="?", type=int, default=30)
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("IMPRIME_BUDGET_MS", DEFAULT_BUDGET_MS)))
+    parser.add_argument("--engine", default=None)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--routing-table", default=None)
+    parser.add_argument("--threads", default=None)
+    args, passthrough_flags = parser.parse_known_args(argv[1:])
+    if any(not flag.startswith("--") for flag in passthrough_flags):
+        raise Exception(f"ERROR:Argumentos inesperados: {' '.join(passthrough_flags)}")
+    # configure_output consumiu --output-profile: o script escolhido recebe o perfil de volta
+    for name in profile_cache_params().values():
+        passthrough_flags += ["--output-profile", name]
+    if args.threads is not None:
+        passthrough_flags += ["--threads", args.threads]
+    remove_blacks = args.remove_blacks.lower() == "true"
+    output_path = output_path_for(args.output_path)
+    if not os.path.exists(args.input_path):
+        raise Exception(f"ERROR:Arquivo de entrada não encontrado: {args.input_path}")
+
+    table = load_table(args.routing_table)
+    if args.engine is not None and args.engine not in table["engines"] and args.engine != PASSTHROUGH:
+        raise Exception(f"ERROR:Motor desconhecido: {args.engine} (disponíveis: {', '.join(table['engines'])})")
+    try:
+        features = extract_features(args.input_path)
+    except (OSError, ProbeError) as e:
+        raise Exception(f"ERROR:Imagem inválida ou formato não suportado: {e}")
+    if args.engine == PASSTHROUGH:
+        decision = Decision(PASSTHROUGH, content_class(features, table["thresholds"]), None, 0,
+                            args.budget_ms, "motor forçado (--engine)", [])
+    else:
+        decision = decide(features, table, args.budget_ms, forced=args.engine)
+    log_decision(args.input_path, features, decision)
+    if args.dry_run:
+        print(json.dumps({**decision._asdict(), "features_ms": features.ms}, ensure_ascii=False))
+        return 0
+
+    if decision.engine == PASSTHROUGH:
+        finish_in_process(args.input_path, output_path, remove_blacks, args.threshold)
+        print(f"SUCCESS:{output_path}", flush=True)
+        return 0
+    engine = table["engines"][decision.engine]
+    if "server" in engine:
+        run_server(engine, args.input_path, output_path)
+        if remove_blacks:
+            finish_in_process(args.input_path, output_path, remove_blacks, args.threshold, source=output_path)
+        print(f"SUCCESS:{output_path}", flush=True)
+        return 0
+    if remove_blacks and not engine.get("blacks"):
+        # O script não remove pretos: a linha SUCCESS sai depois do pós-processamento
+        code = subprocess.call(
+            _engine_command(engine) + [args.input_path, output_path] + engine.get("args", []) + passthrough_flags,
+            env=dict(os.environ, **engine.get("env", {})), stdout=subprocess.DEVNULL)
+        if code != 0:
+            return code
+        finish_in_process(args.input_path, output_path, remove_blacks, args.threshold, source=output_path)
+        print(f"SUCCESS:{output_path}", flush=True)
+        return 0
+    return run_script(engine, args.input_path, output_path, remove_blacks, args.threshold, passthrough_flags)
+
+
+def _fit_latency(points):
+    """Mínimos quadrados de ms = fixo + por_mp * mp (um ponto só: escala a reta padrão)"""
+    mps = np.array([p[0] for p in points], dtype=np.float64)
+    ms = np.array([p[1] for p in points], dtype=np.float64)
+    if len(points) < 2 or np.ptp(mps) == 0:
+        return None
+    per_mp, fixed = np.polyfit(mps, ms, 1)
+    return max(0.0, fixed), max(0.0, per_mp)
+
+
+def tune(report_paths, out_path=None, aspect=1.5):
+    """
+    Ajusta a tabela a partir de relatórios JSON dos benchmarks:
+    bench_removers (wall_s por motor e MP) -> fixed_ms/per_mp_ms por regressão linear
+    bench_quality (iou, boundary_f) -> quality["complex"] = média de IoU e F de borda (a arte
+    sintética é detalhada); quality["simple"] mantém a diferença que tinha na tabela padrão
+    """
+    table = load_table()
+    latency, quality = {}, {}
+    for path in report_paths:
+        with open(path, encoding="utf-8") as f:
+            report = json.load(f)
+        for row in report.get("summary", []):
+            name = row.get("engine")
+            if name not in table["engines"]:
+                continue
+            engine = table["engines"][name]
+            if row.get("wall_s") is not None:
+                # Converte o tamanho da imagem do benchmark em MP de trabalho do motor
+                mp = row["megapixels"]
+                side = (mp * 1e6 * aspect) ** 0.5
+                max_side = engine.get("max_side")
+                work = mp * (max_side / side) ** 2 if max_side and side > max_side else mp
+                latency.setdefault(name, []).append((work, row["wall_s"] * 1000 - table["output_mp_ms"] * mp))
+            if row.get("iou") is not None and row.get("boundary_f") is not None:
+                quality.setdefault(name, []).append((row["iou"] + row["boundary_f"]) / 2)
+
+    changes = []
+    for name, points in latency.items():
+        engine = table["engines"][name]
+        fitted = _fit_latency(points)
+        if fitted is None:
+            work, ms = points[0]
+            scale = ms / (engine["fixed_ms"] + engine["per_mp_ms"] * work)
+            fitted = (engine["fixed_ms"] * scale, engine["per_mp_ms"] * scale)
+        engine["fixed_ms"], engine["per_mp_ms"] = round(fitted[0]), round(fitted[1])
+        changes.append(f"{name}: latência {engine['fixed_ms']} ms + {engine['per_mp_ms']} ms/MP ({len(points)} pontos)")
+    for name, scores in quality.items():
+        engine = table["engines"][name]
+        measured = sum(scores) / len(scores)
+        offset = DEFAULT_TABLE["engines"].get(name, engine)["quality"]
+        offset = offset["simple"] - offset["complex"]
+        engine["quality"] = {"complex": round(measured, 4), "simple": round(min(1.0, measured + offset), 4)}
+        changes.append(f"{name}: qualidade {engine['quality']}")
+
+    out_path = out_path or routing_table_path()
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(table, f, indent=2, ensure_ascii=False)
+    return out_path, changes
+
+
+def main(argv):
+    if argv[1:2] == ["tune"]:
+        parser = argparse.ArgumentParser(prog="engine_router.py tune",
+                                         description="Ajusta a tabela de roteamento com relatórios de benchmark")
+        parser.add_argument("reports", nargs="+")
+        parser.add_argument("--out", default=None)
+        args = parser.parse_args(argv[2:])
+        path, changes = tune(args.reports, args.out)
+        for line in changes or ["nenhum motor da tabela nos relatórios"]:
+            print(line)
+        print(f"Tabela gravada em {path}")
+        return 0
+    if len(argv) < 3:
+        print("ERROR:Uso: python engine_router.py <input_path> <output_path> [remove_blacks] [threshold] "
+              "[--budget-ms N] [--engine nome] [--dry-run] [--output-profile nome] [--threads N] [--preview] [--stream]")
+        return 1
+    try:
+        return route(argv)
+    except Exception as e:
+        message = str(e) if str(e).startswith("ERROR:") else f"ERROR:Erro no roteamento: {e}"
+        print(message, file=sys.stderr, flush=True)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Perfis de gravação do resultado + codificador PNG paralelo por faixas
+O PNG com optimize=True (zlib 9 e busca de parâmetros) chega a demorar mais que a própria
+inferência numa folha 10k x 14k RGBA; os perfis paralelos são opt-in. Perfis:
+    png             optimize=True do Pillow — padrão, o menor PNG, lento (mesmos bytes de antes)
+    archival-png    o mesmo que png (nome explícito)
+    balanced-png    zlib 6, paralelo — bem mais rápido, arquivo um pouco maior
+    fast-png        zlib 1, paralelo — o mais rápido, arquivo maior
+    webp-lossless   WebP sem perdas (máx. 16383 px por lado; acima disso cai para png)
+    tiff-lzw        TIFF com compressão LZW
+
+Seleção: --output-profile <nome> na linha de comando ou IMPRIME_OUTPUT_PROFILE=<nome>.
+
+Codificador paralelo: a imagem é filtrada (filtro Up do PNG) e comprimida em faixas
+horizontais por várias threads (o zlib libera o GIL). Cada faixa é um trecho deflate
+terminado com sync flush e pré-carregado com os últimos 32 KB da faixa anterior (como o
+pigz), então a concatenação é um único stream zlib válido que qualquer leitor de PNG abre.
+A memória extra é de algumas faixas, não da imagem inteira. Também aceita fontes com
+read_rows(início, fim) (stripe_pipeline.StripeFile), lidas faixa por faixa do disco.
+"""
+
+import os
+import sys
+import zlib
+import struct
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+PROFILE_FLAG = "--output-profile"
+PROFILE_ENV = "IMPRIME_OUTPUT_PROFILE"
+DEFAULT_PROFILE = "png"
+
+# Abaixo disso o Pillow sozinho já é rápido; a divisão em faixas não compensa
+# (acima, mesmo com um só núcleo o filtro Up em numpy sai mais barato que o filtro adaptativo do Pillow)
+PARALLEL_MIN_PIXELS = 4_000_000
+STRIPE_BYTES = 4 * 1024 * 1024
+WEBP_MAX_SIDE = 16383
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Modo PIL -> (tipo de cor PNG, canais)
+PNG_COLOR_TYPES = {"L": (0, 1), "RGB": (2, 3), "LA": (4, 2), "RGBA": (6, 4)}
+
+OutputProfile = namedtuple("OutputProfile", "name format extension options parallel_level")
+
+PROFILES = {
+    "png": OutputProfile("png", "PNG", ".png", {"optimize": True}, None),
+    "archival-png": OutputProfile("archival-png", "PNG", ".png", {"optimize": True}, None),
+    "balanced-png": OutputProfile("balanced-png", "PNG", ".png", {"compress_level": 6}, 6),
+    "fast-png": OutputProfile("fast-png", "PNG", ".png", {"compress_level": 1}, 1),
+    "webp-lossless": OutputProfile("webp-lossless", "WEBP", ".webp",
+                                   {"lossless": True, "quality": 80, "method": 4, "exact": True}, None),
+    "tiff-lzw": OutputProfile("tiff-lzw", "TIFF", ".tif", {"compression": "tiff_lzw"}, None),
+}
+
+_selected = None
+
+
+def get_profile(name=None):
+    """Perfil pelo nome (ou o selecionado / IMPRIME_OUTPUT_PROFILE / padrão)"""
+    name = name or _selected or os.environ.get(PROFILE_ENV) or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Perfil de saída desconhecido: {name} (disponíveis: {', '.join(PROFILES)})")
+    return PROFILES[name]
+
+
+def configure_output(argv):
+    """
+    Scripts de linha de comando: lê --output-profile <nome> / --output-profile=<nome>
+    (removidos de argv); perfil inválido encerra com ERROR: como os demais argumentos
+    """
+    global _selected
+    for index, arg in enumerate(list(argv)):
+        if arg == PROFILE_FLAG and index + 1 < len(argv):
+            _selected = argv[index + 1]
+            del argv[index:index + 2]
+            break
+        if arg.startswith(PROFILE_FLAG + "="):
+            _selected = arg.split("=", 1)[1]
+            del argv[index]
+            break
+    try:
+        return get_profile()
+    except ValueError as e:
+        print(f"ERROR:{e}", file=sys.stderr, flush=True)
+        sys.exit(1)
+
+
+def output_path_for(output_path, profile=None):
+    """Troca a extensão quando o perfil grava outro formato (a.png + tiff-lzw -> a.tif)"""
+    profile = get_profile(profile)
+    root, extension = os.path.splitext(output_path)
+    if extension.lower() in (profile.extension, ".tiff" if profile.format == "TIFF" else profile.extension):
+        return output_path
+    return root + profile.extension
+
+
+def profile_cache_params(profile=None):
+    """Parâmetros extras da chave do cache de resultado (vazio no perfil padrão: chaves antigas continuam válidas)"""
+    profile = get_profile(profile)
+    return {} if profile.name == DEFAULT_PROFILE else {"output_profile": profile.name}
+
+
+def _chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)))
+
+
+def _stripe_rows(image, start, stop):
+    """Linhas [start, stop) como array uint8 HxWxC (recorte: só a faixa é copiada)"""
+    if isinstance(image, np.ndarray):
+        rows = image[start:stop]
+    elif hasattr(image, "read_rows"):
+        rows = image.read_rows(start, stop)
+    else:
+        rows = np.asarray(image.crop((0, start, image.width, stop)))
+    if rows.ndim == 2:
+        rows = rows[:, :, None]
+    return rows
+
+
+def _filter_up(rows, previous_row):
+    """Filtro Up (tipo 2) em numpy: cada linha menos a de cima, módulo 256, com o byte de filtro"""
+    height = rows.shape[0]
+    flat = rows.reshape(height, -1)
+    above = np.empty_like(flat)
+    above[0] = previous_row if previous_row is not None else 0
+    above[1:] = flat[:-1]
+    filtered = np.empty((height, flat.shape[1] + 1), dtype=np.uint8)
+    filtered[:, 0] = 2
+    np.subtract(flat, above, out=filtered[:, 1:], dtype=np.uint8, casting="unsafe")
+    return filtered, flat[-1].copy()
+
+
+def encode_png_parallel(image, fp, level=6, workers=None, dpi=None, stripe_bytes=STRIPE_BYTES):
+    """
+    Grava `image` (PIL L/LA/RGB/RGBA, array uint8 HxW[xC] ou StripeFile) como PNG em `fp` (arquivo binário)
+    Faixas comprimidas em paralelo; a saída é escrita em ordem, à medida que as faixas ficam prontas.
+    """
+    if isinstance(image, np.ndarray):
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        mode = {1: "L", 2: "LA", 3: "RGB", 4: "RGBA"}[channels]
+    elif hasattr(image, "read_rows"):
+        width, height = image.size
+        mode = image.mode
+    else:
+        if image.mode not in PNG_COLOR_TYPES:
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        width, height = image.size
+        mode = image.mode
+    color_type, channels = PNG_COLOR_TYPES[mode]
+    row_bytes = width * channels
+    rows_per_stripe = max(1, stripe_bytes // max(1, row_bytes))
+    workers = workers or min(8, os.cpu_count() or 1)
+
+    fp.write(PNG_SIGNATURE)
+    fp.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)))
+    if dpi:
+        ppm = [int(round(value / 0.0254)) for value in dpi]
+        fp.write(_chunk(b"pHYs", struct.pack(">IIB", ppm[0], ppm[1], 1)))
+
+    # Stream zlib repartido em IDATs: cabeçalho (deflate, janela 32K) + trechos raw deflate + adler32
+    fp.write(_chunk(b"IDAT", b"\x78\x01" if level <= 1 else b"\x78\x9c"))
+    starts = list(range(0, height, rows_per_stripe))
+
+    def compress(job):
+        index, data, dictionary = job
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY,
+                                      **({"zdict": dictionary} if dictionary else {}))
+        last = index == len(starts) - 1
+        return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+    def jobs():
+        previous_row, dictionary = None, None
+        for index, start in enumerate(starts):
+            filtered, previous_row = _filter_up(_stripe_rows(image, start, min(height, start + rows_per_stripe)),
+                                                previous_row)
+            data = filtered.tobytes()
+            yield index, data, dictionary
+            dictionary = data[-32768:]
+
+    adler = 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for job in jobs():
+            adler = zlib.adler32(job[1], adler)
+            pending.append(pool.submit(compress, job))
+            # Janela limitada: no máximo 2 faixas por thread em memória
+            while len(pending) > workers * 2:
+                fp.write(_chunk(b"IDAT", pending.pop(0).result()))
+        for future in pending:
+            fp.write(_chunk(b"IDAT", future.result()))
+    fp.write(_chunk(b"IDAT", struct.pack(">I", adler & 0xFFFFFFFF)))
+    fp.write(_chunk(b"IEND", b""))
+
+
+def save_image(image, target, profile=None, dpi=None):
+    """
+    Grava no perfil escolhido; `target` é um caminho ou arquivo binário aberto
+    `image` também pode ser um StripeFile (modo streaming): PNG sai faixa por faixa (png/archival-png
+    viram zlib 9, o optimize do Pillow precisa da imagem inteira); os outros formatos a remontam.
+    Returns:
+        nome do perfil efetivamente usado (webp grande demais cai para png)
+    """
+    profile = get_profile(profile)
+    if hasattr(image, "read_rows") and profile.format != "PNG":
+        image = image.to_image()
+    if profile.format == "WEBP" and max(image.size) > WEBP_MAX_SIDE:
+        print(f"[Debug] WebP limita {WEBP_MAX_SIDE}px por lado; gravando PNG", file=sys.stderr, flush=True)
+        profile = PROFILES[DEFAULT_PROFILE]
+    options = dict(profile.options)
+    if dpi and profile.format in ("PNG", "TIFF"):
+        options["dpi"] = dpi
+
+    streamed = hasattr(image, "read_rows")
+    parallel = streamed or (profile.parallel_level is not None
+                            and image.width * image.height >= PARALLEL_MIN_PIXELS)
+    if not parallel:
+        image.save(target, profile.format, **options)
+        return profile.name
+    level = profile.parallel_level if profile.parallel_level is not None else 9
+    if hasattr(target, "write"):
+        encode_png_parallel(image, target, level, dpi=dpi)
+        return profile.name
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            encode_png_parallel(image, f, level, dpi=dpi)
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return profile.name
+
+
+def encode_png_bytes(image, level=6):
+    """PNG em memória (servidores): paralelo nas imagens grandes, Pillow nas pequenas"""
+    import io
+    buffer = io.BytesIO()
+    if image.width * image.height >= PARALLEL_MIN_PIXELS:
+        encode_png_parallel(image, buffer, level)
+    else:
+        image.save(buffer, "PNG", compress_level=level)
+    return buffer.getvalue()
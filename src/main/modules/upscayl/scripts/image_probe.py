@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Leitura só do cabeçalho da imagem (sem decodificar pixels)
+PNG, JPEG, TIFF (e BigTIFF) e WebP são lidos aqui direto dos bytes, pulando blocos com seek:
+dimensões, modo (nome do Pillow), bits por canal, DPI, presença de perfil ICC e de alpha,
+em dezenas de microssegundos mesmo numa arte de centenas de MB. Outros formatos caem no
+Image.open do Pillow, que também é preguiçoso (só o cabeçalho) mas bem mais lento.
+
+Uso pelos removedores (validar a entrada antes de carregar modelos, escolher resolução),
+pelo roteamento de engines e pelo endpoint /api/probe dos servidores.
+
+Linha de comando:
+    python image_probe.py <imagem> [<imagem> ...]     (uma linha JSON por arquivo)
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import struct
+from collections import namedtuple
+
+ProbeResult = namedtuple("ProbeResult", "format width height mode bit_depth dpi has_icc has_alpha")
+
+
+class ProbeError(ValueError):
+    """Cabeçalho truncado, corrompido ou formato desconhecido"""
+
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Tipo de cor PNG -> modo do Pillow (tons de cinza dependem da profundidade)
+PNG_MODES = {2: "RGB", 3: "P", 4: "LA", 6: "RGBA"}
+# Marcadores SOF (início de quadro) do JPEG: C0-CF menos DHT (C4), JPG (C8) e DAC (CC)
+JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+JPEG_MODES = {1: "L", 3: "RGB", 4: "CMYK"}
+# Tags TIFF lidas
+TIFF_WIDTH, TIFF_HEIGHT, TIFF_BITS, TIFF_PHOTOMETRIC = 256, 257, 258, 262
+TIFF_SAMPLES, TIFF_XRES, TIFF_YRES, TIFF_RES_UNIT = 277, 282, 283, 296
+TIFF_EXTRA_SAMPLES, TIFF_ICC = 338, 34675
+TIFF_TAGS = {TIFF_WIDTH, TIFF_HEIGHT, TIFF_BITS, TIFF_PHOTOMETRIC, TIFF_SAMPLES, TIFF_XRES,
+             TIFF_YRES, TIFF_RES_UNIT, TIFF_EXTRA_SAMPLES, TIFF_ICC}
+# Tipo de campo TIFF -> (formato struct, bytes)
+TIFF_TYPES = {1: ("B", 1), 2: ("B", 1), 3: ("H", 2), 4: ("I", 4), 5: ("II", 8), 6: ("b", 1),
+              7: ("B", 1), 8: ("h", 2), 9: ("i", 4), 10: ("ii", 8), 16: ("Q", 8), 17: ("q", 8)}
+
+
+def _read(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ProbeError("cabeçalho truncado")
+    return data
+
+
+def _probe_png(f):
+    f.seek(len(PNG_SIGNATURE))
+    length, kind = struct.unpack(">I4s", _read(f, 8))
+    if kind != b"IHDR" or length != 13:
+        raise ProbeError("PNG sem IHDR")
+    width, height, depth, color_type = struct.unpack(">IIBB", _read(f, 10))
+    f.seek(3 + 4, io.SEEK_CUR)  # compressão, filtro, entrelaçamento + CRC
+    dpi, has_icc, has_trns = None, False, False
+    # Chunks auxiliares ficam antes do IDAT; pula os dados de cada um
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            break
+        length, kind = struct.unpack(">I4s", header)
+        if kind in (b"IDAT", b"IEND"):
+            break
+        if kind == b"pHYs" and length == 9:
+            x, y, unit = struct.unpack(">IIB", _read(f, 9))
+            if unit == 1:
+                dpi = (x * 0.0254, y * 0.0254)
+            f.seek(4, io.SEEK_CUR)
+            continue
+        has_icc = has_icc or kind == b"iCCP"
+        has_trns = has_trns or kind == b"tRNS"
+        f.seek(length + 4, io.SEEK_CUR)
+    if color_type == 0:
+        mode = "1" if depth == 1 else "I;16" if depth == 16 else "L"
+    elif color_type in PNG_MODES:
+        mode = PNG_MODES[color_type]
+    else:
+        raise ProbeError(f"tipo de cor PNG inválido: {color_type}")
+    return ProbeResult("PNG", width, height, mode, depth, dpi, has_icc, color_type in (4, 6) or has_trns)
+
+
+def _tiff_tags(f, base=0, wanted=TIFF_TAGS):
+    """Tags do primeiro IFD de um TIFF que começa em `base` (também usado no EXIF do JPEG)"""
+    f.seek(base)
+    order = _read(f, 2)
+    if order not in (b"II", b"MM"):
+        raise ProbeError("ordem de bytes TIFF inválida")
+    endian = "<" if order == b"II" else ">"
+    magic, = struct.unpack(endian + "H", _read(f, 2))
+    if magic == 42:
+        offset_format, count_format, inline = "I", "H", 4
+        ifd_offset, = struct.unpack(endian + "I", _read(f, 4))
+    elif magic == 43:  # BigTIFF: offsets de 8 bytes
+        offset_format, count_format, inline = "Q", "Q", 8
+        f.seek(4, io.SEEK_CUR)
+        ifd_offset, = struct.unpack(endian + "Q", _read(f, 8))
+    else:
+        raise ProbeError("TIFF sem número mágico 42/43")
+
+    f.seek(base + ifd_offset)
+    entries, = struct.unpack(endian + count_format, _read(f, struct.calcsize(count_format)))
+    entry_format = endian + "HH" + offset_format
+    entry_size = 4 + inline * 2
+    raw = _read(f, entries * entry_size)
+    tags = {}
+    for index in range(entries):
+        entry = raw[index * entry_size:(index + 1) * entry_size]
+        tag, kind, count = struct.unpack(entry_format, entry[:4 + inline])
+        if tag not in wanted or kind not in TIFF_TYPES:
+            continue
+        if tag == TIFF_ICC:
+            tags[tag] = True  # basta saber que existe
+            continue
+        value_format, value_size = TIFF_TYPES[kind]
+        count = min(count, 16)  # BitsPerSample/ExtraSamples têm poucos valores
+        data = entry[4 + inline:]
+        if value_size * count > inline:
+            position = f.tell()
+            offset, = struct.unpack(endian + offset_format, data)
+            f.seek(base + offset)
+            data = _read(f, value_size * count)
+            f.seek(position)
+        values = struct.unpack(endian + value_format * count, data[:value_size * count])
+        if kind in (5, 10):
+            values = tuple(values[i] / values[i + 1] if values[i + 1] else 0 for i in range(0, len(values), 2))
+        tags[tag] = values
+    return tags
+
+
+def _tiff_dpi(tags):
+    """DPI pelas regras do Pillow: sem unidade = polegada, unidade 3 = centímetro"""
+    if TIFF_XRES not in tags or TIFF_YRES not in tags:
+        return None
+    x, y = tags[TIFF_XRES][0], tags[TIFF_YRES][0]
+    unit = tags.get(TIFF_RES_UNIT, (2,))[0]
+    if not x or not y or unit not in (2, 3):
+        return None
+    return (x * 2.54, y * 2.54) if unit == 3 else (x, y)
+
+
+def _probe_tiff(f):
+    tags = _tiff_tags(f)
+    if TIFF_WIDTH not in tags or TIFF_HEIGHT not in tags:
+        raise ProbeError("TIFF sem dimensões")
+    bits = tags.get(TIFF_BITS, (1,))
+    samples = tags.get(TIFF_SAMPLES, (1,))[0]
+    photometric = tags.get(TIFF_PHOTOMETRIC, (2 if samples >= 3 else 1,))[0]
+    extra = tags.get(TIFF_EXTRA_SAMPLES, ())
+    has_alpha = any(value in (1, 2) for value in extra)
+    if photometric in (0, 1):
+        mode = "1" if bits[0] == 1 else "I;16" if bits[0] == 16 else "LA" if samples == 2 else "L"
+    elif photometric == 2:
+        mode = "RGBA" if samples >= 4 and has_alpha else "RGBX" if samples >= 4 else "RGB"
+    elif photometric == 3:
+        mode = "P"
+    elif photometric == 5:
+        mode = "CMYK"
+    elif photometric == 6:
+        mode = "RGB"  # YCbCr, convertido pelo decodificador
+    elif photometric == 8:
+        mode = "LAB"
+    else:
+        raise ProbeError(f"TIFF com interpretação fotométrica não suportada: {photometric}")
+    return ProbeResult("TIFF", tags[TIFF_WIDTH][0], tags[TIFF_HEIGHT][0], mode, bits[0],
+                       _tiff_dpi(tags), TIFF_ICC in tags, has_alpha)
+
+
+def _probe_jpeg(f):
+    f.seek(2)
+    jfif_dpi, exif_dpi, has_icc = None, None, False
+    while True:
+        byte = _read(f, 1)
+        if byte != b"\xff":
+            continue  # lixo entre segmentos: o Pillow também procura o próximo 0xFF
+        marker = _read(f, 1)[0]
+        while marker == 0xFF:  # bytes de preenchimento
+            marker = _read(f, 1)[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            continue  # marcadores sem tamanho
+        if marker in (0xD9, 0xDA):
+            raise ProbeError("JPEG sem SOF antes dos dados")
+        length, = struct.unpack(">H", _read(f, 2))
+        end = f.tell() + length - 2
+        if marker in JPEG_SOF:
+            depth, height, width, components = struct.unpack(">BHHB", _read(f, 6))
+            mode = JPEG_MODES.get(components)
+            if mode is None:
+                raise ProbeError(f"JPEG com {components} componentes")
+            return ProbeResult("JPEG", width, height, mode, depth, jfif_dpi or exif_dpi, has_icc, False)
+        if marker == 0xE0 and length >= 16:
+            data = _read(f, 14)
+            if data[:5] == b"JFIF\x00":
+                unit = data[7]
+                x, y = struct.unpack(">HH", data[8:12])
+                if x and y and unit in (1, 2):
+                    jfif_dpi = (float(x), float(y)) if unit == 1 else (x * 2.54, y * 2.54)
+        elif marker == 0xE1 and length >= 8:
+            if _read(f, 6) == b"Exif\x00\x00":
+                # EXIF é um TIFF dentro do segmento (o segmento tem no máximo 64 KB)
+                try:
+                    exif_dpi = _tiff_dpi(_tiff_tags(io.BytesIO(_read(f, length - 8)),
+                                                    wanted={TIFF_XRES, TIFF_YRES, TIFF_RES_UNIT}))
+                except (ProbeError, struct.error):
+                    pass
+        elif marker == 0xE2 and length >= 14:
+            has_icc = has_icc or _read(f, 12) == b"ICC_PROFILE\x00"
+        f.seek(end)
+
+
+def _probe_webp(f):
+    f.seek(12)
+    kind, size = struct.unpack("<4sI", _read(f, 8))
+    if kind == b"VP8X":
+        data = _read(f, 10)
+        flags = data[0]
+        width = 1 + int.from_bytes(data[4:7], "little")
+        height = 1 + int.from_bytes(data[7:10], "little")
+        has_alpha = bool(flags & 0x10)
+        return ProbeResult("WEBP", width, height, "RGBA" if has_alpha else "RGB", 8, None,
+                           bool(flags & 0x20), has_alpha)
+    if kind == b"VP8L":
+        data = _read(f, 5)
+        if data[0] != 0x2F:
+            raise ProbeError("assinatura VP8L inválida")
+        bits = int.from_bytes(data[1:5], "little")
+        has_alpha = bool((bits >> 28) & 1)
+        return ProbeResult("WEBP", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1,
+                           "RGBA" if has_alpha else "RGB", 8, None, False, has_alpha)
+    if kind == b"VP8 ":
+        data = _read(f, 10)
+        if data[3:6] != b"\x9d\x01\x2a":
+            raise ProbeError("quadro VP8 inválido")
+        width, height = struct.unpack("<HH", data[6:10])
+        return ProbeResult("WEBP", width & 0x3FFF, height & 0x3FFF, "RGB", 8, None, False, False)
+    raise ProbeError(f"chunk WebP desconhecido: {kind!r}")
+
+
+def _probe_pillow(f):
+    """Demais formatos: Image.open só lê o cabeçalho (os pixels ficam para o load)"""
+    from PIL import Image
+    f.seek(0)
+    try:
+        image = Image.open(f)
+    except Exception:
+        raise ProbeError("formato não reconhecido") from None
+    bands = image.getbands()
+    dpi = image.info.get("dpi")
+    return ProbeResult(image.format, image.width, image.height, image.mode,
+                       16 if image.mode.startswith("I;16") else 32 if image.mode in ("I", "F") else 8,
+                       tuple(float(v) for v in dpi) if dpi else None, "icc_profile" in image.info,
+                       "A" in bands or "transparency" in image.info)
+
+
+def probe_file(f):
+    """Lê o cabeçalho de um arquivo binário com seek (a posição final é indefinida)"""
+    f.seek(0)
+    head = f.read(16)
+    try:
+        if head.startswith(PNG_SIGNATURE):
+            return _probe_png(f)
+        if head[:3] == b"\xff\xd8\xff":
+            return _probe_jpeg(f)
+        if head[:4] in (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+"):
+            return _probe_tiff(f)
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            return _probe_webp(f)
+    except struct.error:
+        raise ProbeError("cabeçalho truncado")
+    return _probe_pillow(f)
+
+
+def probe(source):
+    """
+    Cabeçalho de um caminho, bytes ou arquivo binário aberto
+    Returns:
+        ProbeResult(format, width, height, mode, bit_depth, dpi, has_icc, has_alpha);
+        dpi é (x, y) ou None quando a imagem não informa
+    Raises:
+        ProbeError (ValueError) se não for uma imagem reconhecível; OSError ao abrir o caminho
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return probe_file(f)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return probe_file(io.BytesIO(source))
+    return probe_file(source)
+
+
+def describe(info):
+    """Resumo de uma linha para logs ([Debug], [ROUTER], ...)"""
+    parts = [f"{info.format} {info.width}x{info.height} {info.mode} {info.bit_depth} bits"]
+    if info.dpi:
+        parts.append(f"{info.dpi[0]:.0f} dpi")
+    if info.has_icc:
+        parts.append("ICC")
+    if info.has_alpha:
+        parts.append("alpha")
+    return ", ".join(parts)
+
+
+def as_dict(info):
+    """Forma JSON (endpoint / linha de comando)"""
+    data = info._asdict()
+    data["dpi"] = [round(value, 2) for value in info.dpi] if info.dpi else None
+    return data
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("ERROR:Uso: python image_probe.py <imagem> [<imagem> ...]", file=sys.stderr)
+        sys.exit(1)
+    status = 0
+    for path in sys.argv[1:]:
+        start = time.perf_counter()
+        try:
+            result = as_dict(probe(path))
+        except (OSError, ProbeError) as e:
+            print(f"ERROR:{path}: {e}", file=sys.stderr, flush=True)
+            status = 1
+            continue
+        result["path"] = path
+        result["probe_us"] = round((time.perf_counter() - start) * 1e6, 1)
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+    sys.exit(status)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Perfil de memória por etapa (modo de diagnóstico)
+Para cada etapa (load, inference, save, ... / decode, embed, encode nos servidores):
+    peak_rss_mb      pico de memória residente durante a etapa (Linux: VmHWM zerado a cada etapa;
+                     outros sistemas: pico do processo até o fim da etapa)
+    traced_peak_mb   pico das alocações Python/numpy vistas pelo tracemalloc durante a etapa
+    top              maiores crescimentos de alocação (arquivo:linha) entre o início e o fim da etapa
+    buffers          buffers do tamanho da imagem inteira vivos (bytes/str/numpy/PIL >= W*H bytes)
+                     — o maior valor amostrado na etapa; cada um é uma cópia candidata a eliminar
+
+Caro (tracemalloc + varredura do gc): só para diagnóstico, nunca ligado por padrão.
+Scripts: --profile-memory ou IMPRIME_PROFILE_MEMORY=1 (via cli_events).
+Servidores: cabeçalho X-Debug-Memory: 1 na requisição -> X-Memory-Profile na resposta.
+"""
+
+import gc
+import os
+import sys
+import time
+import threading
+import tracemalloc
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+PROFILE_FLAG = "--profile-memory"
+PROFILE_ENV = "IMPRIME_PROFILE_MEMORY"
+TOP_ALLOCATIONS = 5
+MIN_TOP_BYTES = 64 * 1024
+MB = 1024 * 1024
+
+# Alocações do próprio perfilador e do mecanismo de import não interessam no "top"
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_started_tracing = False
+
+
+def profile_memory_requested(argv=None):
+    """True se --profile-memory (removido de argv) ou IMPRIME_PROFILE_MEMORY=1"""
+    present = False
+    if argv is not None:
+        present = PROFILE_FLAG in argv
+        while PROFILE_FLAG in argv:
+            argv.remove(PROFILE_FLAG)
+    return present or os.environ.get(PROFILE_ENV, "0").lower() in ("1", "true", "yes")
+
+
+def _read_status_kb(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def current_rss():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    return _read_status_kb("VmRSS")
+
+
+def peak_rss():
+    """Pico de RSS desde o último reset_peak_rss() (Linux) ou desde o início do processo"""
+    peak = _read_status_kb("VmHWM")
+    if peak is not None:
+        return peak
+    if sys.platform == "win32":
+        # Windows: pico do working set (psutil); o RSS atual não é um pico
+        if psutil is None:
+            return None
+        return getattr(psutil.Process().memory_info(), "peak_wset", None)
+    try:
+        import resource
+        value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return value if sys.platform == "darwin" else value * 1024
+    except (ImportError, OSError):
+        return None
+
+
+def reset_peak_rss():
+    """Zera o VmHWM (Linux >= 4.0, escrevendo 5 em clear_refs); False se não suportado"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _start_tracing(frames):
+    global _tracing_users, _started_tracing
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            _started_tracing = True
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users, _started_tracing
+    with _tracing_lock:
+        _tracing_users = max(0, _tracing_users - 1)
+        # Só desliga o tracemalloc que nós ligamos (e quando ninguém mais está medindo)
+        if _tracing_users == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+def full_image_buffers(snapshot, min_bytes):
+    """
+    Buffers com pelo menos min_bytes vivos agora: blocos rastreados (bytes, str, bytearray,
+    dados de arrays numpy) + PIL Images carregadas (o PIL aloca fora do tracemalloc)
+    Returns:
+        (quantidade, bytes somados)
+    """
+    count, total = 0, 0
+    for trace in snapshot.traces:
+        if trace.size >= min_bytes:
+            count += 1
+            total += trace.size
+    pil_image = sys.modules.get("PIL.Image")
+    if pil_image is not None:
+        for obj in gc.get_objects():
+            try:
+                if isinstance(obj, pil_image.Image) and getattr(obj, "im", None) is not None:
+                    size = obj.width * obj.height * len(obj.getbands())
+                    if size >= min_bytes:
+                        count += 1
+                        total += size
+            except Exception:
+                continue
+    return count, total
+
+
+class MemoryProfiler:
+    """Etapas podem ser aninhadas (stage dentro de stage): o pico é propagado às etapas abertas"""
+
+    def __init__(self, top=TOP_ALLOCATIONS, frames=1):
+        self.top = top
+        self.frames = frames
+        self.active = False
+        self.image_pixels = None
+        self.baseline_rss = None
+        self.stages = {}
+        self._open = []  # [nome, snapshot inicial, pico rss, pico rastreado, buffers, início]
+        self._lock = threading.Lock()
+
+    def start(self):
+        if not self.active:
+            _start_tracing(self.frames)
+            self.active = True
+            self.baseline_rss = current_rss()
+        return self
+
+    def stop(self):
+        if self.active:
+            self.end_all()
+            self.active = False
+            _stop_tracing()
+
+    def note_image(self, width, height):
+        """Registra o tamanho da imagem processada: define o que é um buffer 'do tamanho da imagem'"""
+        pixels = int(width) * int(height)
+        if pixels and (self.image_pixels is None or pixels > self.image_pixels):
+            self.image_pixels = pixels
+
+    @property
+    def full_buffer_bytes(self):
+        # Um canal de 8 bits da imagem inteira: a menor cópia "inteira" possível (máscara L)
+        return self.image_pixels
+
+    def _sample(self):
+        """Lê os picos desde o último reset e os propaga a todas as etapas abertas"""
+        rss = peak_rss()
+        traced = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+        for entry in self._open:
+            if rss is not None:
+                entry[2] = max(entry[2] or 0, rss)
+            if traced is not None:
+                entry[3] = max(entry[3] or 0, traced)
+
+    def _reset(self):
+        reset_peak_rss()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+    def _count_buffers(self, snapshot):
+        if snapshot is None or not self.full_buffer_bytes:
+            return None
+        return full_image_buffers(snapshot, self.full_buffer_bytes)
+
+    def checkpoint(self):
+        """Amostra os buffers vivos agora (chamar no ponto de maior uso dentro de uma etapa)"""
+        if not self.active or not tracemalloc.is_tracing():
+            return
+        with self._lock:
+            counted = self._count_buffers(tracemalloc.take_snapshot())
+            if counted is None:
+                return
+            for entry in self._open:
+                if entry[4] is None or counted[0] > entry[4][0]:
+                    entry[4] = counted
+
+    def begin(self, name):
+        if not self.active:
+            return
+        with self._lock:
+            self._sample()
+            snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+            buffers = self._count_buffers(snapshot)
+            self._open.append([name, snapshot, None, None, buffers, time.perf_counter()])
+            self._reset()
+
+    def end(self, name=None):
+        """Fecha a etapa `name` (ou a mais recente) e devolve o resultado dela"""
+        if not self.active:
+            return None
+        with self._lock:
+            index = len(self._open) - 1
+            if name is not None:
+                while index >= 0 and self._open[index][0] != name:
+                    index -= 1
+            if index < 0:
+                return None
+            self._sample()
+            entry = self._open.pop(index)
+            stage_name, start_snapshot, rss_peak, traced_peak, buffers, started = entry
+            snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+            end_buffers = self._count_buffers(snapshot)
+            if end_buffers is not None and (buffers is None or end_buffers[0] > buffers[0]):
+                buffers = end_buffers
+            # Etapas externas ainda abertas também viram essa amostra de buffers
+            for outer in self._open:
+                if buffers is not None and (outer[4] is None or buffers[0] > outer[4][0]):
+                    outer[4] = buffers
+
+            top = []
+            if snapshot is not None and start_snapshot is not None:
+                stats = snapshot.filter_traces(_SNAPSHOT_FILTERS).compare_to(
+                    start_snapshot.filter_traces(_SNAPSHOT_FILTERS), "lineno")
+                for stat in stats[:self.top]:
+                    if stat.size_diff < MIN_TOP_BYTES:
+                        continue
+                    frame = stat.traceback[0]
+                    top.append({
+                        "where": f"{os.path.basename(frame.filename)}:{frame.lineno}",
+                        "mb": round(stat.size_diff / MB, 1),
+                    })
+
+            result = {
+                "ms": round((time.perf_counter() - started) * 1000, 1),
+                "peak_rss_mb": round(rss_peak / MB, 1) if rss_peak else None,
+                "rss_mb": round((current_rss() or 0) / MB, 1) or None,
+                "traced_peak_mb": round(traced_peak / MB, 1) if traced_peak is not None else None,
+                "buffers": buffers[0] if buffers else (0 if self.full_buffer_bytes else None),
+                "buffer_mb": round(buffers[1] / MB, 1) if buffers else None,
+                "top": top,
+            }
+            previous = self.stages.get(stage_name)
+            if previous is not None:
+                # Etapa repetida (ex.: várias chamadas de encode): mantém o pior caso
+                for key in ("peak_rss_mb", "traced_peak_mb", "buffers", "buffer_mb"):
+                    if previous.get(key) is not None and (result[key] is None or previous[key] > result[key]):
+                        result[key] = previous[key]
+                result["ms"] = round(result["ms"] + previous["ms"], 1)
+            self.stages[stage_name] = result
+            self._reset()
+            return result
+
+    def end_all(self):
+        while self._open:
+            self.end(self._open[-1][0])
+
+    def summary(self):
+        peaks = [s["peak_rss_mb"] for s in self.stages.values() if s["peak_rss_mb"] is not None]
+        buffers = [s["buffers"] for s in self.stages.values() if s["buffers"] is not None]
+        return {
+            "baseline_rss_mb": round(self.baseline_rss / MB, 1) if self.baseline_rss else None,
+            "peak_rss_mb": max(peaks) if peaks else None,
+            "max_full_buffers": max(buffers) if buffers else None,
+            "full_buffer_mb": round(self.full_buffer_bytes / MB, 1) if self.full_buffer_bytes else None,
+            "stages": self.stages,
+        }
+
+    def report_lines(self):
+        """Tabela legível (uma linha por etapa + maiores alocações)"""
+        summary = self.summary()
+        lines = [
+            f"memória: base {summary['baseline_rss_mb']} MB, pico {summary['peak_rss_mb']} MB, "
+            f"até {summary['max_full_buffers']} buffers do tamanho da imagem ({summary['full_buffer_mb']} MB cada)"
+        ]
+        for name, stage in self.stages.items():
+            lines.append(
+                f"  {name:<14} pico RSS {stage['peak_rss_mb']} MB | tracemalloc {stage['traced_peak_mb']} MB | "
+                f"buffers {stage['buffers']} | {stage['ms']} ms"
+            )
+            for alloc in stage["top"][:3]:
+                lines.append(f"      +{alloc['mb']} MB {alloc['where']}")
+        return lines
+
+    def header_value(self, top=2):
+        """Resumo compacto para o cabeçalho X-Memory-Profile (ASCII, uma linha)"""
+        parts = []
+        for name, stage in self.stages.items():
+            where = " ".join(f"{a['where']}={a['mb']}" for a in stage["top"][:top])
+            parts.append(
+                f"{name};peak_rss_mb={stage['peak_rss_mb']};traced_mb={stage['traced_peak_mb']};"
+                f"buffers={stage['buffers']}" + (f";top=\"{where}\"" if where else "")
+            )
+        return ", ".join(parts)
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Downloader de modelos: retomável, paralelo e verificado
+- Retoma downloads interrompidos via HTTP Range (estado em <destino>.part.json)
+- Baixa cada arquivo em blocos paralelos
+- Verifica SHA-256 contra o manifesto e só então renomeia atomicamente para o destino
+  (um arquivo parcial nunca aparece como "existente"); sem digest fixado, não finaliza
+  (a menos que IMPRIME_ALLOW_UNVERIFIED=1) e mantém o .part para verificar depois
+- Uma fila única distribui os blocos de todos os modelos entre os mesmos workers
+
+Uso:
+    python model_downloader.py get <url> <destino> [sha256]
+    python model_downloader.py hash <arquivo>
+"""
+
+import sys
+import os
+import json
+import hashlib
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+CHUNK_SIZE = 8 * 1024 * 1024
+READ_SIZE = 256 * 1024
+MAX_WORKERS = int(os.environ.get("IMPRIME_DOWNLOAD_WORKERS", "4"))
+TIMEOUT = 60
+ALLOW_UNVERIFIED_ENV = "IMPRIME_ALLOW_UNVERIFIED"
+
+# sha256 = None: ainda não fixado; o arquivo é baixado mas não é finalizado (DownloadError),
+# e o .part fica para ser verificado quando o digest for fixado, sem baixar de novo.
+# IMPRIME_ALLOW_UNVERIFIED=1 grava assim mesmo, com um AVISO: em stderr.
+# Os .param são os do upscayl-bin/models deste repositório.
+# Para fixar: python model_downloader.py hash <arquivo baixado de fonte confiável>, e então
+# no MANIFEST ou num JSON apontado por IMPRIME_MODEL_MANIFEST ({"<nome>": {"sha256": "..."}})
+MANIFEST = {
+    "sam_vit_b_01ec64.pth": {
+        "url": "https://dl.fbaipublicfiles.com/segment_anything/sam_vit_b_01ec64.pth",
+        "sha256": None,
+    },
+    "upscayl-standard-4x.bin": {
+        "url": "https://raw.githubusercontent.com/upscayl/upscayl/main/resources/models/upscayl-standard-4x.bin",
+        "sha256": None,
+    },
+    "upscayl-standard-4x.param": {
+        "url": "https://raw.githubusercontent.com/upscayl/upscayl/main/resources/models/upscayl-standard-4x.param",
+        "sha256": "35330ececcea33b6c397a72548e788d5d53becee4734c50b7fada36e89f10a86",
+    },
+    "upscayl-lite-4x.bin": {
+        "url": "https://raw.githubusercontent.com/upscayl/upscayl/main/resources/models/upscayl-lite-4x.bin",
+        "sha256": None,
+    },
+    "upscayl-lite-4x.param": {
+        "url": "https://raw.githubusercontent.com/upscayl/upscayl/main/resources/models/upscayl-lite-4x.param",
+        "sha256": "22174924330297357434ad21ed0af7f4b820008d2a502b492754d130d4142714",
+    },
+}
+
+
+class DownloadError(Exception):
+    pass
+
+
+def load_manifest():
+    """Manifesto embutido, sobrescrito por IMPRIME_MODEL_MANIFEST (JSON) se definido"""
+    manifest = {name: dict(entry) for name, entry in MANIFEST.items()}
+    override = os.environ.get("IMPRIME_MODEL_MANIFEST")
+    if override and os.path.exists(override):
+        with open(override, "r", encoding="utf-8") as f:
+            for name, entry in json.load(f).items():
+                manifest.setdefault(name, {}).update(entry)
+    return manifest
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _probe(url):
+    """Retorna (tamanho, aceita_range) usando um GET de 1 byte"""
+    request = urllib.request.Request(url, headers={"Range": "bytes=0-0"})
+    with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+        if response.status == 206:
+            content_range = response.headers.get("Content-Range", "")
+            total = content_range.rsplit("/", 1)[-1]
+            return (int(total) if total.isdigit() else None), True
+        length = response.headers.get("Content-Length")
+        return (int(length) if length else None), False
+
+
+class _Job:
+    """Um arquivo da fila: plano de blocos, estado persistido e finalização"""
+
+    def __init__(self, url, dest, sha256=None, name=None):
+        self.url = url
+        self.dest = dest
+        self.sha256 = sha256
+        self.name = name or os.path.basename(dest)
+        self.part_path = dest + ".part"
+        self.state_path = dest + ".part.json"
+        self.size = None
+        self.ranged = False
+        self.chunks = []
+        self.done = set()
+        self.downloaded = 0
+        self._lock = threading.Lock()
+
+    def plan(self):
+        """Consulta o servidor e monta a lista de blocos pendentes (retomando o estado salvo)"""
+        dirname = os.path.dirname(self.dest)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+
+        self.size, self.ranged = _probe(self.url)
+        if not self.ranged or not self.size:
+            self.chunks = [(0, None)]
+            self.done = set()
+            return [0]
+
+        self.chunks = [(start, min(start + CHUNK_SIZE, self.size) - 1)
+                       for start in range(0, self.size, CHUNK_SIZE)]
+
+        state = None
+        if os.path.exists(self.state_path) and os.path.exists(self.part_path):
+            try:
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = None
+        if state and state.get("url") == self.url and state.get("size") == self.size \
+                and state.get("chunk_size") == CHUNK_SIZE:
+            self.done = set(state.get("done", []))
+        else:
+            self.done = set()
+            with open(self.part_path, "wb") as f:
+                f.truncate(self.size)
+
+        self.downloaded = sum(self.chunks[i][1] - self.chunks[i][0] + 1 for i in self.done)
+        return [i for i in range(len(self.chunks)) if i not in self.done]
+
+    def _save_state(self):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"url": self.url, "size": self.size, "chunk_size": CHUNK_SIZE,
+                       "done": sorted(self.done)}, f)
+        os.replace(tmp, self.state_path)
+
+    def fetch(self, index, progress=None):
+        """Baixa um bloco direto para sua posição no arquivo .part"""
+        start, end = self.chunks[index]
+        headers = {"Range": f"bytes={start}-{end}"} if end is not None else {}
+        request = urllib.request.Request(self.url, headers=headers)
+        written = 0
+        with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+            if end is not None and response.status != 206:
+                raise DownloadError(f"{self.name}: servidor ignorou o Range do bloco {index}")
+            mode = "r+b" if end is not None else "wb"
+            with open(self.part_path, mode) as f:
+                f.seek(start)
+                for block in iter(lambda: response.read(READ_SIZE), b""):
+                    f.write(block)
+                    written += len(block)
+                    with self._lock:
+                        self.downloaded += len(block)
+                    if progress:
+                        progress(self)
+
+        if end is not None and written != end - start + 1:
+            with self._lock:
+                self.downloaded -= written
+            raise DownloadError(f"{self.name}: bloco {index} incompleto ({written} bytes)")
+
+        if end is not None:
+            with self._lock:
+                self.done.add(index)
+                self._save_state()
+
+    def finalize(self):
+        """Verifica o SHA-256 e renomeia atomicamente para o destino final"""
+        if self.sha256:
+            actual = file_sha256(self.part_path)
+            if actual.lower() != self.sha256.lower():
+                for path in (self.part_path, self.state_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+                raise DownloadError(f"{self.name}: SHA-256 não confere (esperado {self.sha256}, obtido {actual})")
+        elif os.environ.get(ALLOW_UNVERIFIED_ENV) != "1":
+            # O .part e o estado ficam: com o digest fixado, o próximo run só verifica e renomeia
+            raise DownloadError(f"{self.name}: SHA-256 não fixado; arquivo não finalizado ({self.part_path}). "
+                                f"Fixe o digest no MANIFEST ou em IMPRIME_MODEL_MANIFEST "
+                                f"(python model_downloader.py hash <arquivo de fonte confiável>), "
+                                f"ou defina {ALLOW_UNVERIFIED_ENV}=1")
+        else:
+            # Sem "model" na linha: os handlers só registram o stderr que não menciona download/modelo
+            print(f"AVISO:{self.name} gravado sem verificação de integridade (SHA-256 não fixado no manifesto; "
+                  f"fixe com: python model_downloader.py hash <arquivo>)", file=sys.stderr, flush=True)
+        os.replace(self.part_path, self.dest)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+
+class DownloadQueue:
+    """Fila concorrente: os blocos de todos os arquivos compartilham o mesmo pool de workers"""
+
+    def __init__(self, max_workers=MAX_WORKERS, progress=None):
+        self.max_workers = max_workers
+        self.progress = progress
+        self.jobs = []
+
+    def add(self, url, dest, sha256=None, name=None):
+        """Enfileira um arquivo; sha256 padrão vem do manifesto (pelo nome do arquivo)"""
+        if sha256 is None:
+            sha256 = load_manifest().get(os.path.basename(dest), {}).get("sha256")
+        self.jobs.append(_Job(url, dest, sha256, name))
+
+    def run(self):
+        """
+        Baixa tudo o que falta. Retorna {destino: None | mensagem de erro}
+        Arquivos que já existem no destino são considerados completos (rename atômico)
+        """
+        results = {}
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {}
+            for job in self.jobs:
+                if os.path.exists(job.dest):
+                    results[job.dest] = None
+                    continue
+                try:
+                    indexes = job.plan()
+                except Exception as e:
+                    results[job.dest] = str(e)
+                    continue
+                pending[job] = len(indexes)
+                for index in indexes:
+                    futures[pool.submit(job.fetch, index, self.progress)] = job
+
+            failed = {}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    failed.setdefault(job, str(e))
+                pending[job] -= 1
+                if pending[job] == 0 and job not in failed:
+                    try:
+                        job.finalize()
+                        results[job.dest] = None
+                    except Exception as e:
+                        failed[job] = str(e)
+
+            for job, job_pending in pending.items():
+                if job_pending == 0 and job not in failed and job.dest not in results:
+                    # Nada a baixar (todos os blocos já estavam no estado salvo)
+                    try:
+                        job.finalize()
+                        results[job.dest] = None
+                    except Exception as e:
+                        failed[job] = str(e)
+            for job, error in failed.items():
+                results[job.dest] = error
+        return results
+
+
+def download(url, dest, sha256=None, progress=None, max_workers=MAX_WORKERS):
+    """Baixa um único arquivo (retomável, paralelo, verificado). Levanta DownloadError em falha"""
+    queue = DownloadQueue(max_workers=max_workers, progress=progress)
+    queue.add(url, dest, sha256)
+    error = queue.run()[dest]
+    if error:
+        raise DownloadError(error)
+    return dest
+
+
+def percent_printer(prefix="PROGRESS:", stream=sys.stderr, step=5):
+    """Callback de progresso no protocolo dos scripts (uma linha a cada `step`%)"""
+    last = {}
+    lock = threading.Lock()
+
+    def _progress(job):
+        if not job.size:
+            return
+        pct = int(job.downloaded * 100 / job.size) // step * step
+        with lock:
+            if last.get(job.dest) != pct:
+                last[job.dest] = pct
+                print(f"{prefix}Baixando {job.name}: {pct}%", file=stream, flush=True)
+
+    return _progress
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] not in ("get", "hash"):
+        print("ERROR:Uso: python model_downloader.py get <url> <destino> [sha256] | hash <arquivo>")
+        sys.exit(1)
+
+    try:
+        if sys.argv[1] == "hash":
+            print(file_sha256(sys.argv[2]))
+        else:
+            if len(sys.argv) < 4:
+                raise DownloadError("Informe a URL e o destino")
+            sha = sys.argv[4] if len(sys.argv) > 4 else None
+            print(f"SUCCESS:{download(sys.argv[2], sys.argv[3], sha, progress=percent_printer())}")
+        sys.exit(0)
+    except Exception as e:
+        print(f"ERROR:{e}", file=sys.stderr, flush=True)
+        sys.exit(1)
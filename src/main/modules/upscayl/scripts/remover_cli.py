@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Utilitários compartilhados pelos scripts de remoção de fundo (linha de comando)
+- Flags opcionais (--preview, ...) misturadas aos argumentos posicionais
+- Prévia progressiva: máscara em baixa resolução gravada antes do resultado final
+- Validação da entrada só pelo cabeçalho, antes de carregar modelos
+"""
+
+import sys
+import os
+from PIL import Image
+
+from image_probe import ProbeError, describe, probe
+
+PREVIEW_MAX_SIDE = 512
+
+
+def pop_flag(argv, name, env_var=None):
+    """Remove `name` de argv (in place); True se estava presente ou se env_var=1"""
+    present = name in argv
+    while name in argv:
+        argv.remove(name)
+    if not present and env_var:
+        present = os.environ.get(env_var, "0").lower() in ("1", "true", "yes")
+    return present
+
+
+def describe_input(input_path):
+    """
+    Lê só o cabeçalho da entrada (image_probe) e registra no [Debug]
+    Arquivo que não é imagem falha aqui, em microssegundos, e não depois do download/carga do modelo.
+    """
+    try:
+        info = probe(input_path)
+    except (OSError, ProbeError) as e:
+        raise Exception(f"ERROR:Imagem inválida ou formato não suportado: {e}")
+    print(f"[Debug] Entrada: {describe(info)}", file=sys.stderr, flush=True)
+    return info
+
+
+def preview_path(output_path):
+    return os.path.splitext(output_path)[0] + ".preview.png"
+
+
+def write_preview(mask, output_path, max_side=PREVIEW_MAX_SIDE):
+    """
+    Grava a máscara de prévia (PIL 'L' ou array) ao lado da saída e anuncia no protocolo:
+    PREVIEW:<caminho> em stderr, junto das linhas PROGRESS
+    """
+    if not isinstance(mask, Image.Image):
+        mask = Image.fromarray(mask)
+    if mask.mode != 'L':
+        mask = mask.convert('L')
+    if max(mask.size) > max_side:
+        mask = mask.copy()
+        mask.thumbnail((max_side, max_side), Image.BILINEAR)
+
+    path = preview_path(output_path)
+    output_dir = os.path.dirname(path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+    mask.save(path, 'PNG', compress_level=1)
+    print(f"PREVIEW:{path}", file=sys.stderr, flush=True)
+    return path
+
+
+def downscaled(image, max_side=PREVIEW_MAX_SIDE):
+    """Cópia reduzida (lado maior = max_side) para o passe grosseiro da prévia"""
+    small = image.copy()
+    small.thumbnail((max_side, max_side), Image.BILINEAR)
+    return small
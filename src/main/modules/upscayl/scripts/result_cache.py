@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache em disco dos resultados de remoção de fundo (endereçado por conteúdo)
+Chave: hash dos bytes de entrada + motor + modelo + parâmetros. A mesma arte processada
+de novo (re-pedido, re-exportação, troca de modo e volta) devolve o PNG já pronto.
+Compartilhado pelos servidores (sam_server, tester_server) e pelos background_remover*.py.
+
+Configuração (variáveis de ambiente):
+    IMPRIME_RESULT_CACHE=0          desativa o cache
+    IMPRIME_RESULT_CACHE_DIR=...    diretório do cache
+    IMPRIME_RESULT_CACHE_MB=4096    limite de tamanho (LRU remove os mais antigos)
+"""
+
+import os
+import sys
+import json
+import shutil
+import time
+import hashlib
+import threading
+
+from sam_embedding_cache import file_digest
+from cli_events import progress
+
+
+def default_cache_dir():
+    base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "imprime-ai", "results")
+
+
+def result_cache_enabled():
+    return os.environ.get("IMPRIME_RESULT_CACHE", "1").lower() not in ("0", "false", "no")
+
+
+def bytes_digest(data):
+    """SHA-256 dos bytes de entrada (mesmo valor que file_digest() do arquivo com esses bytes)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+# O índice em memória só vê o que este processo grava; a cada tanto é refeito do disco para
+# contar também o que outros processos (scripts, outro servidor) gravaram no mesmo diretório
+RESCAN_SECONDS = 300
+
+
+class ResultCache:
+    """Arquivos .bin (PNG de saída) com limite em bytes, LRU por mtime e contadores de acerto"""
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.environ.get("IMPRIME_RESULT_CACHE_DIR") or default_cache_dir()
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("IMPRIME_RESULT_CACHE_MB", "4096")) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "hit_bytes": 0}
+        # caminho -> [tamanho, mtime]; semeado na primeira gravação/estatística, não a cada put
+        self._index = None
+        self._total = 0
+        self._scanned = 0.0
+
+    @staticmethod
+    def make_key(input_digest, engine, model, params=None):
+        """Parâmetros entram ordenados: {'a':1,'b':2} e {'b':2,'a':1} dão a mesma chave"""
+        params_json = json.dumps(params or {}, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{engine}|{model}|{params_json}|{input_digest}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".bin")
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def lookup(self, key):
+        """Caminho da entrada (e marca como usada recentemente) ou None"""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            self._count("misses")
+            return None
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            self._count("misses")
+            return None
+        with self._lock:
+            self._stats["hits"] += 1
+            self._stats["hit_bytes"] += size
+            if self._index is not None:
+                self._track(path, size)
+        return path
+
+    def get(self, key):
+        """Bytes do resultado ou None"""
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def copy_to(self, key, output_path):
+        """Copia o resultado em cache para output_path; True em caso de acerto"""
+        path = self.lookup(key)
+        if path is None:
+            return False
+        output_dir = os.path.dirname(output_path)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+        shutil.copyfile(path, output_path)
+        return True
+
+    def put(self, key, data):
+        """Grava atomicamente (tmp + rename) e aplica o limite de tamanho"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._stored(path, len(data))
+
+    def put_file(self, key, source_path):
+        """Como put(), copiando um arquivo já gravado (saída dos scripts de linha de comando)"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        self._stored(path, size)
+
+    def _stored(self, path, size):
+        with self._lock:
+            self._stats["stores"] += 1
+            self._load_index()
+            self._track(path, size)
+        self.evict()
+
+    def _track(self, path, size):
+        """Atualiza o índice (com o lock): entrada nova ou regravada, marcada como recente"""
+        previous = self._index.get(path)
+        if previous is not None:
+            self._total -= previous[0]
+        self._index[path] = [size, time.time()]
+        self._total += size
+
+    def _entries(self):
+        entries = []
+        try:
+            shards = [shard for shard in os.scandir(self.cache_dir) if shard.is_dir()]
+        except FileNotFoundError:
+            return entries
+        for shard in shards:
+            try:
+                entries.extend(
+                    entry for entry in os.scandir(shard.path)
+                    if entry.is_file() and entry.name.endswith(".bin")
+                )
+            except OSError:
+                continue
+        return entries
+
+    def _load_index(self):
+        """Semeia o índice do disco (com o lock) na primeira vez e depois a cada RESCAN_SECONDS"""
+        if self._index is not None and time.time() - self._scanned < RESCAN_SECONDS:
+            return
+        index = {}
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # removida por outro processo (ou uma evicção) durante a varredura
+            index[entry.path] = [stat.st_size, stat.st_mtime]
+        self._index = index
+        self._total = sum(size for size, _ in index.values())
+        self._scanned = time.time()
+
+    def evict(self):
+        """Remove as entradas usadas há mais tempo até caber em max_bytes"""
+        removed = 0
+        with self._lock:
+            self._load_index()
+            if self._total <= self.max_bytes:
+                return 0
+            for path, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+                if self._total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass  # já removida por outro processo: só sai do índice
+                except OSError:
+                    continue  # em uso (Windows): fica para a próxima evicção
+                del self._index[path]
+                self._total -= size
+            self._stats["evictions"] += removed
+        return removed
+
+    def stats(self):
+        """Contadores deste processo + ocupação atual do diretório (índice em memória)"""
+        with self._lock:
+            self._load_index()
+            stats = dict(self._stats)
+            stats["entries"] = len(self._index)
+            stats["bytes"] = self._total
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+def open_result_cache():
+    """ResultCache padrão, ou None se desativado por IMPRIME_RESULT_CACHE=0"""
+    return ResultCache() if result_cache_enabled() else None
+
+
+def cli_lookup(input_path, output_path, engine, model, params):
+    """
+    Uso nos scripts de linha de comando, antes de carregar o modelo:
+        cache, key, hit = cli_lookup(...)
+        if hit: return output_path
+        ...  # processa e grava output_path
+        cli_store(cache, key, output_path)
+    """
+    cache = open_result_cache()
+    if cache is None:
+        return None, None, False
+    key = ResultCache.make_key(file_digest(input_path), engine, model, params)
+    hit = cache.copy_to(key, output_path)
+    if hit:
+        progress('cache', 100, f"Resultado reaproveitado do cache ({engine}/{model})")
+    return cache, key, hit
+
+
+def cli_store(cache, key, output_path):
+    if cache is None:
+        return
+    try:
+        cache.put_file(key, output_path)
+    except OSError as e:
+        # Cache é otimização: falha de disco não interrompe a remoção
+        print(f"[Debug] Não foi possível gravar o cache de resultado: {e}", file=sys.stderr, flush=True)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Carregamento rápido dos checkpoints SAM
+Converte o .pth (pickle de ~375MB) uma única vez para safetensors e carrega os pesos
+via mmap, assim vários processos compartilham o page cache do sistema.
+
+Uso:
+    python sam_checkpoint.py convert <checkpoint.pth>
+    python sam_checkpoint.py bench <checkpoint.pth> [repeticoes]
+"""
+
+import sys
+import os
+import json
+import time
+
+try:
+    from safetensors.torch import load_file as _st_load_file, save_file as _st_save_file
+    SAFETENSORS_AVAILABLE = True
+except ImportError:
+    SAFETENSORS_AVAILABLE = False
+
+from cli_events import progress
+
+
+def converted_path(checkpoint_path):
+    """Caminho do checkpoint pré-convertido (.safetensors, ou .mmap.pth sem safetensors)"""
+    base, _ = os.path.splitext(checkpoint_path)
+    return base + (".safetensors" if SAFETENSORS_AVAILABLE else ".mmap.pth")
+
+
+def _torch_load(path, mmap=False):
+    import torch
+    kwargs = {"map_location": "cpu"}
+    if mmap:
+        kwargs["mmap"] = True
+        kwargs["weights_only"] = True
+    try:
+        return torch.load(path, **kwargs)
+    except TypeError:
+        # torch < 2.1 não suporta mmap=True
+        kwargs.pop("mmap", None)
+        kwargs.pop("weights_only", None)
+        return torch.load(path, **kwargs)
+
+
+def convert_checkpoint(checkpoint_path, output_path=None):
+    """
+    Converte um checkpoint .pth para formato mapeável em memória (escrita atômica)
+
+    Returns:
+        str: Caminho do arquivo convertido
+    """
+    import torch
+
+    output_path = output_path or converted_path(checkpoint_path)
+    state_dict = _torch_load(checkpoint_path)
+    if "model" in state_dict and isinstance(state_dict["model"], dict):
+        state_dict = state_dict["model"]
+
+    tmp_path = output_path + ".tmp"
+    if output_path.endswith(".safetensors"):
+        # safetensors exige tensores contíguos e sem memória compartilhada
+        _st_save_file({k: v.contiguous() for k, v in state_dict.items()}, tmp_path)
+    else:
+        torch.save(state_dict, tmp_path)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def ensure_converted(checkpoint_path):
+    """Converte na primeira vez (ou se o .pth for mais novo); retorna o caminho convertido ou None"""
+    target = converted_path(checkpoint_path)
+    try:
+        if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(checkpoint_path):
+            progress('convert', None, f"Convertendo checkpoint SAM para carregamento rápido (uma única vez)...")
+            convert_checkpoint(checkpoint_path, target)
+        return target
+    except Exception as e:
+        # Sem espaço em disco / permissão: segue com o .pth original
+        print(f"[Debug] Conversão do checkpoint falhou, usando .pth: {e}", file=sys.stderr, flush=True)
+        return None
+
+
+def load_state_dict(checkpoint_path):
+    """Carrega os pesos pelo caminho mais barato disponível (safetensors > torch mmap > torch.load)"""
+    target = ensure_converted(checkpoint_path)
+    if target and target.endswith(".safetensors"):
+        return _st_load_file(target, device="cpu")
+    return _torch_load(target or checkpoint_path, mmap=True)
+
+
+def build_sam(model_type, checkpoint_path):
+    """
+    Equivalente a sam_model_registry[model_type](checkpoint=...), mas com pesos mmap
+    Com assign=True os parâmetros apontam direto para as páginas mapeadas (sem cópia)
+    """
+    from segment_anything import sam_model_registry
+
+    sam = sam_model_registry[model_type](checkpoint=None)
+    state_dict = load_state_dict(checkpoint_path)
+    try:
+        sam.load_state_dict(state_dict, assign=True)
+    except TypeError:
+        # torch < 2.1: sem assign, copia para os tensores já alocados
+        sam.load_state_dict(state_dict)
+    sam.eval()
+    return sam
+
+
+def _drop_page_cache(path):
+    """Remove o arquivo do page cache (Linux); retorna False se não for possível"""
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        return True
+    finally:
+        os.close(fd)
+
+
+def _timed_load(loader, path):
+    """Retorna (ms para carregar, ms para carregar + ler todas as páginas dos pesos)"""
+    start = time.perf_counter()
+    state_dict = loader(path)
+    load_ms = (time.perf_counter() - start) * 1000
+    for tensor in state_dict.values():
+        tensor.sum()  # força a leitura das páginas mapeadas
+    total_ms = (time.perf_counter() - start) * 1000
+    return load_ms, total_ms
+
+
+def benchmark(checkpoint_path, repeats=3):
+    """Mede o tempo de carga (page cache frio e quente) do .pth original e do convertido"""
+    target = ensure_converted(checkpoint_path)
+    candidates = [("torch.load", checkpoint_path, lambda p: _torch_load(p))]
+    if target and target.endswith(".safetensors"):
+        candidates.append(("safetensors", target, lambda p: _st_load_file(p, device="cpu")))
+    elif target:
+        candidates.append(("torch.load(mmap)", target, lambda p: _torch_load(p, mmap=True)))
+
+    results = []
+    for name, path, loader in candidates:
+        cold = None
+        if _drop_page_cache(path):
+            cold = _timed_load(loader, path)
+
+        warm = min((_timed_load(loader, path) for _ in range(repeats)), key=lambda t: t[1])
+
+        results.append({
+            "loader": name,
+            "path": path,
+            "size_mb": round(os.path.getsize(path) / 1e6, 1),
+            "cold_load_ms": round(cold[0], 1) if cold else None,
+            "cold_total_ms": round(cold[1], 1) if cold else None,
+            "warm_load_ms": round(warm[0], 1),
+            "warm_total_ms": round(warm[1], 1),
+        })
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] not in ("convert", "bench"):
+        print("ERROR:Uso: python sam_checkpoint.py convert|bench <checkpoint.pth> [repeticoes]")
+        sys.exit(1)
+
+    command, path = sys.argv[1], sys.argv[2]
+    try:
+        if command == "convert":
+            print(f"SUCCESS:{convert_checkpoint(path)}")
+        else:
+            repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+            print(json.dumps(benchmark(path, repeats), indent=2))
+        sys.exit(0)
+    except Exception as e:
+        print(f"ERROR:{e}", file=sys.stderr, flush=True)
+        sys.exit(1)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache em disco dos embeddings do SAM (saída do image encoder)
+Chave: hash do conteúdo da imagem + id do modelo. Um clique repetido na mesma arte
+pula o encoder (a parte cara) e roda só o decoder de máscara.
+
+Configuração (variáveis de ambiente):
+    IMPRIME_SAM_CACHE=0          desativa o cache
+    IMPRIME_SAM_CACHE_DIR=...    diretório do cache
+    IMPRIME_SAM_CACHE_MB=2048    limite de tamanho (LRU remove os mais antigos)
+"""
+
+import os
+import sys
+import hashlib
+import numpy as np
+
+
+def default_cache_dir():
+    base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "imprime-ai", "sam_embeddings")
+
+
+def cache_enabled():
+    return os.environ.get("IMPRIME_SAM_CACHE", "1").lower() not in ("0", "false", "no")
+
+
+def file_digest(path):
+    """SHA-256 do conteúdo do arquivo (não do caminho: renomear não invalida o cache)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def array_digest(array):
+    """SHA-256 de um array de imagem (usado quando não há arquivo, ex.: recortes)"""
+    digest = hashlib.sha256()
+    digest.update(str(array.shape).encode())
+    digest.update(np.ascontiguousarray(array).data)
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """Arquivos .npz com features + original_size + input_size, com limite em bytes e LRU por mtime"""
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.environ.get("IMPRIME_SAM_CACHE_DIR") or default_cache_dir()
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get("IMPRIME_SAM_CACHE_MB", "2048")) * 1024 * 1024)
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def make_key(image_digest, model_id, variant=""):
+        return hashlib.sha256(f"{model_id}|{variant}|{image_digest}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    def load(self, key):
+        """Retorna dict(features, original_size, input_size) ou None"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                entry = {
+                    "features": data["features"],
+                    "original_size": tuple(int(v) for v in data["original_size"]),
+                    "input_size": tuple(int(v) for v in data["input_size"]),
+                }
+            os.utime(path)  # marca como usado recentemente (LRU)
+            return entry
+        except Exception as e:
+            print(f"[Debug] Entrada de cache inválida removida ({e})", file=sys.stderr, flush=True)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def store(self, key, features, original_size, input_size):
+        """Grava atomicamente (tmp + rename) e aplica o limite de tamanho"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                features=features,
+                original_size=np.array(original_size),
+                input_size=np.array(input_size),
+            )
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Remove as entradas usadas há mais tempo até caber em max_bytes"""
+        try:
+            entries = [
+                entry for entry in os.scandir(self.cache_dir)
+                if entry.is_file() and entry.name.endswith(".npz")
+            ]
+        except FileNotFoundError:
+            return 0
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        removed = 0
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+def set_image_cached(predictor, image_array, cache, key):
+    """
+    predictor.set_image() com cache: em caso de acerto restaura o embedding e pula o encoder
+
+    Returns:
+        bool: True se veio do cache
+    """
+    import torch
+
+    entry = cache.load(key) if cache is not None else None
+    if entry is not None:
+        predictor.reset_image()
+        predictor.features = torch.from_numpy(entry["features"]).to(predictor.device)
+        predictor.original_size = entry["original_size"]
+        predictor.input_size = entry["input_size"]
+        predictor.is_image_set = True
+        return True
+
+    predictor.set_image(image_array)
+    if cache is not None:
+        try:
+            cache.store(
+                key,
+                predictor.features.detach().cpu().numpy(),
+                predictor.original_size,
+                predictor.input_size,
+            )
+        except OSError as e:
+            # Cache é otimização: falha de disco não interrompe a segmentação
+            print(f"[Debug] Não foi possível gravar o cache de embedding: {e}", file=sys.stderr, flush=True)
+    return False
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Segmentação SAM com zoom na região de interesse (ROI)
+O SAM redimensiona tudo para 1024px no lado maior: um logo de 300px numa folha de 9000px
+vira ~35px na entrada do encoder e a máscara volta "serrilhada". No modo zoom recortamos
+uma ROI com margem em resolução nativa, calculamos o embedding só do recorte e colamos
+a máscara de volta nas coordenadas da imagem inteira.
+"""
+
+import numpy as np
+
+from sam_embedding_cache import EmbeddingCache, array_digest, set_image_cached
+
+# Margem em volta da caixa (fração do tamanho da caixa) e lado mínimo da ROI em pixels
+ROI_PADDING = 0.25
+ROI_MIN_PADDING_PX = 32
+ROI_MIN_SIZE = 1024
+
+
+def _clamp_roi(x0, y0, x1, y1, width, height):
+    x0, y0 = max(0, int(np.floor(x0))), max(0, int(np.floor(y0)))
+    x1, y1 = min(width, int(np.ceil(x1))), min(height, int(np.ceil(y1)))
+    if x1 <= x0 or y1 <= y0:
+        raise ValueError("ROI fora da imagem")
+    return x0, y0, x1, y1
+
+
+def _grow_to_min_size(x0, y0, x1, y1, min_size):
+    """Expande em volta do centro até min_size (SAM trabalha em 1024: recortes menores não ganham nada)"""
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    half_w = max(x1 - x0, min_size) / 2
+    half_h = max(y1 - y0, min_size) / 2
+    return cx - half_w, cy - half_h, cx + half_w, cy + half_h
+
+
+def roi_from_box(box, image_shape, padding=ROI_PADDING, min_size=ROI_MIN_SIZE):
+    """ROI (x0, y0, x1, y1) com margem em volta de uma caixa [x1, y1, x2, y2]"""
+    height, width = image_shape[:2]
+    bx0, by0, bx1, by1 = [float(v) for v in box]
+    pad_x = max(ROI_MIN_PADDING_PX, (bx1 - bx0) * padding)
+    pad_y = max(ROI_MIN_PADDING_PX, (by1 - by0) * padding)
+    roi = _grow_to_min_size(bx0 - pad_x, by0 - pad_y, bx1 + pad_x, by1 + pad_y, min_size)
+    return _clamp_roi(*roi, width, height)
+
+
+def roi_from_points(points, image_shape, padding=ROI_PADDING, min_size=ROI_MIN_SIZE):
+    """ROI em volta dos pontos clicados (N x 2, em pixels)"""
+    height, width = image_shape[:2]
+    points = np.asarray(points, dtype=np.float64)
+    px0, py0 = points.min(axis=0)
+    px1, py1 = points.max(axis=0)
+    spread = max(px1 - px0, py1 - py0)
+    pad = max(ROI_MIN_PADDING_PX, spread * padding)
+    roi = _grow_to_min_size(px0 - pad, py0 - pad, px1 + pad, py1 + pad, min_size)
+    return _clamp_roi(*roi, width, height)
+
+
+def paste_mask(crop_mask, roi, image_shape):
+    """Cola a máscara do recorte numa máscara do tamanho da imagem inteira"""
+    x0, y0, x1, y1 = roi
+    full = np.zeros(image_shape[:2], dtype=crop_mask.dtype)
+    full[y0:y1, x0:x1] = crop_mask
+    return full
+
+
+def predict_in_roi(predictor, image, roi, point_coords=None, point_labels=None, box=None,
+                   multimask_output=True, cache=None, model_id="vit_b", on_embedded=None):
+    """
+    Roda set_image() no recorte (embedding em cache separado, chaveado pelo conteúdo do recorte)
+    e predict() com os prompts deslocados para as coordenadas do recorte.
+    on_embedded() é chamado entre o encoder e o decoder (ponto de cancelamento do servidor).
+
+    Returns:
+        (masks do tamanho do recorte, scores, veio_do_cache) - use paste_mask() só na escolhida
+    """
+    x0, y0, x1, y1 = roi
+    crop = image[y0:y1, x0:x1]
+    offset = np.array([x0, y0])
+
+    key = EmbeddingCache.make_key(array_digest(crop), model_id, variant="roi") if cache is not None else None
+    cached = set_image_cached(predictor, crop, cache, key)
+    if on_embedded is not None:
+        on_embedded()
+
+    kwargs = {"multimask_output": multimask_output}
+    if point_coords is not None:
+        kwargs["point_coords"] = np.asarray(point_coords) - offset
+        kwargs["point_labels"] = np.asarray(point_labels)
+    if box is not None:
+        kwargs["box"] = np.asarray(box) - np.concatenate([offset, offset])
+
+    masks, scores, _ = predictor.predict(**kwargs)
+    return masks, scores, cached
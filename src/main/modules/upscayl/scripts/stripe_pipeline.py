@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pós-processamento em faixas horizontais (modo streaming) para impressões muito grandes
+Uma gang sheet de 60x100 cm a 300 DPI tem ~7000x11800 px: 330 MB em RGBA uint8, e cada
+etapa do caminho normal (np.array, máscara, remoção de pretos, Image.fromarray, save) cria
+mais uma cópia inteira. Aqui a restauração da resolução, a máscara alpha, a remoção de
+pretos e a gravação acontecem faixa por faixa:
+    fonte (PIL / array / redimensionamento por faixa) -> transformação -> StripeFile (disco)
+    StripeFile -> codificador PNG por faixas (image_encode.encode_png_parallel)
+O resultado intermediário fica num arquivo temporário mapeado só uma faixa de cada vez,
+então o pico de memória do pós-processamento não cresce com o tamanho da imagem.
+
+Ativação: --stream na linha de comando, IMPRIME_STREAM=1 (sempre) / 0 (nunca); sem nada,
+liga sozinho a partir de STREAM_MIN_PIXELS. Temporários em IMPRIME_TEMP_DIR (ou o padrão do
+sistema). Redimensionar por faixa difere do redimensionamento inteiro em no máximo 1 nível
+em poucos pixels (arredondamento das coordenadas da faixa).
+"""
+
+import os
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+STREAM_FLAG = "--stream"
+STREAM_ENV = "IMPRIME_STREAM"
+TEMP_DIR_ENV = "IMPRIME_TEMP_DIR"
+# ~32 MP (ex.: 40x60 cm a 300 DPI): abaixo disso o caminho em memória é mais simples e rápido
+STREAM_MIN_PIXELS = 32_000_000
+STRIPE_BYTES = 16 * 1024 * 1024
+
+_requested = None
+
+
+def configure_streaming(argv):
+    """Lê --stream (removido de argv); sem a flag vale IMPRIME_STREAM ou o limite automático"""
+    global _requested
+    if STREAM_FLAG in argv:
+        _requested = True
+        while STREAM_FLAG in argv:
+            argv.remove(STREAM_FLAG)
+    return _requested
+
+
+def use_streaming(size):
+    """True se o pós-processamento de uma imagem (largura, altura) deve ir por faixas"""
+    if _requested is not None:
+        return _requested
+    env = os.environ.get(STREAM_ENV, "").lower()
+    if env in ("1", "true", "yes"):
+        return True
+    if env in ("0", "false", "no"):
+        return False
+    return size[0] * size[1] >= STREAM_MIN_PIXELS
+
+
+def stripe_bounds(height, row_bytes, stripe_bytes=STRIPE_BYTES):
+    """(início, fim) de cada faixa de ~stripe_bytes"""
+    rows = max(1, stripe_bytes // max(1, row_bytes))
+    for start in range(0, height, rows):
+        yield start, min(height, start + rows)
+
+
+class StripeFile:
+    """
+    Imagem uint8 HxWxC guardada num arquivo temporário bruto
+    Cada write_rows/read_rows mapeia só o trecho pedido (np.memmap com offset); o mapeamento
+    some junto com o array devolvido, então as páginas não se acumulam no RSS do processo.
+    """
+
+    MODES = {1: "L", 2: "LA", 3: "RGB", 4: "RGBA"}
+
+    def __init__(self, width, height, channels=4, directory=None):
+        self.width = int(width)
+        self.height = int(height)
+        self.channels = channels
+        self.mode = self.MODES[channels]
+        self.row_bytes = self.width * channels
+        directory = directory or os.environ.get(TEMP_DIR_ENV) or None
+        fd, self.path = tempfile.mkstemp(prefix="imprime_stripes_", suffix=".raw", dir=directory)
+        with os.fdopen(fd, "wb") as f:
+            f.truncate(self.row_bytes * self.height)
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    @property
+    def nbytes(self):
+        return self.row_bytes * self.height
+
+    def _map(self, start, stop, mode):
+        return np.memmap(self.path, dtype=np.uint8, mode=mode, offset=start * self.row_bytes,
+                         shape=(stop - start, self.width, self.channels))
+
+    def write_rows(self, start, rows):
+        target = self._map(start, start + rows.shape[0], "r+")
+        target[:] = rows.reshape(target.shape)
+        target.flush()
+        del target
+
+    def read_rows(self, start, stop):
+        """Linhas [start, stop) (somente leitura; não guardar além da faixa atual)"""
+        return self._map(start, stop, "r")
+
+    def stripes(self, stripe_bytes=STRIPE_BYTES):
+        return stripe_bounds(self.height, self.row_bytes, stripe_bytes)
+
+    def to_image(self):
+        """Imagem PIL inteira (só para formatos sem gravação por faixas: WebP, TIFF)"""
+        image = Image.new(self.mode, self.size)
+        for start, stop in self.stripes():
+            rows = np.array(self.read_rows(start, stop))
+            image.paste(Image.fromarray(rows[:, :, 0] if self.channels == 1 else rows, self.mode), (0, start))
+        return image
+
+    def close(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def resized_rows(image, size, resample=Image.Resampling.LANCZOS):
+    """
+    Fonte de linhas: `image` (pequena, ex. saída do modelo) ampliada para `size`, uma faixa por vez
+    Usa resize(box=...) do Pillow, que lê o suporte do filtro fora da faixa (sem emendas).
+    """
+    width, height = size
+    scale_y = image.height / height
+
+    def rows(start, stop):
+        box = (0, start * scale_y, image.width, stop * scale_y)
+        return np.array(image.resize((width, stop - start), resample, box=box))
+    return rows
+
+
+def image_rows(image):
+    """Fonte de linhas: recortes de uma imagem PIL ou array já na resolução final"""
+    if isinstance(image, np.ndarray):
+        return lambda start, stop: image[start:stop]
+    return lambda start, stop: np.asarray(image.crop((0, start, image.width, stop)))
+
+
+def remove_blacks_rows(rgba, threshold):
+    """Alpha 0 onde R, G e B <= threshold (in place na faixa RGBA)"""
+    is_black = (rgba[:, :, 0] <= threshold) & (rgba[:, :, 1] <= threshold) & (rgba[:, :, 2] <= threshold)
+    rgba[:, :, 3][is_black] = 0
+    return rgba
+
+
+def compose_stream(size, rgba_rows=None, rgb_rows=None, alpha_rows=None, black_threshold=None,
+                   stripe_bytes=STRIPE_BYTES, progress=None):
+    """
+    Monta o RGBA final faixa por faixa num StripeFile
+    rgba_rows: fonte RGBA completa (ex. resized_rows da saída do rembg), ou
+    rgb_rows + alpha_rows: cor e máscara (uint8 0-255 ou bool) em fontes separadas.
+    black_threshold: aplica remove_blacks_rows em cada faixa.
+    progress: callable(fração) chamado a cada faixa.
+    """
+    width, height = size
+    output = StripeFile(width, height, 4)
+    try:
+        bounds = list(output.stripes(stripe_bytes))
+        for index, (start, stop) in enumerate(bounds):
+            if rgba_rows is not None:
+                stripe = np.array(rgba_rows(start, stop), dtype=np.uint8)
+            else:
+                stripe = np.empty((stop - start, width, 4), dtype=np.uint8)
+                stripe[:, :, :3] = rgb_rows(start, stop)
+                alpha = alpha_rows(start, stop)
+                stripe[:, :, 3] = np.where(alpha, 255, 0) if alpha.dtype == bool else alpha
+            if black_threshold is not None:
+                remove_blacks_rows(stripe, black_threshold)
+            output.write_rows(start, stripe)
+            if progress:
+                progress((index + 1) / len(bounds))
+    except BaseException:
+        output.close()
+        raise
+    return output
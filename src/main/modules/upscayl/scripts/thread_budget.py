@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Orçamento de threads de CPU para torch, onnxruntime (rembg) e OpenCV
+Cada biblioteca, sozinha, usa todos os núcleos; com vários workers (requisições simultâneas nos
+servidores, vários scripts rodando ao mesmo tempo) a CPU fica super-assinada e tudo fica mais
+lento. O orçamento divide os núcleos: workers x threads_por_worker <= núcleos.
+
+Ordem de precedência:
+    --threads N (scripts) / argumentos explícitos
+    IMPRIME_THREADS (núcleos do orçamento), IMPRIME_INFERENCE_SLOTS (workers: inferências
+    simultâneas), IMPRIME_INTRA_THREADS
+    configuração salva pelo autotune (IMPRIME_THREAD_CONFIG ou thread_budget.json na pasta de
+    dados), se foi medida numa máquina com o mesmo número de núcleos
+    padrão: 1 worker com todos os núcleos
+
+apply() exporta OMP/MKL/OpenBLAS_NUM_THREADS (lidos pelo torch e pelas sessões ONNX Runtime do
+rembg) e ajusta na hora torch.set_num_threads e cv2.setNumThreads se já estiverem carregados
+(load_cv2=True carrega o OpenCV para ajustá-lo já, como nos servidores).
+
+Autotune: mede várias divisões nesta máquina, com `workers` processos simultâneos rodando a
+mesma carga (convoluções torch, sessão ONNX de um modelo do rembg ou filtros OpenCV), e salva
+a de maior vazão.
+    python thread_budget.py show
+    python thread_budget.py autotune [--workload torch|onnx|cv2] [--seconds 5] [--onnx-model arq.onnx]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from collections import namedtuple
+
+THREADS_FLAG = "--threads"
+CONFIG_ENV = "IMPRIME_THREAD_CONFIG"
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+ThreadBudget = namedtuple("ThreadBudget", "cores workers intra_threads source")
+
+
+def cpu_count():
+    """Núcleos utilizáveis por este processo (afinidade/cgroup no Linux)"""
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def config_path():
+    base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.environ.get(CONFIG_ENV) or os.path.join(base, "imprime-ai", "thread_budget.json")
+
+
+def load_config(path=None):
+    """Configuração salva pelo autotune (None se não existe ou é de outra máquina)"""
+    path = path or config_path()
+    try:
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if config.get("cores") != cpu_count():
+        return None
+    return config
+
+
+def _env_int(name):
+    try:
+        value = int(os.environ.get(name, "") or 0)
+    except ValueError:
+        return None
+    return value if value > 0 else None
+
+
+def plan(workers=None, intra_threads=None, cores=None):
+    """Divide os núcleos entre `workers` e as threads internas de cada um (ver precedência acima)"""
+    config = load_config()
+    source = "padrão"
+    cores = cores or _env_int("IMPRIME_THREADS") or cpu_count()
+    if workers is None:
+        workers = _env_int("IMPRIME_INFERENCE_SLOTS")
+    if intra_threads is None:
+        intra_threads = _env_int("IMPRIME_INTRA_THREADS")
+    if workers is not None or intra_threads is not None:
+        source = "explícito"
+    elif config is not None:
+        workers, intra_threads, source = config["workers"], config["intra_threads"], "autotune"
+    workers = max(1, min(workers or 1, cores))
+    intra_threads = max(1, intra_threads or cores // workers)
+    return ThreadBudget(cores, workers, intra_threads, source)
+
+
+def apply(budget, override_env=False, load_cv2=False):
+    """
+    Aplica as threads internas por worker: variáveis de ambiente (antes de importar torch /
+    criar sessões ONNX) e torch / cv2 já carregados. Variáveis definidas pelo usuário são
+    respeitadas, a menos que override_env.
+    """
+    for name in THREAD_ENV_VARS:
+        if override_env:
+            os.environ[name] = str(budget.intra_threads)
+        else:
+            os.environ.setdefault(name, str(budget.intra_threads))
+    intra = int(os.environ["OMP_NUM_THREADS"])
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(intra)
+    cv2 = sys.modules.get("cv2")
+    if cv2 is None and load_cv2:
+        try:
+            import cv2
+        except ImportError:
+            cv2 = None
+    if cv2 is not None:
+        cv2.setNumThreads(intra)
+    return intra
+
+
+def session_options(budget=None):
+    """onnxruntime.SessionOptions com o orçamento (sessões criadas fora do rembg)"""
+    import onnxruntime as ort
+    budget = budget or plan()
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = budget.intra_threads
+    options.inter_op_num_threads = 1
+    return options
+
+
+def configure_threads(argv):
+    """
+    Scripts de linha de comando: lê --threads N (removido de argv) e aplica o orçamento
+    Um script é um worker; sem --threads vale a configuração salva / IMPRIME_* / todos os núcleos.
+    """
+    intra = None
+    for index, arg in enumerate(list(argv)):
+        if arg == THREADS_FLAG and index + 1 < len(argv):
+            intra = argv[index + 1]
+            del argv[index:index + 2]
+            break
+        if arg.startswith(THREADS_FLAG + "="):
+            intra = arg.split("=", 1)[1]
+            del argv[index]
+            break
+    try:
+        budget = plan(intra_threads=int(intra)) if intra is not None else plan()
+    except ValueError:
+        print(f"ERROR:Valor inválido para {THREADS_FLAG}: {intra}", file=sys.stderr, flush=True)
+        sys.exit(1)
+    apply(budget, override_env=intra is not None)
+    return budget
+
+
+# Autotune
+
+def _workload(name, onnx_model=None):
+    """Função que processa um item da carga (sem argumentos)"""
+    import numpy as np
+    rng = np.random.default_rng(0)
+    if name == "torch":
+        import torch
+        layers = torch.nn.Sequential(
+            torch.nn.Conv2d(3, 32, 3, padding=1), torch.nn.ReLU(),
+            torch.nn.Conv2d(32, 32, 3, padding=1), torch.nn.ReLU(),
+            torch.nn.Conv2d(32, 1, 3, padding=1),
+        ).eval()
+        batch = torch.from_numpy(rng.random((1, 3, 512, 512), dtype=np.float32))
+
+        def run():
+            with torch.no_grad():
+                layers(batch)
+        return run
+    if name == "onnx":
+        import onnxruntime as ort
+        session = ort.InferenceSession(onnx_model, session_options(), providers=["CPUExecutionProvider"])
+        feed = session.get_inputs()[0]
+        shape = [dim if isinstance(dim, int) else 1 for dim in feed.shape]
+        data = {feed.name: rng.random(shape, dtype=np.float32)}
+        return lambda: session.run(None, data)
+    if name == "cv2":
+        import cv2
+        image = (rng.random((2048, 2048, 3)) * 255).astype(np.uint8)
+
+        def run():
+            blurred = cv2.GaussianBlur(image, (21, 21), 0)
+            cv2.resize(blurred, (4096, 4096), interpolation=cv2.INTER_LANCZOS4)
+        return run
+    raise ValueError(f"Carga desconhecida: {name}")
+
+
+def _work(args):
+    """Processo filho do autotune: roda a carga por `seconds` e imprime itens e latência média"""
+    apply(ThreadBudget(cpu_count(), 1, args.intra, "autotune"), override_env=True)
+    run = _workload(args.workload, args.onnx_model)
+    run()  # aquecimento (alocador, seleção de kernels)
+    count, busy = 0, 0.0
+    deadline = time.perf_counter() + args.seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        run()
+        busy += time.perf_counter() - start
+        count += 1
+    print(json.dumps({"items": count, "busy_s": busy}))
+
+
+def candidate_splits(cores):
+    """(workers, threads) com workers x threads = núcleos, mais uma divisão super-assinada de referência"""
+    splits, workers = [], 1
+    while workers <= cores:
+        splits.append((workers, max(1, cores // workers)))
+        workers *= 2
+    if splits[-1][0] != cores:
+        splits.append((cores, 1))
+    # O que acontece sem orçamento: vários workers, cada um com todos os núcleos
+    splits.append((max(2, splits[-1][0]), cores))
+    return splits
+
+
+def measure(workers, intra, workload, seconds, onnx_model=None):
+    """Vazão (itens/s) e latência média (ms) de `workers` processos simultâneos"""
+    command = [sys.executable, os.path.abspath(__file__), "_work", "--workload", workload,
+               "--intra", str(intra), "--seconds", str(seconds)]
+    if onnx_model:
+        command += ["--onnx-model", onnx_model]
+    start = time.perf_counter()
+    processes = [subprocess.Popen(command, stdout=subprocess.PIPE, text=True) for _ in range(workers)]
+    results = []
+    for process in processes:
+        output, _ = process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"worker do autotune falhou (código {process.returncode})")
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    wall = time.perf_counter() - start
+    items = sum(r["items"] for r in results)
+    busy = sum(r["busy_s"] for r in results)
+    return {
+        "workers": workers,
+        "intra_threads": intra,
+        "oversubscribed": workers * intra > cpu_count(),
+        "items_per_s": round(items / max(1e-9, busy / workers), 3),
+        "latency_ms": round(1000 * busy / max(1, items), 1),
+        "wall_s": round(wall, 2),
+    }
+
+
+def default_onnx_model():
+    """Modelo do rembg já baixado (~/.u2net), se houver"""
+    directory = os.environ.get("U2NET_HOME") or os.path.join(os.path.expanduser("~"), ".u2net")
+    for name in ("isnet-general-use.onnx", "u2net.onnx"):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def autotune(workload, seconds, onnx_model=None, out_path=None):
+    cores = cpu_count()
+    print(f"Autotune: {cores} núcleos, carga '{workload}', {seconds:g}s por divisão")
+    print(f"{'workers':>8}{'threads':>9}{'itens/s':>10}{'lat. ms':>10}")
+    results = []
+    for workers, intra in candidate_splits(cores):
+        result = measure(workers, intra, workload, seconds, onnx_model)
+        results.append(result)
+        note = "  (super-assinado)" if result["oversubscribed"] else ""
+        print(f"{workers:>8}{intra:>9}{result['items_per_s']:>10.2f}{result['latency_ms']:>10.1f}{note}")
+    # Maior vazão sem super-assinar; empate (5%) decide pela menor latência
+    valid = [r for r in results if not r["oversubscribed"]]
+    top = max(r["items_per_s"] for r in valid)
+    best = min((r for r in valid if r["items_per_s"] >= 0.95 * top), key=lambda r: r["latency_ms"])
+    config = {
+        "cores": cores,
+        "workers": best["workers"],
+        "intra_threads": best["intra_threads"],
+        "workload": workload,
+        "measured_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    out_path = out_path or config_path()
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+    print(f"Melhor: {best['workers']} worker(s) x {best['intra_threads']} thread(s); salvo em {out_path}")
+    return config
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="thread_budget.py", description="Orçamento de threads de CPU")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("show", help="Orçamento efetivo nesta máquina")
+    tune = commands.add_parser("autotune", help="Mede divisões workers x threads e salva a melhor")
+    tune.add_argument("--workload", choices=("torch", "onnx", "cv2"), default=None,
+                      help="padrão: onnx se houver modelo do rembg, senão torch, senão cv2")
+    tune.add_argument("--seconds", type=float, default=5.0)
+    tune.add_argument("--onnx-model", default=None)
+    tune.add_argument("--out", default=None)
+    work = commands.add_parser("_work")
+    work.add_argument("--workload", required=True)
+    work.add_argument("--intra", type=int, required=True)
+    work.add_argument("--seconds", type=float, required=True)
+    work.add_argument("--onnx-model", default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "_work":
+        _work(args)
+        return 0
+    if args.command == "show":
+        budget = plan()
+        print(json.dumps({**budget._asdict(), "config": config_path()}, ensure_ascii=False))
+        return 0
+
+    from importlib.util import find_spec
+    onnx_model = args.onnx_model or default_onnx_model()
+    workload = args.workload
+    if workload is None:
+        if onnx_model and find_spec("onnxruntime"):
+            workload = "onnx"
+        else:
+            workload = "torch" if find_spec("torch") else "cv2"
+    if workload == "onnx" and not onnx_model:
+        parser.error("--workload onnx precisa de --onnx-model (ou de um modelo do rembg em ~/.u2net)")
+    autotune(workload, args.seconds, onnx_model, args.out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
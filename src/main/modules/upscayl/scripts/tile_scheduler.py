@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Upscaling de imagens enormes em blocos, com vários upscayl-bin em paralelo
+O upscayl-handler.ts roda um upscayl-bin por imagem inteira: numa gang sheet grande isso é um
+processo só (um núcleo / uma fila de GPU ocupada) e a saída inteira na memória dele. Aqui:
+    1. a imagem é dividida em blocos de até --tile px com --overlap px de margem em cada lado
+    2. blocos totalmente transparentes (alpha 0 no recorte com margem) não vão para o binário
+    3. os demais rodam em até --jobs processos upscayl-bin simultâneos; cada bloco reserva a
+       memória estimada (processo + entrada + saída) de um orçamento (--memory-mb), então
+       blocos grandes esperam em vez de estourar a RAM
+    4. as saídas são costuradas faixa por faixa num StripeFile (stripe_pipeline): nas margens
+       os blocos vizinhos se misturam com rampas lineares (pesos somam 1), sem emendas visíveis
+Só a faixa atual e os blocos ainda não costurados (em disco, IMPRIME_TEMP_DIR) existem além
+da entrada; a gravação PNG também é por faixas (image_encode.save_image). Cada processo recebe
+núcleos / jobs threads (thread_budget; vale para o caminho de CPU do ncnn).
+
+Binário: --bin, IMPRIME_UPSCAYL_BIN ou upscayl-bin/bin/upscayl-bin(.exe) na pasta atual, como
+no handler; modelos em upscayl-bin/models. Um .py é rodado com o Python atual
+(benchmarks/stub_upscayl.py: redimensionamento simples, para testar sem GPU nem modelos).
+
+Uso:
+    python tile_scheduler.py <input> <output> -n <modelo> [-s 4] [-m pasta_modelos] [--bin caminho]
+                             [--tile 1024] [--overlap 32] [--jobs N] [--memory-mb 2048]
+                             [--output-profile nome] [-- argumentos extras do upscayl-bin]
+"""
+
+import os
+import sys
+import math
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from cli_events import events, progress, file_size, image_nbytes
+from image_encode import configure_output, output_path_for, save_image
+from remover_cli import describe_input
+from stripe_pipeline import StripeFile, TEMP_DIR_ENV, stripe_bounds, STRIPE_BYTES
+import thread_budget
+
+BIN_ENV = "IMPRIME_UPSCAYL_BIN"
+MEMORY_ENV = "IMPRIME_TILE_MEMORY_MB"
+PROCESS_ENV = "IMPRIME_UPSCAYL_PROCESS_MB"
+# Cada bloco é um processo que carrega o modelo de novo: blocos grandes diluem esse custo
+DEFAULT_TILE = 1024
+DEFAULT_OVERLAP = 32
+DEFAULT_MEMORY_MB = 2048
+# Memória de um upscayl-bin além dos buffers do bloco (runtime ncnn/Vulkan + pesos do modelo)
+DEFAULT_PROCESS_MB = 300
+MB = 1024 * 1024
+
+Tile = namedtuple("Tile", "index row col box")  # box: recorte com margem (x0, y0, x1, y1) na entrada
+
+
+def default_bin():
+    name = "upscayl-bin.exe" if sys.platform == "win32" else "upscayl-bin"
+    return os.environ.get(BIN_ENV) or os.path.join(os.getcwd(), "upscayl-bin", "bin", name)
+
+
+def axis_cuts(length, tile):
+    """Cortes de um eixo em partes iguais de até `tile` px: [0, ..., length]"""
+    count = max(1, math.ceil(length / tile))
+    return [round(i * length / count) for i in range(count + 1)]
+
+
+def plan_tiles(width, height, tile=DEFAULT_TILE, overlap=DEFAULT_OVERLAP):
+    """(cortes em x, cortes em y, blocos em ordem de linhas)"""
+    xs, ys = axis_cuts(width, tile), axis_cuts(height, tile)
+    tiles = []
+    for row in range(len(ys) - 1):
+        for col in range(len(xs) - 1):
+            box = (max(0, xs[col] - overlap), max(0, ys[row] - overlap),
+                   min(width, xs[col + 1] + overlap), min(height, ys[row + 1] + overlap))
+            tiles.append(Tile(len(tiles), row, col, box))
+    return xs, ys, tiles
+
+
+def axis_weights(cuts, index, start, stop, overlap, scale):
+    """
+    Peso 1D da parte `index` nos pixels de saída do seu recorte [start, stop) (coordenadas da
+    entrada): rampa linear de 0 a 1 em [corte - overlap, corte + overlap] em cada lado com vizinho.
+    As rampas de dois vizinhos são complementares, então os pesos somam 1 em toda a imagem.
+    """
+    centers = (np.arange(start * scale, stop * scale, dtype=np.float32) + 0.5) / scale
+    weights = np.ones_like(centers)
+    if overlap:
+        if index > 0:
+            weights *= np.clip((centers - (cuts[index] - overlap)) / (2 * overlap), 0, 1)
+        if index < len(cuts) - 2:
+            weights *= np.clip((cuts[index + 1] + overlap - centers) / (2 * overlap), 0, 1)
+    return weights
+
+
+def is_transparent(alpha, box):
+    """Recorte sem nenhum pixel visível (alpha: canal A da entrada, ou None se não há alpha)"""
+    return alpha is not None and alpha.crop(box).getextrema()[1] == 0
+
+
+class MemoryBudget:
+    """Semáforo em bytes: cada bloco reserva a memória estimada antes de iniciar o processo"""
+
+    def __init__(self, total):
+        self.total = int(total)
+        self.available = self.total
+        self._condition = threading.Condition()
+
+    def acquire(self, nbytes):
+        # Um bloco maior que o orçamento inteiro roda sozinho em vez de nunca rodar
+        nbytes = min(int(nbytes), self.total)
+        with self._condition:
+            self._condition.wait_for(lambda: self.available >= nbytes)
+            self.available -= nbytes
+        return nbytes
+
+    def release(self, nbytes):
+        with self._condition:
+            self.available += nbytes
+            self._condition.notify_all()
+
+
+def tile_cost(box, channels, scale, process_bytes):
+    """Memória estimada de um bloco em andamento: processo + recorte + saída (binário e decodificada)"""
+    pixels = (box[2] - box[0]) * (box[3] - box[1])
+    return process_bytes + pixels * channels * (2 + 2 * scale * scale)
+
+
+class TileRunner:
+    """Roda um bloco no upscayl-bin e deixa a saída em disco como .npy (lida por memmap na costura)"""
+
+    def __init__(self, image, bin_path, model, scale, models_path, extra_args, workdir, budget, process_bytes):
+        self.image = image
+        self.bin_path = bin_path
+        self.scale = scale
+        self.workdir = workdir
+        self.budget = budget
+        self.process_bytes = process_bytes
+        prefix = [sys.executable, bin_path] if bin_path.endswith(".py") else [bin_path]
+        self.command = prefix, ["-n", model, "-s", str(scale), "-m", models_path, "-f", "png"] + extra_args
+
+    def __call__(self, tile):
+        channels = len(self.image.mode)
+        reserved = self.budget.acquire(tile_cost(tile.box, channels, self.scale, self.process_bytes))
+        try:
+            in_path = os.path.join(self.workdir, f"tile_{tile.index}_in.png")
+            out_path = os.path.join(self.workdir, f"tile_{tile.index}_out.png")
+            self.image.crop(tile.box).save(in_path, "PNG", compress_level=1)
+            prefix, options = self.command
+            result = subprocess.run(prefix + ["-i", in_path, "-o", out_path] + options,
+                                    cwd=os.path.dirname(os.path.abspath(self.bin_path)),
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors="replace")
+            os.remove(in_path)
+            if result.returncode != 0 or not os.path.exists(out_path):
+                detail = (result.stderr or "").strip().splitlines()[-1:] or [f"código {result.returncode}"]
+                raise Exception(f"ERROR:upscayl-bin falhou no bloco {tile.index} {tile.box}: {detail[0]}")
+            with Image.open(out_path) as output:
+                expected = ((tile.box[2] - tile.box[0]) * self.scale, (tile.box[3] - tile.box[1]) * self.scale)
+                if output.size != expected:
+                    raise Exception(f"ERROR:Saída do upscayl-bin com {output.size[0]}x{output.size[1]} px no bloco "
+                                    f"{tile.index}, esperado {expected[0]}x{expected[1]} (escala do modelo != -s?)")
+                pixels = np.asarray(output.convert(self.image.mode))
+            os.remove(out_path)
+            raw_path = os.path.join(self.workdir, f"tile_{tile.index}.npy")
+            np.save(raw_path, pixels)
+            return raw_path
+        finally:
+            self.budget.release(reserved)
+
+
+def stitch(size, channels, scale, xs, ys, tiles, results, overlap, on_stripe=None):
+    """
+    Costura as saídas num StripeFile, faixa por faixa: soma ponderada dos blocos que cobrem a
+    faixa dividida pela soma dos pesos (blocos pulados não entram; sem nenhum, fica transparente).
+    results: índice -> Future do .npy do bloco (ausente = bloco transparente pulado)
+    """
+    width, height = size
+    weights_x = [axis_weights(xs, col, max(0, xs[col] - overlap), min(xs[-1], xs[col + 1] + overlap), overlap, scale)
+                 for col in range(len(xs) - 1)]
+    weights_y = [axis_weights(ys, row, max(0, ys[row] - overlap), min(ys[-1], ys[row + 1] + overlap), overlap, scale)
+                 for row in range(len(ys) - 1)]
+    pending = list(tiles)
+    output = StripeFile(width, height, channels)
+    try:
+        # Acumulador float32 (cor + peso) do tamanho de uma faixa normal de saída
+        bounds = list(stripe_bounds(height, width * (channels + 1) * 4, STRIPE_BYTES))
+        for number, (start, stop) in enumerate(bounds):
+            total = np.zeros((stop - start, width, channels), dtype=np.float32)
+            weight = np.zeros((stop - start, width), dtype=np.float32)
+            for tile in pending:
+                x0, y0, x1, y1 = (value * scale for value in tile.box)
+                if y0 >= stop or y1 <= start or tile.index not in results:
+                    continue
+                top, bottom = max(start, y0), min(stop, y1)
+                pixels = np.load(results[tile.index].result(), mmap_mode="r")[top - y0:bottom - y0]
+                w = weights_y[tile.row][top - y0:bottom - y0, None] * weights_x[tile.col][None, :]
+                total[top - start:bottom - start, x0:x1] += pixels * w[:, :, None]
+                weight[top - start:bottom - start, x0:x1] += w
+                del pixels
+            done = [tile for tile in pending if tile.box[3] * scale <= stop]
+            for tile in done:
+                if tile.index in results:
+                    os.remove(results[tile.index].result())
+            pending = [tile for tile in pending if tile.box[3] * scale > stop]
+            np.divide(total, weight[:, :, None], out=total, where=weight[:, :, None] > 0)
+            output.write_rows(start, np.clip(total + 0.5, 0, 255).astype(np.uint8))
+            if on_stripe:
+                on_stripe((number + 1) / len(bounds))
+    except BaseException:
+        output.close()
+        raise
+    return output
+
+
+def upscale_tiled(input_path, output_path, model, scale=4, models_path=None, bin_path=None, tile=DEFAULT_TILE,
+                  overlap=DEFAULT_OVERLAP, jobs=None, memory_mb=None, extra_args=()):
+    """Upscaling de input_path em blocos; grava output_path no perfil de saída selecionado"""
+    bin_path = bin_path or default_bin()
+    models_path = models_path or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(bin_path))), "models")
+    if not os.path.exists(bin_path):
+        raise Exception(f"ERROR:Binário não encontrado: {bin_path}")
+    # Blocos de pelo menos 4x a margem: as rampas de um bloco nunca se cruzam
+    overlap = max(0, min(overlap, tile // 4))
+    memory_mb = memory_mb or float(os.environ.get(MEMORY_ENV) or DEFAULT_MEMORY_MB)
+    process_bytes = int(float(os.environ.get(PROCESS_ENV) or DEFAULT_PROCESS_MB) * MB)
+
+    progress('load', 5, "Carregando imagem...", nbytes=file_size(input_path))
+    describe_input(input_path)
+    image = Image.open(input_path)
+    dpi = image.info.get("dpi")
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    image.load()
+    channels = len(image.mode)
+
+    xs, ys, tiles = plan_tiles(image.width, image.height, tile, overlap)
+    alpha = image.getchannel("A") if has_alpha else None
+    work = [t for t in tiles if not is_transparent(alpha, t.box)]
+    del alpha
+
+    # Processos simultâneos: pedido (ou núcleos), limitado pelo orçamento de memória e pelos blocos
+    budget = MemoryBudget(max(memory_mb * MB - image_nbytes(image), 0) or process_bytes)
+    full_tile = tile_cost((0, 0, min(image.width, tile + 2 * overlap), min(image.height, tile + 2 * overlap)),
+                          channels, scale, process_bytes)
+    jobs = max(1, min(jobs or thread_budget.cpu_count(), budget.total // full_tile or 1, len(work) or 1))
+    threads = thread_budget.plan(workers=jobs)
+    thread_budget.apply(threads)
+    print(f"[Debug] Blocos: {len(xs) - 1}x{len(ys) - 1} de até {tile}px (margem {overlap}px), "
+          f"{len(tiles) - len(work)} transparentes pulados; {jobs} processo(s) de {threads.intra_threads} thread(s), "
+          f"orçamento {budget.total / MB:.0f}MB (~{full_tile / MB:.0f}MB por bloco)", file=sys.stderr, flush=True)
+
+    out_size = (image.width * scale, image.height * scale)
+    progress('upscale', 10, f"Ampliando {len(work)} bloco(s) em {jobs} processo(s)...", nbytes=image_nbytes(image))
+    with tempfile.TemporaryDirectory(prefix="imprime_tiles_", dir=os.environ.get(TEMP_DIR_ENV) or None) as workdir:
+        workdir = os.path.abspath(workdir)
+        runner = TileRunner(image, bin_path, model, scale, models_path, list(extra_args), workdir, budget,
+                            process_bytes)
+        executor = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="upscayl")
+        try:
+            results = {t.index: executor.submit(runner, t) for t in work}
+
+            reported = [0]
+
+            def on_stripe(fraction):
+                # PROGRESS: a cada ~10% da costura (são centenas de faixas numa imagem grande)
+                if int(fraction * 10) > reported[0]:
+                    reported[0] = int(fraction * 10)
+                    done = sum(future.done() for future in results.values())
+                    progress('upscale', 10 + int(80 * fraction), f"Costurando... {done}/{len(results)} blocos prontos")
+
+            stitched = stitch(out_size, channels, scale, xs, ys, tiles, results, overlap, on_stripe)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    try:
+        progress('save', 92, "Salvando resultado...", nbytes=stitched.nbytes)
+        save_image(stitched, output_path, dpi=tuple(value * scale for value in dpi) if dpi else None)
+    finally:
+        stitched.close()
+    return output_path
+
+
+def main(argv):
+    events.configure('tile_scheduler', argv)
+    configure_output(argv)
+    extra_args = []
+    if "--" in argv:
+        index = argv.index("--")
+        argv, extra_args = argv[:index], argv[index + 1:]
+    parser = argparse.ArgumentParser(prog="tile_scheduler.py", add_help=False)
+    parser.add_argument("input_path")
+    parser.add_argument("output_path")
+    parser.add_argument("-n", "--model", required=True)
+    parser.add_argument("-s", "--scale", type=int, default=4)
+    parser.add_argument("-m", "--models", default=None)
+    parser.add_argument("--bin", default=None)
+    parser.add_argument("--tile", type=int, default=DEFAULT_TILE)
+    parser.add_argument("--overlap", type=int, default=DEFAULT_OVERLAP)
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--memory-mb", type=float, default=None)
+    try:
+        args = parser.parse_args(argv[1:])
+    except SystemExit:
+        print("ERROR:Uso: python tile_scheduler.py <input_path> <output_path> -n <modelo> [-s 4] [-m pasta_modelos] "
+              "[--bin caminho] [--tile 1024] [--overlap 32] [--jobs N] [--memory-mb N] [--output-profile nome] "
+              "[-- argumentos do upscayl-bin]", file=sys.stderr, flush=True)
+        return 1
+    output_path = output_path_for(args.output_path)
+    try:
+        if args.scale < 1 or args.tile < 16:
+            raise Exception("ERROR:Escala deve ser >= 1 e --tile >= 16")
+        upscale_tiled(args.input_path, output_path, args.model, args.scale, args.models, args.bin, args.tile,
+                      args.overlap, args.jobs, args.memory_mb, extra_args)
+        events.finish('ok', output=output_path, input_path=args.input_path)
+        print(f"SUCCESS:{output_path}", flush=True)
+        return 0
+    except Exception as e:
+        message = str(e) if str(e).startswith("ERROR:") else f"ERROR:Erro no upscaling em blocos: {e}"
+        events.finish('error', error=message, input_path=args.input_path)
+        print(message, file=sys.stderr, flush=True)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
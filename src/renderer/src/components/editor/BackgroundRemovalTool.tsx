@@ -183,7 +183,7 @@ const BackgroundRemovalTool: React.FC<BackgroundRemovalToolProps> = ({
         setCorrectedImage(null);
 
         try {
-            const response = await fetch('http://localhost:8002/remove', {
+            const response = await fetch('http://127.0.0.1:8000/remove', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
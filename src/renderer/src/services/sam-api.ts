@@ -5,7 +5,7 @@
 
 import axios, { AxiosInstance, AxiosError } from 'axios';
 
-const API_BASE_URL = 'http://localhost:8000';
+const API_BASE_URL = 'http://127.0.0.1:8000';
 
 interface Point {
     x: number;
@@ -36,6 +36,19 @@ interface ApplyMaskResponse {
     result_image: string; // base64 encoded PNG (RGBA)
 }
 
+interface ProbeResponse {
+    success: boolean;
+    format: string;
+    width: number;
+    height: number;
+    mode: string;
+    bit_depth: number;
+    dpi: [number, number] | null;
+    has_icc: boolean;
+    has_alpha: boolean;
+    probe_us: number;
+}
+
 interface HealthResponse {
     status: string;
     sam_loaded: boolean;
@@ -56,9 +69,28 @@ class SAMAPIClient {
             },
         });
 
+        // Memory profiling (debug only): localStorage.setItem('imprime.debugMemory', '1')
+        this.api.interceptors.request.use((config) => {
+            if (typeof localStorage !== 'undefined' && localStorage.getItem('imprime.debugMemory') === '1') {
+                config.headers['X-Debug-Memory'] = '1';
+            }
+            return config;
+        });
+
         // Response interceptor for error handling
         this.api.interceptors.response.use(
-            (response) => response,
+            (response) => {
+                // Per-stage backend timings (decode, embed, decode-mask, encode, ...)
+                const serverTiming = response.headers['server-timing'];
+                if (serverTiming) {
+                    console.debug(`[SAM API] ${response.config.url} Server-Timing: ${serverTiming}`);
+                }
+                const memoryProfile = response.headers['x-memory-profile'];
+                if (memoryProfile) {
+                    console.debug(`[SAM API] ${response.config.url} X-Memory-Profile: ${memoryProfile}`);
+                }
+                return response;
+            },
             async (error: AxiosError) => {
                 const config = error.config;
                 if (!config) return Promise.reject(error);
@@ -167,6 +199,22 @@ class SAMAPIClient {
         }
     }
 
+    /**
+     * Read image info from the header only (size, mode, bit depth, DPI, ICC, alpha)
+     * @param imageBase64 - Base64 encoded image (only the header bytes are decoded)
+     */
+    async probeImage(imageBase64: string): Promise<ProbeResponse> {
+        try {
+            const response = await this.api.post<ProbeResponse>('/api/probe', {
+                image_base64: imageBase64,
+            });
+
+            return response.data;
+        } catch (error) {
+            throw new Error(`Image probe failed: ${this.getErrorMessage(error)}`);
+        }
+    }
+
     /**
      * Convert File/Blob to base64
      */
@@ -242,4 +290,4 @@ const samAPI = new SAMAPIClient();
 export default samAPI;
 
 // Export types
-export type { Point, Box, SegmentResponse, RefineMaskResponse, ApplyMaskResponse, HealthResponse };
+export type { Point, Box, SegmentResponse, RefineMaskResponse, ApplyMaskResponse, ProbeResponse, HealthResponse };